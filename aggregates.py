@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Materialized month x category x type totals for the transaction ledger.
+
+The cube is updated in O(1) whenever a transaction is appended, so
+charts and insights read pre-summed totals instead of re-grouping the whole
+history on every rerun. All totals are kept in integer cents; expenses are
+negative, exactly as they are stored in the ledger.
+
+DailyTotals keeps the same sums per day instead of per month, with prefix
+sums over the days, for totals over arbitrary date ranges.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def month_key(date):
+    """Return the month of a datetime64 value as a 'YYYY-MM' string."""
+    return str(np.datetime64(date, "M"))
+
+
+class AggregateCube:
+    """Running sums and counts per (month, category, type) plus their marginals."""
+
+    def __init__(self):
+        self.cells = {}
+        self.by_month_type = {}
+        self.by_category_type = {}
+        self.by_type = {}
+
+    @staticmethod
+    def _update(table, key, cents, count):
+        total, n = table.get(key, (0, 0))
+        total += cents
+        n += count
+        if n:
+            table[key] = (total, n)
+        else:
+            table.pop(key, None)
+
+    def _apply(self, month, category, tx_type, cents, count):
+        self._update(self.cells, (month, category, tx_type), cents, count)
+        self._update(self.by_month_type, (month, tx_type), cents, count)
+        self._update(self.by_category_type, (category, tx_type), cents, count)
+        self._update(self.by_type, tx_type, cents, count)
+
+    def add(self, month, category, tx_type, cents):
+        self._apply(month, category, tx_type, cents, 1)
+
+    def type_total(self, tx_type):
+        """Return the signed total of a transaction type in euros."""
+        return self.by_type.get(tx_type, (0, 0))[0] / 100
+
+    def type_count(self, tx_type):
+        return self.by_type.get(tx_type, (0, 0))[1]
+
+    def category_totals(self, tx_type="expense"):
+        """Return {category: absolute total in euros} for one transaction type."""
+        return {
+            category: abs(total) / 100
+            for (category, kind), (total, _) in self.by_category_type.items()
+            if kind == tx_type
+        }
+
+    def category_frame(self, tx_type="expense"):
+        """Return a category/amount frame sorted by amount, largest first."""
+        totals = self.category_totals(tx_type)
+        frame = pd.DataFrame({"category": list(totals.keys()), "amount": list(totals.values())})
+        return frame.sort_values("amount", ascending=False, ignore_index=True)
+
+    def monthly_totals(self, tx_type="expense"):
+        """Return a Series of absolute monthly totals for one type, indexed by month."""
+        totals = {
+            month: abs(total) / 100
+            for (month, kind), (total, _) in self.by_month_type.items()
+            if kind == tx_type
+        }
+        return pd.Series(totals, dtype=float).sort_index()
+
+    def monthly_fingerprint(self, tx_type="expense"):
+        """Return a hashable snapshot of the monthly cent totals per category for one type.
+
+        It changes only when a month or category is added or one of their
+        totals moves, so it can key caches of anything derived from the
+        monthly series, including the per-category ones. A move between
+        categories that leaves the month's total unchanged changes it too.
+        """
+        return tuple(sorted(
+            (month, category, total)
+            for (month, category, kind), (total, _) in self.cells.items()
+            if kind == tx_type
+        ))
+
+    def monthly_flow(self):
+        """Return signed income and expense totals per month, one row per month."""
+        months = sorted({month for month, _ in self.by_month_type})
+        return pd.DataFrame({
+            "month": months,
+            "income": [self.by_month_type.get((m, "income"), (0, 0))[0] / 100 for m in months],
+            "expense": [self.by_month_type.get((m, "expense"), (0, 0))[0] / 100 for m in months],
+        })
+
+    def monthly_category_frame(self, tx_type="expense"):
+        """Return month/category/amount rows of absolute totals for one type."""
+        rows = [
+            (month, category, abs(total) / 100)
+            for (month, category, kind), (total, _) in self.cells.items()
+            if kind == tx_type
+        ]
+        frame = pd.DataFrame(rows, columns=["month", "category", "amount"])
+        return frame.sort_values(["month", "category"], ignore_index=True)
+
+
+def day_number(date):
+    """Return the days since 1970-01-01 of a date, datetime, datetime64 or ISO string."""
+    return int(pd.Timestamp(date).to_datetime64().astype("datetime64[D]").astype(np.int64))
+
+
+class DailyTotals:
+    """Per-day totals per (category, type) with prefix sums over the days.
+
+    Adding a transaction updates one cell of the daily matrix. The cumulative
+    sums along the days are rebuilt lazily, in one vectorized pass, the first
+    time a total is asked for after a write; from then on the total of any
+    date range is two lookups and a subtraction.
+    """
+
+    def __init__(self):
+        self.origin = None
+        self._keys = {}
+        self._daily = np.zeros((0, 0), dtype=np.int64)
+        self._cumulative = None
+        self._type_cumulative = {}
+
+    def _column(self, day):
+        """Return the column of a day number, growing the matrix to cover it."""
+        if self.origin is None:
+            self.origin = day
+        width = self._daily.shape[1]
+        # Grow geometrically, either way, so adding day after day stays amortized O(1)
+        if day < self.origin:
+            grow = max(self.origin - day, width)
+            self._daily = np.pad(self._daily, ((0, 0), (grow, 0)))
+            self.origin -= grow
+        elif day - self.origin >= width:
+            grow = max(day - self.origin + 1 - width, width)
+            self._daily = np.pad(self._daily, ((0, 0), (0, grow)))
+        return day - self.origin
+
+    def add(self, date, category, tx_type, cents):
+        key = (category, tx_type)
+        if key not in self._keys:
+            self._keys[key] = len(self._keys)
+            self._daily = np.pad(self._daily, ((0, 1), (0, 0)))
+        column = self._column(day_number(date))
+        self._daily[self._keys[key], column] += cents
+        self._cumulative = None
+
+    def _prefix_sums(self):
+        if self._cumulative is None:
+            # A leading zero column makes the total before the first day a lookup too
+            self._cumulative = np.zeros((self._daily.shape[0], self._daily.shape[1] + 1), dtype=np.int64)
+            np.cumsum(self._daily, axis=1, out=self._cumulative[:, 1:])
+            self._type_cumulative = {}
+            for (_, tx_type), row in self._keys.items():
+                totals = self._type_cumulative.get(tx_type)
+                if totals is None:
+                    self._type_cumulative[tx_type] = self._cumulative[row].copy()
+                else:
+                    totals += self._cumulative[row]
+        return self._cumulative
+
+    def _bounds(self, start, end):
+        """Return the prefix-sum positions just before start and at end, clipped to the stored days."""
+        width = self._daily.shape[1]
+        first = 0 if start is None else min(max(day_number(start) - self.origin, 0), width)
+        last = width if end is None else min(max(day_number(end) - self.origin + 1, 0), width)
+        return first, max(first, last)
+
+    def total_cents(self, tx_type, start=None, end=None, category=None):
+        """Return the signed total in cents of one type from start to end (inclusive), optionally for one category."""
+        if self.origin is None:
+            return 0
+        cumulative = self._prefix_sums()
+        if category is None:
+            sums = self._type_cumulative.get(tx_type)
+        else:
+            row = self._keys.get((category, tx_type))
+            sums = None if row is None else cumulative[row]
+        if sums is None:
+            return 0
+        first, last = self._bounds(start, end)
+        return int(sums[last] - sums[first])
+
+    def total(self, tx_type, start=None, end=None, category=None):
+        """Return the signed total in euros of one type from start to end (inclusive); open ends are unbounded."""
+        return self.total_cents(tx_type, start, end, category) / 100
+
+    def category_totals(self, tx_type="expense", start=None, end=None):
+        """Return {category: absolute total in euros} of one type from start to end, for non-zero totals."""
+        if self.origin is None:
+            return {}
+        cumulative = self._prefix_sums()
+        first, last = self._bounds(start, end)
+        keys = [(category, row) for (category, kind), row in self._keys.items() if kind == tx_type]
+        rows = np.array([row for _, row in keys], dtype=np.intp)
+        totals = cumulative[rows, last] - cumulative[rows, first]
+        return {category: abs(int(total)) / 100 for (category, _), total in zip(keys, totals) if total}
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Random allocation of deposits to savings products by risk preference.
+
+Each risk preference has a fixed probability table over ALLOCATION_OPTIONS.
+The tables are stacked into one cumulative matrix at import time, so
+allocating any number of deposits, each with its own risk preference, is a
+single vectorized inverse-CDF lookup. Passing a seeded np.random.Generator
+makes the decisions reproducible.
+"""
+
+import numpy as np
+
+ALLOCATION_OPTIONS = ["high-yield savings", "ETF", "crypto"]
+
+# Chance of each option per risk preference, in ALLOCATION_OPTIONS order
+ALLOCATION_PROBABILITIES = {
+    "conservative": [0.7, 0.3, 0.0],
+    "moderate": [0.5, 0.4, 0.1],
+    "aggressive": [0.3, 0.5, 0.2],
+}
+
+# Table used for an unknown risk preference
+DEFAULT_PROBABILITIES = [0.5, 0.5, 0.0]
+
+_PREFERENCES = list(ALLOCATION_PROBABILITIES)
+_CUMULATIVE = np.cumsum(list(ALLOCATION_PROBABILITIES.values()) + [DEFAULT_PROBABILITIES], axis=1)
+_DEFAULT_ROW = len(_PREFERENCES)
+
+_default_rng = np.random.default_rng()
+
+
+def preference_codes(risk_preferences):
+    """Map risk preference names to rows of the probability table."""
+    rows = {name: i for i, name in enumerate(_PREFERENCES)}
+    names, inverse = np.unique(np.asarray(risk_preferences, dtype=str), return_inverse=True)
+    return np.array([rows.get(name, _DEFAULT_ROW) for name in names], dtype=np.intp)[inverse]
+
+
+def determine_allocations(risk_preferences, size=None, rng=None):
+    """
+    Return the option index of every deposit, one draw each.
+
+    `risk_preferences` is one preference for `size` deposits, or a sequence
+    with the preference of each deposit. Options are indices into
+    ALLOCATION_OPTIONS. Pass a seeded np.random.Generator as `rng` for
+    reproducible decisions.
+    """
+    if isinstance(risk_preferences, str):
+        codes = np.full(1 if size is None else size, preference_codes([risk_preferences])[0])
+    else:
+        codes = preference_codes(risk_preferences)
+
+    rng = _default_rng if rng is None else rng
+    draws = rng.random(len(codes))
+    # The first option whose cumulative probability exceeds the draw
+    choices = (draws[:, None] >= _CUMULATIVE[codes]).sum(axis=1)
+    return np.minimum(choices, len(ALLOCATION_OPTIONS) - 1)
+
+
+def allocation_names(choices):
+    """Return the option names of an array of option indices."""
+    return np.asarray(ALLOCATION_OPTIONS)[choices]
+
+
+def allocation_totals(choices, amounts, groups=None, group_count=None):
+    """
+    Sum deposit amounts per option, or per group and option when each deposit
+    has a group index (e.g. a user). Returns an options-long vector or a
+    groups x options matrix.
+    """
+    amounts = np.asarray(amounts)
+    if groups is None:
+        return np.bincount(choices, weights=amounts, minlength=len(ALLOCATION_OPTIONS))
+
+    groups = np.asarray(groups, dtype=np.intp)
+    group_count = int(groups.max(initial=-1)) + 1 if group_count is None else group_count
+    cells = groups * len(ALLOCATION_OPTIONS) + choices
+    totals = np.bincount(cells, weights=amounts, minlength=group_count * len(ALLOCATION_OPTIONS))
+    return totals.reshape(group_count, len(ALLOCATION_OPTIONS))
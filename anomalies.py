@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Per-category detection of unusually large expenses.
+
+Each category keeps a sliding window of its most recent expense amounts in
+sorted order, from which the median and the median absolute deviation (MAD)
+are read. A new expense is scored against its category's window before it
+is added, using the robust z-score 0.6745 * (x - median) / MAD, and flagged
+when the score exceeds the threshold. The window has a fixed size, so each
+update costs the same however long the history is, and the flagged
+transactions are kept in a short list that can be read at any time. Like
+the recurring payment detector, it follows a TransactionLedger and only
+scores the expenses appended since its last sync.
+"""
+
+from bisect import bisect_left, insort
+from collections import deque
+
+import numpy as np
+
+from ledger import TYPES
+
+# Number of recent expenses per category used for the median and MAD
+ANOMALY_WINDOW = 100
+
+# Robust z-score above which an expense is flagged
+ANOMALY_THRESHOLD = 3.5
+
+# Expenses a category needs before any of its transactions can be flagged
+ANOMALY_MIN_HISTORY = 5
+
+# Number of flagged transactions remembered
+ANOMALY_KEEP = 50
+
+
+class RollingMedian:
+    """Median and MAD over the last `size` values."""
+
+    def __init__(self, size=ANOMALY_WINDOW):
+        self._order = deque(maxlen=size)
+        self._sorted = []
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def add(self, value):
+        if len(self._order) == self._order.maxlen:
+            oldest = self._order[0]
+            del self._sorted[bisect_left(self._sorted, oldest)]
+        self._order.append(value)
+        insort(self._sorted, value)
+
+    def median(self):
+        values = self._sorted
+        middle = len(values) // 2
+        if len(values) % 2:
+            return values[middle]
+        return (values[middle - 1] + values[middle]) / 2
+
+    def mad(self):
+        median = self.median()
+        deviations = sorted(abs(value - median) for value in self._sorted)
+        middle = len(deviations) // 2
+        if len(deviations) % 2:
+            return deviations[middle]
+        return (deviations[middle - 1] + deviations[middle]) / 2
+
+
+class AnomalyDetector:
+    """Flags expenses that are unusually large for their category.
+
+    Expenses can be scored one at a time with `observe`, or pulled from the
+    TransactionLedger given at construction with `sync`.
+    """
+
+    def __init__(self, ledger=None, window=ANOMALY_WINDOW, threshold=ANOMALY_THRESHOLD,
+                 min_history=ANOMALY_MIN_HISTORY, keep=ANOMALY_KEEP):
+        self.ledger = ledger
+        self.window = window
+        self.threshold = threshold
+        self.min_history = min_history
+        self.rows_seen = 0
+        self.generation = 0
+        self._categories = {}
+        self._anomalies = deque(maxlen=keep)
+
+    def score(self, category, amount):
+        """Return the robust z-score of an expense amount, or None without enough history."""
+        stats = self._categories.get(category)
+        if stats is None or len(stats) < self.min_history:
+            return None
+
+        median = stats.median()
+        # A floor on the MAD keeps categories with identical amounts from flagging every cent of change
+        mad = max(stats.mad(), 0.05 * median, 1)
+        return 0.6745 * (amount - median) / mad
+
+    def observe(self, transaction):
+        """Score an expense against its category, then add it to the category's window."""
+        amount_cents = round(abs(transaction["amount"]) * 100)
+        category = transaction["category"]
+
+        score = self.score(category, amount_cents)
+        if score is not None and score > self.threshold:
+            self._anomalies.append({**transaction, "score": round(score, 1)})
+
+        if category not in self._categories:
+            self._categories[category] = RollingMedian(self.window)
+        self._categories[category].add(amount_cents)
+
+    def reset(self):
+        self.rows_seen = 0
+        self._categories.clear()
+        self._anomalies.clear()
+
+    def sync(self):
+        """Score the expenses appended to the ledger since the last call."""
+        ledger = self.ledger
+        if self.generation != ledger.generation:
+            # The ledger was cleared; start over
+            self.reset()
+            self.generation = ledger.generation
+        if self.rows_seen == len(ledger):
+            return
+
+        start = self.rows_seen
+        rows = start + np.flatnonzero(ledger.column("type", start) == TYPES.index("expense"))
+        dates = ledger.values_at("date", rows).astype("datetime64[D]").astype(str).tolist()
+        categories = ledger.values_at("category", rows).tolist()
+        amounts = ledger.values_at("amount", rows).tolist()
+        descriptions = ledger.values_at("description", rows)
+        for date, code, cents, description in zip(dates, categories, amounts, descriptions):
+            if cents < 0:
+                self.observe({
+                    "date": date,
+                    "category": ledger.categories[code],
+                    "amount": cents / 100,
+                    "description": description
+                })
+        self.rows_seen = len(ledger)
+
+    def latest(self, count=None):
+        """Return the most recently flagged transactions, newest first."""
+        anomalies = list(reversed(self._anomalies))
+        return anomalies if count is None else anomalies[:count]
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""Structured questions for the AI assistant.
+
+A question is parsed into an intent, a metric ("spending", "income",
+"savings", "savings_rate" or "top_category"), an optional category and an
+optional period such as "yesterday", "the last 30 days", "last month" or
+"March 2024". The parsed query is a plain dictionary, so any combination of
+category, metric and period is answered by the same code, reading totals
+from the ledger's DailyTotals instead of filtering the transactions.
+"""
+
+import calendar
+import re
+from datetime import date, datetime, timedelta
+
+from ledger import CATEGORIES
+
+# Words naming a category in questions, besides the category name itself
+CATEGORY_SYNONYMS = {
+    "Groceries": ["grocery", "supermarket", "supermarkets"],
+    "Dining": ["dining out", "eating out", "restaurant", "restaurants", "takeaway", "food delivery"],
+    "Entertainment": ["movies", "cinema", "concerts", "streaming", "games"],
+    "Transport": ["transportation", "travel", "commute", "commuting", "fuel", "petrol", "taxi", "taxis"],
+    "Shopping": ["clothes", "clothing", "online shopping"],
+    "Utilities": ["bills", "electricity", "internet", "phone bill", "water bill"],
+}
+
+# Intents answered by the app itself rather than from the aggregates, checked first
+INTENT_PATTERNS = [
+    ("goals", r"\bgoals?\b"),
+    ("budget_tips", r"\bbudget(?:ing)?\b.*\b(?:improve|tips?|help|better|advice)\b|\b(?:improve|tips?|help|better|advice)\b.*\bbudget"),
+]
+
+# Metrics in the order they are tried; the first match wins
+METRIC_PATTERNS = [
+    ("savings_rate", r"\bsav(?:ings?|e|ing) rate\b"),
+    ("top_category", r"\b(?:biggest|largest|top|highest|main) (?:expense|spending|cost)|\bspend(?:ing)? the most\b|\bmost money\b"),
+    ("savings", r"\bsav(?:e|ed|ing|ings)\b"),
+    ("income", r"\b(?:earn|earned|earnings|income|made|make|salary)\b"),
+    ("spending", r"\b(?:spend|spent|spending|expenses?|costs?|pay|paid)\b"),
+]
+
+# Savings rate the assistant recommends, in percent
+RECOMMENDED_SAVINGS_RATE = 20
+
+_NUMBERS = {
+    "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+
+_MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+
+_MONTH_NAMES = "|".join(_MONTHS)
+
+
+def _month_start(year, month):
+    return date(year, month, 1)
+
+
+def _month_end(year, month):
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _shift_month(year, month, months):
+    """Return (year, month) `months` months after (or before, if negative) a month."""
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def parse_period(text, today):
+    """
+    Return (start date, end date, label) for the period named in a lowercase
+    question, both dates inclusive, or None when it names no period.
+    """
+    year, month = today.year, today.month
+
+    if re.search(r"\btoday\b", text):
+        return today, today, "today"
+
+    if re.search(r"\byesterday\b", text):
+        yesterday = today - timedelta(days=1)
+        return yesterday, yesterday, "yesterday"
+
+    match = re.search(r"\b(?:last|past|previous) (\d+|" + "|".join(_NUMBERS) + r") (days|weeks)\b", text)
+    if match:
+        count = int(_NUMBERS.get(match.group(1), match.group(1)))
+        days = count * 7 if match.group(2) == "weeks" else count
+        return today - timedelta(days=days - 1), today, f"in the last {count} {match.group(2)}"
+
+    if re.search(r"\bthis week\b", text):
+        return today - timedelta(days=today.weekday()), today, "this week"
+
+    if re.search(r"\b(?:last|past|previous) week\b", text):
+        monday = today - timedelta(days=today.weekday() + 7)
+        return monday, monday + timedelta(days=6), "last week"
+
+    if re.search(r"\bthis month\b", text):
+        return _month_start(year, month), today, "this month"
+
+    match = re.search(r"\b(?:last|past|previous) (\d+|" + "|".join(_NUMBERS) + r") months\b", text)
+    if match:
+        count = int(_NUMBERS.get(match.group(1), match.group(1)))
+        first = _shift_month(year, month, -count)
+        last = _shift_month(year, month, -1)
+        return _month_start(*first), _month_end(*last), f"in the last {count} months"
+
+    if re.search(r"\b(?:last|past|previous) month\b", text):
+        last = _shift_month(year, month, -1)
+        return _month_start(*last), _month_end(*last), "last month"
+
+    if re.search(r"\bthis year\b|\byear to date\b|\bytd\b", text):
+        return date(year, 1, 1), today, "this year"
+
+    if re.search(r"\b(?:last|past|previous) year\b", text):
+        return date(year - 1, 1, 1), date(year - 1, 12, 31), "last year"
+
+    match = (
+        re.search(r"\b(" + _MONTH_NAMES + r") (\d{4})\b", text)
+        or re.search(r"\b(?:in|during|for|over) (" + _MONTH_NAMES + r")\b()", text)
+    )
+    if match:
+        named = _MONTHS[match.group(1)]
+        # Without a year, the most recent such month
+        named_year = int(match.group(2)) if match.group(2) else (year if named <= month else year - 1)
+        label = f"in {calendar.month_name[named]} {named_year}"
+        return _month_start(named_year, named), _month_end(named_year, named), label
+
+    match = re.search(r"\b(?:in|during) (\d{4})\b", text)
+    if match:
+        named_year = int(match.group(1))
+        return date(named_year, 1, 1), date(named_year, 12, 31), f"in {named_year}"
+
+    return None
+
+
+def parse_category(text, categories=CATEGORIES):
+    """Return the category named in a lowercase question, or None."""
+    for category in categories:
+        names = [category.lower()] + CATEGORY_SYNONYMS.get(category, [])
+        if any(re.search(r"\b" + re.escape(name) + r"\b", text) for name in names):
+            return category
+    return None
+
+
+def parse_question(question, categories=CATEGORIES, today=None):
+    """
+    Compile a question into a query dictionary with `intent`, `metric`,
+    `category`, `start`, `end` and `period` (a label for the answer). The
+    intent is "aggregate" for questions answered from the totals, "goals" or
+    "budget_tips" for the ones the app answers itself, and None otherwise.
+    """
+    text = re.sub(r"[^a-z0-9 ]+", " ", question.lower())
+    text = re.sub(r"\s+", " ", text).strip()
+    today = today or datetime.now()
+    today = today.date() if isinstance(today, datetime) else today
+
+    query = {"intent": None, "metric": None, "category": None, "start": None, "end": None, "period": None}
+    for intent, pattern in INTENT_PATTERNS:
+        if re.search(pattern, text):
+            query["intent"] = intent
+            return query
+
+    metric = next((metric for metric, pattern in METRIC_PATTERNS if re.search(pattern, text)), None)
+    category = parse_category(text, categories)
+    if metric is None and category is not None:
+        # "Dining last month?" asks about spending
+        metric = "income" if category == "Income" else "spending"
+    if metric is None:
+        return query
+
+    period = parse_period(text, today)
+    if period is not None:
+        query["start"], query["end"], query["period"] = period
+
+    query["intent"] = "aggregate"
+    query["metric"] = metric
+    query["category"] = category if metric == "spending" and category != "Income" else None
+    return query
+
+
+def run_query(query, daily):
+    """
+    Execute an "aggregate" query against the ledger's DailyTotals. Every
+    total is a prefix-sum lookup, whatever the period. Returns a result
+    dictionary with amounts in euros: `amount` for the metric (or `rate` for
+    the savings rate), plus `share` of the period's expenses for a category
+    and `category` for the biggest expense category.
+    """
+    start, end = query["start"], query["end"]
+    income = daily.total_cents("income", start, end)
+    expenses = -daily.total_cents("expense", start, end)
+    metric = query["metric"]
+
+    if metric == "spending":
+        if query["category"] is None:
+            return {"amount": expenses / 100, "share": None}
+        spent = -daily.total_cents("expense", start, end, query["category"])
+        return {"amount": spent / 100, "share": spent / expenses if expenses else None}
+
+    if metric == "income":
+        return {"amount": income / 100}
+
+    if metric == "savings":
+        return {"amount": (income - expenses) / 100}
+
+    if metric == "savings_rate":
+        return {"rate": (income - expenses) / income * 100 if income > 0 else None}
+
+    if metric == "top_category":
+        totals = daily.category_totals("expense", start, end)
+        if not totals or expenses <= 0:
+            return {"category": None, "amount": 0.0, "share": None}
+        category = max(totals, key=totals.get)
+        return {"category": category, "amount": totals[category], "share": totals[category] * 100 / expenses}
+
+    raise ValueError(f"Unknown metric: {metric}")
+
+
+def answer_question(query, daily):
+    """Return the assistant's answer to an "aggregate" query."""
+    result = run_query(query, daily)
+    period = query["period"]
+    when = period or "so far"
+    metric = query["metric"]
+
+    if metric == "spending":
+        what = f"on {query['category'].lower()}" if query["category"] else "in total"
+        response = f"You spent €{result['amount']:.2f} {what} {when}."
+        if result["share"] is not None:
+            response += f" That is {result['share']:.1%} of your expenses in that period."
+        return response
+
+    if metric == "income":
+        return f"Your income {when} was €{result['amount']:.2f}."
+
+    if metric == "savings":
+        if result["amount"] < 0:
+            return f"You spent €{-result['amount']:.2f} more than you earned {when}."
+        return f"You saved €{result['amount']:.2f} {when}."
+
+    if metric == "savings_rate":
+        if result["rate"] is None:
+            return "I don't have enough income data to calculate your savings rate for that period. Please add your income transactions."
+        scope = f"savings rate {period}" if period else "overall savings rate"
+        response = f"Your {scope} is {result['rate']:.1f}%. The recommended savings rate is at least {RECOMMENDED_SAVINGS_RATE}%. "
+        if result["rate"] < RECOMMENDED_SAVINGS_RATE:
+            return response + "You might want to look for ways to increase your savings rate."
+        return response + "Great job! You're on track with your savings."
+
+    if result["category"] is None:
+        return "I don't have enough expense data for that period to determine your biggest category."
+    return (
+        f"Your biggest expense category {when} is {result['category']}, where you've spent "
+        f"€{result['amount']:.2f}. This represents {result['share']:.1%} of your total expenses."
+    )
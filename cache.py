@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Small in-memory caches used to avoid recomputing derived data on reruns."""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entry when full.
+
+    Lookups, inserts and evictions hold a lock, so one cache can be shared
+    by the sessions of a process. `compute` runs outside it; two threads
+    missing the same key at once may both compute it, and the last one wins.
+    """
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for `key`, calling `compute()` on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SyncCache:
+    """Per-key cache of an append-only feed, such as a user's bank transactions.
+
+    Entries are served from memory for `ttl` seconds. Once an entry expires,
+    `fetch(since)` is called with the cursor of the newest cached item and
+    only the items it returns are appended, instead of downloading the whole
+    feed again. Cursors such as posting dates are not unique, so `fetch` must
+    return the items at the cursor as well; the ones already cached are
+    recognized by `identity` and dropped.
+
+    A sync runs outside the cache-wide lock, so a slow upstream only delays
+    callers of the same key. Callers get copies of the items and may edit them
+    freely.
+    """
+
+    def __init__(self, ttl=300, cursor=lambda item: item["date"], identity=lambda item: item["id"], clock=time.monotonic):
+        self.ttl = ttl
+        self.cursor = cursor
+        self.identity = identity
+        self.clock = clock
+        self.syncs = 0
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and self.clock() - entry["fetched_at"] < self.ttl:
+            return entry
+        return None
+
+    def get(self, key, fetch, prepare=None):
+        """
+        Return copies of every cached item for `key`, syncing through `fetch`
+        if expired. `prepare`, if given, is called once with each batch of new
+        items before they are cached.
+        """
+        with self._lock:
+            entry = self._fresh(key)
+            if entry is not None:
+                return [dict(item) for item in entry["items"]]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                # Another caller may have synced this key while we waited
+                entry = self._fresh(key)
+                if entry is not None:
+                    return [dict(item) for item in entry["items"]]
+                entry = self._entries.get(key)
+                since = entry["cursor"] if entry is not None else None
+
+            fetched = list(fetch(since))
+            now = self.clock()
+
+            seen = entry["ids"] if entry is not None else set()
+            new_items = []
+            for item in fetched:
+                if self.identity(item) not in seen:
+                    seen.add(self.identity(item))
+                    new_items.append(item)
+            if prepare is not None and new_items:
+                prepare(new_items)
+
+            items = entry["items"] + new_items if entry is not None else new_items
+            cursor = max((self.cursor(item) for item in new_items), default=since)
+            if since is not None and cursor is not None:
+                cursor = max(cursor, since)
+
+            with self._lock:
+                self.syncs += 1
+                self._entries[key] = {"items": items, "ids": seen, "cursor": cursor, "fetched_at": now}
+                return [dict(item) for item in items]
+
+    def invalidate(self, key=None):
+        """Force a sync on the next access for `key`, or for every key."""
+        with self._lock:
+            if key is None:
+                for entry in self._entries.values():
+                    entry["fetched_at"] = float("-inf")
+            elif key in self._entries:
+                self._entries[key]["fetched_at"] = float("-inf")
+
+    def clear(self, key=None):
+        """Drop the cached items for `key`, or for every key."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
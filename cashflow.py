@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""Cash flow analysis over transaction lists and columnar arrays.
+
+`analyze_cash_flow_records` is the original per-transaction loop. The array
+version computes the same result with sign masks and `np.bincount` over
+category codes, summing in integer cents so totals are exact.
+`stream_cash_flow` consumes any iterator of transactions in fixed-size
+chunks, keeping only running totals in memory, and yields a partial result
+after every chunk. `LedgerCashFlow` keeps the same running totals for a
+TransactionLedger, folding in only the rows appended since its last sync.
+
+Run this module directly to benchmark both implementations:
+
+    python cashflow.py 10000 1000000 10000000
+"""
+
+import sys
+import time
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+# Spending that is not counted as discretionary when suggesting savings,
+# matched case-insensitively
+ESSENTIAL_CATEGORIES = {"housing", "utilities", "groceries", "healthcare", "transportation", "transport"}
+
+# Share of discretionary spending suggested as potential savings
+SAVINGS_RATE = 0.2
+
+# Transactions converted to arrays at a time when streaming
+STREAM_CHUNK_SIZE = 10_000
+
+# Category that expenses without a category (code -1) are counted under
+UNCATEGORIZED = "Other"
+
+
+def empty_cash_flow():
+    return {"income": 0, "expenses": 0, "potential_savings": 0, "categories": {}}
+
+
+def _uncategorized_as_other(codes, categories):
+    """
+    Return (codes, categories) with missing category codes (-1) pointing at
+    UNCATEGORIZED, which is appended to the categories if needed.
+    """
+    missing = codes < 0
+    if not missing.any():
+        return codes, categories
+
+    categories = list(categories)
+    if UNCATEGORIZED not in categories:
+        categories.append(UNCATEGORIZED)
+    return np.where(missing, categories.index(UNCATEGORIZED), codes), categories
+
+
+def essential_total(category_totals):
+    """Return the part of {category: expenses} spent on ESSENTIAL_CATEGORIES."""
+    return sum(
+        total for category, total in category_totals.items()
+        if isinstance(category, str) and category.lower() in ESSENTIAL_CATEGORIES
+    )
+
+
+def analyze_cash_flow_records(transactions):
+    """
+    Analyzes transactions to identify income and spending patterns.
+    Returns dictionary with income, expenses, and potential savings.
+    """
+    if not transactions:
+        return empty_cash_flow()
+
+    income = 0
+    expenses = 0
+    categories = {}
+
+    for transaction in transactions:
+        amount = transaction["amount"]
+        category = transaction["category"]
+
+        if amount > 0:
+            income += amount
+        else:
+            # Convert negative amount to positive for easier calculations
+            expense_amount = abs(amount)
+            expenses += expense_amount
+
+            # Track spending by category
+            if category not in categories:
+                categories[category] = 0
+            categories[category] += expense_amount
+
+    # Calculate potential savings based on discretionary spending
+    essential_expenses = essential_total(categories)
+    discretionary_expenses = expenses - essential_expenses
+
+    # Suggest saving 20% of discretionary spending
+    potential_savings = round(discretionary_expenses * SAVINGS_RATE, 2)
+
+    return {
+        "income": income,
+        "expenses": expenses,
+        "potential_savings": potential_savings,
+        "categories": categories
+    }
+
+
+def analyze_cash_flow_arrays(amount_cents, category_codes, categories):
+    """
+    Vectorized cash flow analysis.
+
+    `amount_cents` holds signed int64 amounts, `category_codes` indexes into
+    the `categories` sequence, with -1 for no category. Returns the same
+    dictionary as the loop version, with uncategorized expenses under
+    UNCATEGORIZED.
+    """
+    if len(amount_cents) == 0:
+        return empty_cash_flow()
+
+    amount_cents = np.asarray(amount_cents, dtype=np.int64)
+    category_codes, categories = _uncategorized_as_other(np.asarray(category_codes, dtype=np.intp), categories)
+
+    is_expense = amount_cents <= 0
+    income_cents = int(amount_cents.sum(where=~is_expense))
+
+    # Integer-valued bincount weights keep cent sums exact up to 2**53 cents per category
+    totals = np.bincount(category_codes, weights=np.where(is_expense, -amount_cents, 0), minlength=len(categories))
+    counts = np.bincount(category_codes, weights=is_expense, minlength=len(categories))
+
+    category_cents = {categories[code]: int(totals[code]) for code in np.flatnonzero(counts)}
+    return _cash_flow_result(income_cents, category_cents)
+
+
+def _cash_flow_result(income_cents, category_cents):
+    """Build the analyze_cash_flow dictionary from cent totals."""
+    category_totals = {category: cents / 100 for category, cents in category_cents.items()}
+
+    expenses = sum(category_cents.values()) / 100
+    essential_expenses = essential_total(category_totals)
+    discretionary_expenses = expenses - essential_expenses
+
+    return {
+        "income": income_cents / 100,
+        "expenses": expenses,
+        "potential_savings": round(discretionary_expenses * SAVINGS_RATE, 2),
+        "categories": category_totals
+    }
+
+
+def analyze_cash_flow_frame(transactions):
+    """Vectorized cash flow analysis of a DataFrame with `amount` and `category` columns."""
+    if transactions.empty:
+        return empty_cash_flow()
+
+    category = transactions["category"]
+    if isinstance(category.dtype, pd.CategoricalDtype):
+        codes, categories = category.cat.codes.to_numpy(), category.cat.categories
+    else:
+        codes, categories = pd.factorize(category)
+
+    amount_cents = np.rint(transactions["amount"].to_numpy(dtype=np.float64) * 100).astype(np.int64)
+    return analyze_cash_flow_arrays(amount_cents, codes, list(categories))
+
+
+def analyze_cash_flow(transactions):
+    """
+    Analyzes transactions to identify income and spending patterns.
+    Accepts a list of transaction dictionaries or a DataFrame.
+    Returns dictionary with income, expenses, and potential savings.
+    """
+    if isinstance(transactions, pd.DataFrame):
+        return analyze_cash_flow_frame(transactions)
+    if not transactions:
+        return empty_cash_flow()
+    return analyze_cash_flow_frame(pd.DataFrame.from_records(transactions, columns=["amount", "category"]))
+
+
+class CashFlowAccumulator:
+    """Running cash flow totals that can be fed one chunk of transactions at a time."""
+
+    def __init__(self):
+        self.rows = 0
+        self.income_cents = 0
+        self.category_cents = {}
+
+    def add_chunk(self, transactions):
+        """Fold a list of transaction dictionaries into the running totals.
+
+        Amounts may be numbers or numeric strings, as produced by csv.DictReader.
+        """
+        if not transactions:
+            return
+
+        frame = pd.DataFrame.from_records(transactions, columns=["amount", "category"])
+        amounts = pd.to_numeric(frame["amount"]).to_numpy(dtype=np.float64)
+        amount_cents = np.rint(amounts * 100).astype(np.int64)
+        self.add_arrays(amount_cents, *pd.factorize(frame["category"]))
+
+    def add_arrays(self, amount_cents, category_codes, categories):
+        """Fold signed cent amounts and their codes into `categories` into the running totals."""
+        codes, categories = _uncategorized_as_other(np.asarray(category_codes, dtype=np.intp), categories)
+
+        is_expense = amount_cents <= 0
+        self.income_cents += int(amount_cents.sum(where=~is_expense))
+
+        totals = np.bincount(codes, weights=np.where(is_expense, -amount_cents, 0), minlength=len(categories))
+        counts = np.bincount(codes, weights=is_expense, minlength=len(categories))
+        for code in np.flatnonzero(counts):
+            category = categories[code]
+            self.category_cents[category] = self.category_cents.get(category, 0) + int(totals[code])
+
+        self.rows += len(amount_cents)
+
+    def result(self):
+        """Return the analyze_cash_flow dictionary for everything seen so far."""
+        if self.rows == 0:
+            return empty_cash_flow()
+        return _cash_flow_result(self.income_cents, self.category_cents)
+
+
+class LedgerCashFlow(CashFlowAccumulator):
+    """Running cash flow totals of a TransactionLedger, updated with its appended rows."""
+
+    def __init__(self, ledger):
+        super().__init__()
+        self.ledger = ledger
+        self.generation = 0
+
+    def reset(self):
+        self.rows = 0
+        self.income_cents = 0
+        self.category_cents = {}
+
+    def sync(self):
+        """Fold in the rows appended to the ledger since the last call."""
+        ledger = self.ledger
+        if self.generation != ledger.generation:
+            # The ledger was cleared; start over
+            self.reset()
+            self.generation = ledger.generation
+        if self.rows == len(ledger):
+            return
+
+        start = self.rows
+        self.add_arrays(ledger.column("amount", start), ledger.column("category", start), ledger.categories)
+
+
+def stream_cash_flow(transactions, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Analyzes an iterator of transactions in constant memory.
+    Yields (rows processed, partial result) after every chunk; the last
+    value yielded is the result for the whole stream.
+    """
+    accumulator = CashFlowAccumulator()
+    iterator = iter(transactions)
+
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            break
+        accumulator.add_chunk(chunk)
+        yield accumulator.rows, accumulator.result()
+
+    if accumulator.rows == 0:
+        yield 0, accumulator.result()
+
+
+def analyze_cash_flow_stream(transactions, chunk_size=STREAM_CHUNK_SIZE):
+    """Return the cash flow result of an iterator of transactions, in constant memory."""
+    result = empty_cash_flow()
+    for _, result in stream_cash_flow(transactions, chunk_size):
+        pass
+    return result
+
+
+def make_benchmark_data(rows, seed=0):
+    """Return (records, frame, arrays) holding the same random transactions."""
+    rng = np.random.default_rng(seed)
+    names = ["income", "groceries", "dining", "entertainment", "transportation",
+             "shopping", "utilities", "housing", "healthcare", "other"]
+    codes = rng.integers(0, len(names), rows)
+    cents = rng.integers(1, 50_000, rows)
+    cents = np.where(codes == 0, cents * 10, -cents)
+
+    frame = pd.DataFrame({
+        "amount": cents / 100,
+        "category": pd.Categorical.from_codes(codes, categories=names),
+    })
+    records = [
+        {"amount": amount, "category": category}
+        for amount, category in zip(frame["amount"].tolist(), np.array(names)[codes].tolist())
+    ]
+    return records, frame, (cents, codes, names)
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark(sizes):
+    for rows in sizes:
+        records, frame, arrays = make_benchmark_data(rows)
+
+        loop_result, loop_time = _timed(analyze_cash_flow_records, records)
+        frame_result, frame_time = _timed(analyze_cash_flow_frame, frame)
+        array_result, array_time = _timed(analyze_cash_flow_arrays, *arrays)
+
+        same = all(
+            np.isclose(loop_result[key], result[key], rtol=1e-9)
+            for result in (frame_result, array_result)
+            for key in ("income", "expenses", "potential_savings")
+        )
+        print(f"{rows:>12,} rows  loop {loop_time:8.3f}s  frame {frame_time:8.3f}s "
+              f"({loop_time / frame_time:5.1f}x)  arrays {array_time:8.3f}s "
+              f"({loop_time / array_time:5.1f}x)  match {same}")
+        del records, frame, arrays
+
+
+if __name__ == "__main__":
+    benchmark([int(arg) for arg in sys.argv[1:]] or [10_000, 1_000_000, 10_000_000])
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""Category prediction from transaction descriptions.
+
+Descriptions are turned into hashed features: words, word pairs and
+character 3- to 5-grams are hashed with CRC-32 into a fixed number of
+buckets, so the model never stores a vocabulary and unseen payees still
+share features with known ones. A softmax (multinomial logistic) regression
+over those features is trained offline and saved to MODEL_PATH. The app
+keeps one ClassifierStore per process, which loads the saved model and
+swaps in a newly saved one as a whole, and classifies whole batches at
+once; rows whose best class is below the confidence threshold are left for
+manual review.
+
+Train from the labeled transactions in the database, or from a CSV file
+with `description` and `category` columns:
+
+    python classifier.py [training.csv]
+
+Categories users confirm in the app are only appended to CORRECTIONS_PATH.
+The model is shared by every user of a process, so it learns from them at
+the next training run, which includes the corrections, and never from a
+single user's review.
+"""
+
+import csv
+import os
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+from ledger import CATEGORIES
+from recurring import normalize_description
+
+MODEL_PATH = os.path.join('models', 'category_classifier.npz')
+
+# Categories confirmed by users, as description,category rows
+CORRECTIONS_PATH = os.path.join('models', 'category_corrections.csv')
+
+# Number of hash buckets, as a power of two
+HASH_BITS = 17
+
+# Predictions below this probability are sent to manual review
+CONFIDENCE_THRESHOLD = 0.6
+
+# Character n-gram lengths used as features
+CHAR_NGRAMS = (3, 4, 5)
+
+# Category names used by the bank, mapped to the app's categories
+BANK_CATEGORY_MAP = {
+    "income": "Income",
+    "salary": "Income",
+    "groceries": "Groceries",
+    "dining": "Dining",
+    "restaurants": "Dining",
+    "entertainment": "Entertainment",
+    "transportation": "Transport",
+    "transport": "Transport",
+    "travel": "Transport",
+    "shopping": "Shopping",
+    "utilities": "Utilities",
+}
+
+
+def map_bank_category(category):
+    """Return the app category of a bank category name, or None if it has no equivalent."""
+    if category in CATEGORIES:
+        return category
+    return BANK_CATEGORY_MAP.get(str(category).strip().lower())
+
+
+def description_features(description):
+    """Return the feature strings of one description."""
+    text = normalize_description(description)
+    words = text.split()
+    features = ["<all>"]
+    features += ["w:" + word for word in words]
+    features += ["p:" + a + " " + b for a, b in zip(words, words[1:])]
+    padded = f" {text} "
+    for n in CHAR_NGRAMS:
+        features += ["c:" + padded[i:i + n] for i in range(len(padded) - n + 1)]
+    return features
+
+
+def hash_features(descriptions, bits=HASH_BITS):
+    """
+    Return the hashed features of many descriptions in compressed sparse row
+    form: (row offsets, bucket indices, values), each row scaled to unit length.
+    """
+    mask = (1 << bits) - 1
+    offsets = [0]
+    indices = []
+    for description in descriptions:
+        buckets = [zlib.crc32(feature.encode("utf-8")) & mask for feature in description_features(description)]
+        indices.extend(buckets)
+        offsets.append(len(indices))
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+    lengths = np.diff(offsets)
+    values = np.repeat(1 / np.sqrt(np.maximum(lengths, 1)), lengths)
+    return offsets, indices, values
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class DescriptionClassifier:
+    """A softmax regression over hashed description features.
+
+    A loaded classifier is immutable, so it can be shared between threads.
+    """
+
+    def __init__(self, weights, bias, labels, bits=HASH_BITS):
+        self.weights = weights
+        self.bias = bias
+        self.labels = list(labels)
+        self.bits = bits
+
+    def _logits(self, offsets, indices, values):
+        contributions = values[:, None] * self.weights[indices]
+        return np.add.reduceat(contributions, offsets[:-1], axis=0) + self.bias
+
+    def predict_proba(self, descriptions):
+        """Return an n x labels matrix of class probabilities."""
+        if len(descriptions) == 0:
+            return np.empty((0, len(self.labels)))
+        return _softmax(self._logits(*hash_features(descriptions, self.bits)))
+
+    def classify(self, descriptions, threshold=CONFIDENCE_THRESHOLD):
+        """
+        Return (labels, confidences) for a batch of descriptions. The label is
+        None where the best probability is below `threshold`.
+        """
+        probabilities = self.predict_proba(descriptions)
+        best = probabilities.argmax(axis=1)
+        confidences = probabilities[np.arange(len(best)), best]
+        labels = [self.labels[b] if c >= threshold else None for b, c in zip(best, confidences)]
+        return labels, confidences
+
+    @classmethod
+    def train(cls, descriptions, labels, bits=HASH_BITS, epochs=200, learning_rate=0.1, l2=1e-6):
+        """Fit a classifier with full-batch Adam on the cross-entropy loss."""
+        classes = sorted(set(labels))
+        targets = np.searchsorted(classes, labels)
+        offsets, indices, values = hash_features(descriptions, bits)
+        rows = np.repeat(np.arange(len(descriptions)), np.diff(offsets))
+        onehot = np.eye(len(classes))[targets]
+
+        model = cls(np.zeros((1 << bits, len(classes))), np.zeros(len(classes)), classes, bits)
+        parameters = [model.weights, model.bias]
+        moments = [np.zeros_like(p) for p in parameters]
+        squares = [np.zeros_like(p) for p in parameters]
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+
+        for step in range(1, epochs + 1):
+            error = (_softmax(model._logits(offsets, indices, values)) - onehot) / len(descriptions)
+            # Only the buckets that occur get a gradient; bincount sums it per bucket and class
+            weighted = values[:, None] * error[rows]
+            weight_gradient = np.column_stack([
+                np.bincount(indices, weights=weighted[:, k], minlength=1 << bits) for k in range(len(classes))
+            ]) + l2 * model.weights
+            gradients = [weight_gradient, error.sum(axis=0)]
+
+            for parameter, gradient, moment, square in zip(parameters, gradients, moments, squares):
+                moment *= beta1
+                moment += (1 - beta1) * gradient
+                square *= beta2
+                square += (1 - beta2) * gradient ** 2
+                parameter -= learning_rate * (moment / (1 - beta1 ** step)) / (np.sqrt(square / (1 - beta2 ** step)) + eps)
+
+        model.weights = model.weights.astype(np.float32)
+        return model
+
+    def save(self, path=MODEL_PATH):
+        """Write the model to a temporary file and move it over `path`, so readers never see half of it."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            np.savez_compressed(f, weights=self.weights, bias=self.bias, labels=np.array(self.labels), bits=self.bits)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        """Return the saved classifier, or None if it has not been trained yet."""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            model = cls(data["weights"], data["bias"], data["labels"].tolist(), int(data["bits"]))
+        model.weights.flags.writeable = False
+        model.bias.flags.writeable = False
+        return model
+
+
+class ClassifierStore:
+    """The classifier of a process, replaced as a whole when a newer model is saved."""
+
+    def __init__(self, path=MODEL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._model = None
+        self._modified = None
+
+    def current(self):
+        """Return the latest saved classifier, or None if none has been trained yet."""
+        modified = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        with self._lock:
+            if modified != self._modified:
+                self._model = DescriptionClassifier.load(self.path)
+                self._modified = modified
+            return self._model
+
+
+def categorize_batch(transactions, model, threshold=CONFIDENCE_THRESHOLD):
+    """
+    Add `ui_category`, `category_confidence` and `needs_review` to every
+    transaction dictionary of a batch. Confident predictions are used as
+    they are; other rows keep the bank's category mapped to the app's
+    categories as a suggestion and are marked for review. Without a model,
+    only rows whose bank category has no app equivalent need review.
+    """
+    if not transactions:
+        return transactions
+
+    if model is not None:
+        labels, confidences = model.classify([t.get("description", "") for t in transactions], threshold)
+    else:
+        labels, confidences = [None] * len(transactions), np.zeros(len(transactions))
+
+    for transaction, label, confidence in zip(transactions, labels, confidences):
+        suggestion = map_bank_category(transaction.get("category", ""))
+        transaction["ui_category"] = label or suggestion or "Other"
+        transaction["category_confidence"] = float(confidence)
+        transaction["needs_review"] = label is None and (model is not None or suggestion is None)
+    return transactions
+
+
+# Serializes appends to the corrections file between sessions
+_corrections_lock = threading.Lock()
+
+
+def record_corrections(descriptions, labels, path=CORRECTIONS_PATH):
+    """Append user-confirmed (description, category) pairs to the training corrections."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with _corrections_lock, open(path, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(zip(descriptions, labels))
+
+
+def load_corrections(path=CORRECTIONS_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(row[0], row[1]) for row in csv.reader(f) if len(row) == 2]
+
+
+def _training_data(path=None):
+    if path is not None:
+        import pandas as pd
+        frame = pd.read_csv(path, usecols=["description", "category"]).dropna()
+        pairs = zip(frame["description"].astype(str), frame["category"].astype(str))
+    else:
+        import storage
+        pairs = storage.load_labeled_descriptions()
+
+    descriptions, labels = [], []
+    for description, category in list(pairs) + load_corrections():
+        category = map_bank_category(category)
+        if description.strip() and category is not None:
+            descriptions.append(description)
+            labels.append(category)
+    return descriptions, labels
+
+
+def main(argv):
+    descriptions, labels = _training_data(argv[0] if argv else None)
+    if len(set(labels)) < 2:
+        print("Need labeled descriptions from at least two categories to train.")
+        return 1
+
+    # Hold out every fifth row to report accuracy, then train on everything
+    held_out = np.arange(len(descriptions)) % 5 == 0
+    if held_out.sum() and (~held_out).sum():
+        train = [i for i in range(len(descriptions)) if not held_out[i]]
+        test = [i for i in range(len(descriptions)) if held_out[i]]
+        model = DescriptionClassifier.train([descriptions[i] for i in train], [labels[i] for i in train])
+        predicted, confidences = model.classify([descriptions[i] for i in test], threshold=0)
+        accuracy = np.mean([p == labels[i] for p, i in zip(predicted, test)])
+        confident = confidences >= CONFIDENCE_THRESHOLD
+        print(f"Held-out accuracy {accuracy:.1%}, {confident.mean():.1%} of rows above the confidence threshold")
+
+    model = DescriptionClassifier.train(descriptions, labels)
+    model.save()
+    print(f"Trained on {len(descriptions)} descriptions, saved to {MODEL_PATH}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Per-category monthly expense forecasts from one least-squares solve.
+
+The monthly totals of every category, plus the overall total, are laid out
+as the columns of one months x series matrix. All series share the same
+design matrix (intercept, linear trend and, with enough history, one annual
+sine/cosine pair), so a single `np.linalg.lstsq` call fits every series at
+once and a single matrix product forecasts them all.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Months forecast by default
+FORECAST_HORIZON = 3
+
+# Months of history needed before seasonal terms are added to the model
+SEASONAL_MIN_MONTHS = 12
+
+# Name of the column holding the forecast of the overall total
+TOTAL_COLUMN = "Total"
+
+
+def month_number(month):
+    """Return the number of months since year 0 of a 'YYYY-MM' key."""
+    year, month = month.split("-")
+    return int(year) * 12 + int(month) - 1
+
+
+def month_label(number):
+    """Return the 'YYYY-MM' key of a month number."""
+    return f"{number // 12:04d}-{number % 12 + 1:02d}"
+
+
+def design_matrix(months, origin, seasonal=False):
+    """
+    Return the regression inputs for an array of month numbers.
+    The trend is counted from `origin`, the first month of the history.
+    """
+    months = np.asarray(months, dtype=np.int64)
+    columns = [np.ones(len(months)), (months - origin).astype(np.float64)]
+    if seasonal:
+        angle = 2 * np.pi * (months % 12) / 12
+        columns += [np.sin(angle), np.cos(angle)]
+    return np.column_stack(columns)
+
+
+def monthly_matrix(frame):
+    """
+    Turn month/category/amount rows into a months x categories matrix.
+    Months without any spending in the covered range are filled with zeros.
+    Returns (month numbers, category names, matrix).
+    """
+    numbers = frame["month"].map(month_number).to_numpy()
+    categories, codes = np.unique(frame["category"].astype(str).to_numpy(), return_inverse=True)
+
+    first = int(numbers.min())
+    months = np.arange(first, int(numbers.max()) + 1)
+
+    matrix = np.zeros((len(months), len(categories)))
+    np.add.at(matrix, (numbers - first, codes), frame["amount"].to_numpy(dtype=np.float64))
+    return months, list(categories), matrix
+
+
+def forecast_matrix(months, matrix, horizon=FORECAST_HORIZON, seasonal=None):
+    """
+    Fit every column of `matrix` against `months` in one solve and return the
+    (future month numbers, horizon x columns forecast). With `seasonal=None`
+    seasonal terms are used once there are SEASONAL_MIN_MONTHS of history.
+    """
+    months = np.asarray(months, dtype=np.int64)
+    if seasonal is None:
+        seasonal = len(months) >= SEASONAL_MIN_MONTHS
+
+    origin = months[0]
+    coefficients, *_ = np.linalg.lstsq(design_matrix(months, origin, seasonal), matrix, rcond=None)
+
+    future = np.arange(months[-1] + 1, months[-1] + 1 + horizon)
+    # Spending cannot be negative, whatever the trend says
+    return future, np.maximum(design_matrix(future, origin, seasonal) @ coefficients, 0)
+
+
+def forecast_expenses(cube, horizon=FORECAST_HORIZON, seasonal=None):
+    """
+    Forecast the monthly expenses of every category and of the total.
+    Returns a DataFrame indexed by future 'YYYY-MM' months with one column per
+    category plus TOTAL_COLUMN, or None when there are no expenses.
+    """
+    frame = cube.monthly_category_frame("expense")
+    if frame.empty:
+        return None
+
+    months, categories, matrix = monthly_matrix(frame)
+    series = np.column_stack([matrix, matrix.sum(axis=1)])
+    future, predictions = forecast_matrix(months, series, horizon, seasonal)
+
+    return pd.DataFrame(
+        predictions.round(2),
+        index=pd.Index([month_label(m) for m in future], name="month"),
+        columns=categories + [TOTAL_COLUMN]
+    )
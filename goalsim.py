@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""Monte Carlo projections of savings goals.
+
+Every simulated path draws one sequence of monthly portfolio returns and
+one sequence of contribution shocks, shared by all goals of the user. With
+G_t the growth of one euro invested at the start of the simulation and s_t
+the contribution shock of month t, a goal with current balance b and
+planned contribution c is worth
+
+    G_T * (b + c * sum(s_t / G_(t-1) for t <= T))
+
+after T months. The running sum is a single cumulative sum over the path
+matrix, so every goal is evaluated by gathering one column per goal rather
+than simulating each goal separately. Because the balance is linear in c,
+the contribution each path needs to reach the target is also closed-form.
+"""
+
+import math
+
+import numpy as np
+
+# Portfolio weights per risk preference
+INVESTMENT_STRATEGIES = {
+    "conservative": {
+        "stocks": 0.40,
+        "bonds": 0.50,
+        "cash": 0.10
+    },
+    "moderate": {
+        "stocks": 0.60,
+        "bonds": 0.35,
+        "cash": 0.05
+    },
+    "aggressive": {
+        "stocks": 0.80,
+        "bonds": 0.15,
+        "cash": 0.05
+    }
+}
+
+# Annual expected return and volatility of each asset class
+ASSET_RETURNS = {
+    "stocks": (0.07, 0.16),
+    "bonds": (0.03, 0.06),
+    "cash": (0.02, 0.005),
+}
+
+# Correlation between the annual returns of the asset classes, in ASSET_RETURNS order
+ASSET_CORRELATION = np.array([
+    [1.0, 0.1, 0.0],
+    [0.1, 1.0, 0.1],
+    [0.0, 0.1, 1.0],
+])
+
+# Simulated paths per projection
+SIMULATION_PATHS = 5000
+
+# Relative weight of each goal priority when splitting savings
+PRIORITY_WEIGHTS = {"high": 0.6, "medium": 0.3, "low": 0.1}
+
+DEFAULT_PRIORITY = "medium"
+
+# Probability of reaching a goal above which it counts as on track
+ON_TRACK_PROBABILITY = 0.5
+
+# Success probability the required contribution is computed for
+TARGET_CONFIDENCE = 0.9
+
+AVERAGE_MONTH_DAYS = 365.25 / 12
+
+
+def portfolio_return(strategy):
+    """Return the monthly mean and volatility of a portfolio with the given weights."""
+    weights = np.array([strategy.get(asset, 0) for asset in ASSET_RETURNS])
+    means = np.array([mean for mean, _ in ASSET_RETURNS.values()])
+    volatilities = np.array([volatility for _, volatility in ASSET_RETURNS.values()])
+
+    covariance = ASSET_CORRELATION * np.outer(volatilities, volatilities)
+    return weights @ means / 12, math.sqrt(weights @ covariance @ weights / 12)
+
+
+def months_until(date, today):
+    """Return the whole months from `today` until `date`, rounded up and never negative."""
+    days = (np.datetime64(date, "D") - np.datetime64(today, "D")).astype(np.int64)
+    return max(math.ceil(days / AVERAGE_MONTH_DAYS), 0)
+
+
+def savings_profile(cube):
+    """
+    Return (average monthly net savings, coefficient of variation) from the
+    monthly income and expense totals of an AggregateCube, or (None, 0) without income.
+    """
+    flow = cube.monthly_flow()
+    if flow.empty or not (flow["income"] > 0).any():
+        return None, 0.0
+
+    net = (flow["income"] + flow["expense"]).to_numpy()
+    mean = float(net.mean())
+    if mean <= 0 or len(net) < 2:
+        return mean, 0.0
+    return mean, float(net.std(ddof=1) / mean)
+
+
+def water_fill(caps, weights, budget):
+    """
+    Split `budget` so every item gets min(cap, weight * level) for the single
+    level that spends the budget, or its full cap when the budget covers all.
+    Items with zero weight get nothing. Sorting the breakpoints makes this
+    O(n log n) for any number of items.
+    """
+    caps = np.maximum(np.asarray(caps, dtype=np.float64), 0)
+    weights = np.asarray(weights, dtype=np.float64)
+    caps = np.where(weights > 0, caps, 0)
+    if budget >= caps.sum():
+        return caps
+    if budget <= 0:
+        return np.zeros_like(caps)
+
+    active = weights > 0
+    breakpoints = np.divide(caps, weights, out=np.zeros_like(caps), where=active)
+    order = np.argsort(breakpoints[active])
+    sorted_caps = caps[active][order]
+    sorted_weights = weights[active][order]
+    sorted_breakpoints = breakpoints[active][order]
+
+    # Spending when the level reaches each breakpoint: earlier items are full, later ones grow with the level
+    saturated = np.concatenate([[0], np.cumsum(sorted_caps)[:-1]])
+    growing = np.cumsum(sorted_weights[::-1])[::-1]
+    spent = saturated + sorted_breakpoints * growing
+
+    k = int(np.searchsorted(spent, budget))
+    level = (budget - saturated[k]) / growing[k]
+    return np.minimum(caps, weights * level)
+
+
+def plan_contributions(gaps, months, monthly_savings=None, priorities=None):
+    """
+    Return a monthly contribution per goal.
+
+    Without `monthly_savings` every goal gets the straight-line amount that
+    closes its gap by its deadline. Otherwise the savings are water-filled:
+    first towards those straight-line amounts, each goal's share growing with
+    its priority weight and its required amount, then any remainder towards
+    paying off the remaining gaps early, in the same proportions.
+    """
+    gaps = np.maximum(np.asarray(gaps, dtype=np.float64), 0)
+    months = np.asarray(months, dtype=np.float64)
+    # A goal past its deadline is due now
+    required = gaps / np.maximum(months, 1)
+    if monthly_savings is None:
+        return required
+
+    if priorities is None:
+        priorities = [DEFAULT_PRIORITY] * len(gaps)
+    priority = np.array([PRIORITY_WEIGHTS.get(p, PRIORITY_WEIGHTS[DEFAULT_PRIORITY]) for p in priorities])
+
+    budget = max(monthly_savings, 0)
+    planned = water_fill(required, priority * required, budget)
+    extra = water_fill(gaps - planned, priority * gaps, budget - planned.sum())
+    return planned + extra
+
+
+def simulate_goals(current, target, months, contribution, strategy, paths=SIMULATION_PATHS,
+                   contribution_cv=0.0, confidence=TARGET_CONFIDENCE, seed=None):
+    """
+    Simulate the balance of every goal at its deadline.
+
+    `current`, `target`, `months` and `contribution` hold one value per goal;
+    `strategy` holds the portfolio weights. Returns a dictionary of per-goal
+    arrays: the probability of reaching the target, the median final balance,
+    and the monthly contribution that reaches the target with `confidence`.
+    """
+    current = np.asarray(current, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    contribution = np.asarray(contribution, dtype=np.float64)
+    months = np.asarray(months, dtype=np.int64)
+
+    rng = np.random.default_rng(seed)
+    horizon = max(int(months.max(initial=0)), 1)
+    mean, volatility = portfolio_return(strategy)
+
+    growth = np.cumprod(1 + rng.normal(mean, volatility, (paths, horizon)), axis=1)
+    shocks = np.maximum(rng.normal(1, contribution_cv, (paths, horizon)), 0) if contribution_cv else 1
+    invested_at = np.hstack([np.ones((paths, 1)), growth[:, :-1]])
+    contributed = np.cumsum(shocks / invested_at, axis=1)
+
+    # One column per goal, taken at its deadline
+    column = np.clip(months - 1, 0, None)
+    has_time = months > 0
+    goal_growth = np.where(has_time, growth[:, column], 1)
+    goal_contributed = np.where(has_time, contributed[:, column], 0)
+
+    balance = goal_growth * (current + contribution * goal_contributed)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        required = (target - goal_growth * current) / (goal_growth * goal_contributed)
+    required = np.quantile(np.where(has_time, np.maximum(required, 0), 0), confidence, axis=0)
+
+    return {
+        "probability": (balance >= target).mean(axis=0),
+        "median_balance": np.median(balance, axis=0),
+        # A goal already past its deadline cannot be reached by contributing more
+        "required_contribution": np.where(has_time | (current >= target), required, np.inf),
+    }
+
+
+def allocation_plan(goals, monthly_savings, today):
+    """
+    Split monthly savings across goal dictionaries (name, target, current,
+    date and optionally priority). Returns one dictionary per goal with its
+    priority, the straight-line amount its deadline requires and the
+    amount allocated to it.
+    """
+    if not goals:
+        return []
+
+    gaps = np.array([goal["target"] - goal["current"] for goal in goals], dtype=np.float64)
+    months = np.array([months_until(goal["date"], today) for goal in goals])
+    priorities = [goal.get("priority", DEFAULT_PRIORITY) for goal in goals]
+
+    amounts = plan_contributions(gaps, months, monthly_savings, priorities)
+    required = plan_contributions(gaps, months)
+    return [
+        {
+            "name": goal["name"],
+            "priority": priorities[i],
+            "required": round(float(required[i]), 2),
+            "amount": round(float(amounts[i]), 2),
+        }
+        for i, goal in enumerate(goals)
+    ]
+
+
+def project_goals(goals, cube, strategy, today, contributions=None, paths=SIMULATION_PATHS, seed=0):
+    """
+    Project a list of goal dictionaries (name, target, current, date) using
+    the savings history in an AggregateCube, or the planned monthly
+    `contributions` per goal when given. Returns one dictionary per goal
+    with the planned monthly contribution, the probability of reaching the
+    target by its date, the contribution needed for TARGET_CONFIDENCE and the
+    median final balance. A fixed seed keeps the figures stable across reruns.
+    """
+    if not goals:
+        return []
+
+    current = np.array([goal["current"] for goal in goals], dtype=np.float64)
+    target = np.array([goal["target"] for goal in goals], dtype=np.float64)
+    months = np.array([months_until(goal["date"], today) for goal in goals])
+
+    monthly_savings, savings_cv = savings_profile(cube)
+    if contributions is None:
+        priorities = [goal.get("priority", DEFAULT_PRIORITY) for goal in goals]
+        contribution = plan_contributions(target - current, months, monthly_savings, priorities)
+    else:
+        contribution = np.asarray(contributions, dtype=np.float64)
+    result = simulate_goals(current, target, months, contribution, strategy, paths, savings_cv, seed=seed)
+
+    return [
+        {
+            "name": goal["name"],
+            "months": int(months[i]),
+            "planned_contribution": float(contribution[i]),
+            "probability": float(result["probability"][i]),
+            "required_contribution": float(result["required_contribution"][i]),
+            "median_balance": float(result["median_balance"][i]),
+            "on_track": bool(result["probability"][i] >= ON_TRACK_PROBABILITY),
+        }
+        for i, goal in enumerate(goals)
+    ]
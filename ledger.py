@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""Append-optimized columnar storage for the transaction history.
+
+Transactions are written into fixed-size, pre-allocated column chunks so an
+append never copies the rows that are already stored. A pandas DataFrame is
+only materialized when a page actually needs one, and it is cached until the
+next write.
+
+Every column is typed at insert time: dates are datetime64[ns], categories
+and transaction types are one-byte codes into a per-ledger vocabulary, and
+amounts are kept as integer cents so sums are exact.
+
+A date-sorted permutation of the rows is kept alongside the columns so date
+range filters are answered by binary search instead of a full scan; rows
+appended out of date order wait in a small second index until enough of
+them have arrived to be merged at once. Range queries gather only their
+own rows from the columns. An
+AggregateCube of month x category x type totals and DailyTotals of the same
+sums per day are updated on every append.
+
+The ledger is append-only: a stored row is never updated or removed, and
+the only way to drop rows is to clear the whole ledger. Everything derived
+from it relies on this. The aggregates only ever add, and incremental
+followers such as the recurring payment detector and the search index keep
+the number of rows they have seen and read just the rows after them. A
+follower tells a cleared ledger apart from a grown one by its `generation`,
+which only `clear` increments.
+"""
+
+import numpy as np
+import pandas as pd
+
+from aggregates import AggregateCube, DailyTotals, month_key
+
+# Column order used everywhere the app displays or exports transactions
+COLUMNS = ["date", "category", "amount", "description", "type"]
+
+# Categories offered by the transaction forms, in display order
+CATEGORIES = ["Income", "Groceries", "Dining", "Entertainment", "Transport", "Shopping", "Utilities", "Other"]
+
+# Category given to transactions stored without one
+UNCATEGORIZED = "Other"
+
+# Transaction types
+TYPES = ["income", "expense"]
+
+# Number of rows pre-allocated per chunk
+CHUNK_SIZE = 4096
+
+# Back-dated rows are merged into the date index once they outnumber
+# 1/LATE_MERGE_RATIO of the rows already in it
+LATE_MERGE_RATIO = 16
+
+# Largest vocabulary that still fits a one-byte code
+MAX_CATEGORIES = np.iinfo(np.int8).max
+
+
+def to_cents(amount):
+    """Convert a euro amount to integer cents."""
+    return int(round(amount * 100))
+
+
+def to_datetime64(date):
+    """Convert a date, datetime or ISO string to numpy datetime64[ns]."""
+    return pd.Timestamp(date).to_datetime64().astype("datetime64[ns]")
+
+
+class TransactionLedger:
+    """Chunked, typed column buffers holding every transaction of a session.
+
+    Rows can only be appended. Columns are handed out as copies, and the
+    cached DataFrame must be treated as read-only.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.categories = list(CATEGORIES)
+        self._category_codes = {name: code for code, name in enumerate(self.categories)}
+        self._type_codes = {name: code for code, name in enumerate(TYPES)}
+        self._chunks = []
+        self._size = 0
+        self._frame = None
+        self._index_dates = self._sorted_dates = np.empty(0, dtype="datetime64[ns]")
+        self._index_rows = self._order = np.empty(0, dtype=np.int64)
+        self._late_dates = np.empty(0, dtype="datetime64[ns]")
+        self._late_order = np.empty(0, dtype=np.int64)
+        self.cube = AggregateCube()
+        self.daily = DailyTotals()
+        self.version = 0
+        self.generation = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def empty(self):
+        return self._size == 0
+
+    def _new_chunk(self):
+        return {
+            "date": np.empty(self.chunk_size, dtype="datetime64[ns]"),
+            "category": np.zeros(self.chunk_size, dtype=np.int8),
+            "amount": np.zeros(self.chunk_size, dtype=np.int64),
+            "description": np.empty(self.chunk_size, dtype=object),
+            "type": np.zeros(self.chunk_size, dtype=np.int8),
+        }
+
+    def category_code(self, category):
+        """Return the code for a category, registering it if it is new.
+
+        A missing category (None, NaN or an empty string) is UNCATEGORIZED.
+        """
+        if category is None or category == "" or (isinstance(category, float) and np.isnan(category)):
+            category = UNCATEGORIZED
+        code = self._category_codes.get(category)
+        if code is None:
+            if len(self.categories) >= MAX_CATEGORIES:
+                raise ValueError(f"Too many categories (maximum is {MAX_CATEGORIES})")
+            code = len(self.categories)
+            self.categories.append(category)
+            self._category_codes[category] = code
+        return code
+
+    def type_code(self, tx_type):
+        """Return the code for a transaction type."""
+        if tx_type not in self._type_codes:
+            raise ValueError(f"Unknown transaction type: {tx_type}")
+        return self._type_codes[tx_type]
+
+    def append(self, date, category, amount, description, tx_type):
+        """Append a single transaction in amortized O(1).
+
+        `amount` is given in euros and stored as integer cents. Every value
+        is validated before anything is stored, so a rejected transaction
+        leaves the ledger unchanged.
+        """
+        date = to_datetime64(date)
+        if pd.isna(date):
+            raise ValueError("Transaction date is missing")
+        type_code = self.type_code(tx_type)
+        cents = to_cents(amount)
+        # Last, as it registers new categories
+        category_code = self.category_code(category)
+
+        offset = self._size % self.chunk_size
+        if offset == 0:
+            self._chunks.append(self._new_chunk())
+        chunk = self._chunks[-1]
+
+        chunk["date"][offset] = date
+        chunk["category"][offset] = category_code
+        chunk["amount"][offset] = cents
+        chunk["description"][offset] = description
+        chunk["type"][offset] = type_code
+
+        self._size += 1
+        self._frame = None
+        self.version += 1
+        category = self.categories[category_code]
+        self.cube.add(month_key(date), category, tx_type, cents)
+        self.daily.add(date, category, tx_type, cents)
+
+    def extend(self, records):
+        """Append an iterable of transaction dictionaries."""
+        for record in records:
+            self.append(
+                record["date"],
+                record["category"],
+                record["amount"],
+                record.get("description", ""),
+                record["type"]
+            )
+
+    def column(self, name, start=0):
+        """Return a contiguous copy of a single raw column from row `start`.
+
+        Categories and types are returned as codes and amounts as cents.
+        Only the chunks holding the requested rows are copied.
+        """
+        if start >= self._size:
+            return self._new_chunk()[name][:0]
+
+        first = start // self.chunk_size
+        parts = [chunk[name] for chunk in self._chunks[first:]]
+        parts[-1] = parts[-1][:self._size - (len(self._chunks) - 1) * self.chunk_size]
+        parts[0] = parts[0][start - first * self.chunk_size:]
+        return np.concatenate(parts)
+
+    def values_at(self, name, rows):
+        """Return the raw values of a single column at the given row positions."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return self.column(name, self._size)
+
+        chunk_numbers, offsets = np.divmod(rows, self.chunk_size)
+        values = np.empty(len(rows), dtype=self._chunks[0][name].dtype)
+        # Group the rows by chunk, then gather each chunk's rows at once
+        order = np.argsort(chunk_numbers, kind="stable")
+        groups = np.split(order, np.flatnonzero(np.diff(chunk_numbers[order])) + 1)
+        for group in groups:
+            values[group] = self._chunks[chunk_numbers[group[0]]][name][offsets[group]]
+        return values
+
+    def _sync_date_index(self):
+        """Index the rows appended since the last call.
+
+        Rows dated after everything indexed extend the main index. Back-dated
+        rows are merged into the small late index instead, which is folded
+        into the main one only once it holds 1/LATE_MERGE_RATIO of its rows,
+        so a back-dated append does not copy the whole index every time.
+        """
+        indexed = len(self._order) + len(self._late_order)
+        if indexed == self._size:
+            return
+
+        new_dates = self.column("date", indexed)
+        new_order = np.argsort(new_dates, kind="stable")
+        new_dates = new_dates[new_order]
+        new_order += indexed
+
+        if len(self._order) == 0 or new_dates[0] >= self._sorted_dates[-1]:
+            self._extend_date_index(new_dates, new_order)
+            return
+
+        positions = np.searchsorted(self._late_dates, new_dates, side="right")
+        self._late_dates = np.insert(self._late_dates, positions, new_dates)
+        self._late_order = np.insert(self._late_order, positions, new_order)
+        if len(self._late_order) * LATE_MERGE_RATIO > len(self._order):
+            self._merge_late_rows()
+
+    def _extend_date_index(self, dates, rows):
+        """Append to the main index in amortized O(len(rows)), growing its buffers by doubling."""
+        used = len(self._order)
+        needed = used + len(rows)
+        if needed > len(self._index_rows):
+            capacity = max(needed, 2 * len(self._index_rows), self.chunk_size)
+            index_dates = np.empty(capacity, dtype="datetime64[ns]")
+            index_rows = np.empty(capacity, dtype=np.int64)
+            index_dates[:used] = self._sorted_dates
+            index_rows[:used] = self._order
+            self._index_dates, self._index_rows = index_dates, index_rows
+
+        # Only the unused tail is written, so slices handed out earlier stay valid
+        self._index_dates[used:needed] = dates
+        self._index_rows[used:needed] = rows
+        self._sorted_dates = self._index_dates[:needed]
+        self._order = self._index_rows[:needed]
+
+    def _merge_late_rows(self):
+        if len(self._late_order) == 0:
+            return
+        positions = np.searchsorted(self._sorted_dates, self._late_dates, side="right")
+        self._index_dates = self._sorted_dates = np.insert(self._sorted_dates, positions, self._late_dates)
+        self._index_rows = self._order = np.insert(self._order, positions, self._late_order)
+        self._late_dates = self._late_dates[:0]
+        self._late_order = self._late_order[:0]
+
+    def date_index(self):
+        """Return (sorted dates, row positions) covering every row.
+
+        Rows appended since the last call are merged into the existing
+        index, so only the new rows are sorted.
+        """
+        self._sync_date_index()
+        self._merge_late_rows()
+        return self._sorted_dates, self._order
+
+    def _date_ordered(self, rows, dates, newest_first=False):
+        """Return `rows` sorted by their `dates`, rows of the same date by position."""
+        order = np.lexsort((rows, dates))
+        return rows[order[::-1] if newest_first else order]
+
+    def rows_between(self, start, end):
+        """Return row positions with start <= date <= end, in date order."""
+        self._sync_date_index()
+        start, end = to_datetime64(start), to_datetime64(end)
+        lo = np.searchsorted(self._sorted_dates, start, side="left")
+        hi = np.searchsorted(self._sorted_dates, end, side="right")
+        late_lo = np.searchsorted(self._late_dates, start, side="left")
+        late_hi = np.searchsorted(self._late_dates, end, side="right")
+        if late_lo == late_hi:
+            return self._order[lo:hi]
+        return self._date_ordered(
+            np.concatenate([self._order[lo:hi], self._late_order[late_lo:late_hi]]),
+            np.concatenate([self._sorted_dates[lo:hi], self._late_dates[late_lo:late_hi]])
+        )
+
+    def between(self, start, end):
+        """Return the transactions dated from start to end (inclusive) in date order."""
+        return self.take(self.rows_between(start, end))
+
+    def take(self, rows):
+        """Return the transactions at the given row positions, in that order.
+
+        Only those rows are gathered from the columns, so a query right
+        after an append does not rebuild the whole DataFrame.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if self._frame is not None:
+            return self._frame.iloc[rows]
+        return pd.DataFrame({
+            "date": self.values_at("date", rows),
+            "category": pd.Categorical.from_codes(self.values_at("category", rows), categories=self.categories),
+            "amount": self.values_at("amount", rows) / 100,
+            "description": self.values_at("description", rows),
+            "type": pd.Categorical.from_codes(self.values_at("type", rows), categories=TYPES),
+        }, index=rows)
+
+    def latest(self, count):
+        """Return the `count` most recent transactions, newest first."""
+        if count <= 0:
+            return self.take([])
+        # The newest rows are among the last `count` of either index
+        self._sync_date_index()
+        rows = self._date_ordered(
+            np.concatenate([self._order[-count:], self._late_order[-count:]]),
+            np.concatenate([self._sorted_dates[-count:], self._late_dates[-count:]]),
+            newest_first=True
+        )
+        return self.take(rows[:count])
+
+    def to_frame(self):
+        """Return the transactions as a DataFrame, cached until the next write.
+
+        Dates are datetime64[ns], category and type are categoricals and the
+        amount is in euros.
+        """
+        if self._frame is None:
+            self._frame = pd.DataFrame({
+                "date": self.column("date"),
+                "category": pd.Categorical.from_codes(self.column("category"), categories=self.categories),
+                "amount": self.column("amount") / 100,
+                "description": self.column("description"),
+                "type": pd.Categorical.from_codes(self.column("type"), categories=TYPES),
+            })
+        return self._frame
+
+    def to_records(self):
+        """Return the transactions as JSON-friendly dictionaries for export."""
+        records = self.to_frame().astype({"category": object, "type": object})
+        records["date"] = records["date"].dt.strftime("%Y-%m-%d")
+        return records.to_dict(orient="records")
+
+    def clear(self):
+        """Drop every row; followers notice through the new generation."""
+        self._chunks = []
+        self._size = 0
+        self._frame = None
+        self._index_dates = self._sorted_dates = np.empty(0, dtype="datetime64[ns]")
+        self._index_rows = self._order = np.empty(0, dtype=np.int64)
+        self._late_dates = np.empty(0, dtype="datetime64[ns]")
+        self._late_order = np.empty(0, dtype=np.int64)
+        self.cube = AggregateCube()
+        self.daily = DailyTotals()
+        self.version += 1
+        self.generation += 1
@@ -14,8 +14,21 @@ import plotly.express as px
 from PIL import Image
 from datetime import datetime, timedelta
 import random
-from sklearn.linear_model import LinearRegression
 import time
+from ledger import CATEGORIES, TransactionLedger, to_cents
+from roundups import ROUNDUP_MULTIPLIERS, compute_roundups
+from recurring import RecurringDetector
+from search import DescriptionIndex
+from sweeps import RoundupSweeper
+from forecast import TOTAL_COLUMN, forecast_expenses
+from goalsim import INVESTMENT_STRATEGIES, TARGET_CONFIDENCE, project_goals
+from prices import PriceStore, format_return
+from assistant import answer_question, parse_question
+from allocation import allocation_names, determine_allocations
+from rules import RULE_KINDS, RuleCache, validate_rule
+from cache import LRUCache
+import storage
+from storage import get_user_risk_preference, update_risk_preference
 
 # Set page configuration
 st.set_page_config(
@@ -120,7 +133,7 @@ if 'investments' not in st.session_state:
 if 'goals' not in st.session_state:
     st.session_state.goals = []
 if 'transactions' not in st.session_state:
-    st.session_state.transactions = pd.DataFrame(columns=["date", "category", "amount", "description", "type"])
+    st.session_state.transactions = TransactionLedger()
 if 'insights' not in st.session_state:
     st.session_state.insights = []
 if 'roundups' not in st.session_state:
@@ -132,6 +145,64 @@ if 'first_login' not in st.session_state:
 def navigate_to(page):
     st.session_state.current_page = page
 
+# Load a user's persisted state into the session
+def load_user_session(username):
+    user = storage.get_or_create_user(username)
+    st.session_state.user = {
+        "id": user["id"],
+        "username": user["username"],
+        "risk_preference": user["risk_preference"]
+    }
+
+    st.session_state.subscription = user["subscription"]
+    st.session_state.balance = user["balance_cents"] / 100
+    st.session_state.savings = user["savings_cents"] / 100
+    st.session_state.investments = user["investments_cents"] / 100
+    st.session_state.roundups = user["roundups_cents"] / 100
+    st.session_state.first_login = bool(user["first_login"])
+
+    st.session_state.transactions = TransactionLedger()
+    st.session_state.transactions.extend(storage.load_transactions(user["id"]))
+    st.session_state.goals = storage.load_goals(user["id"])
+    st.session_state.saved_goals = [dict(goal) for goal in st.session_state.goals]
+    st.session_state.category_rules = storage.load_category_rules(user["id"])
+    touch_goals()
+    st.session_state.insights_cache = LRUCache(maxsize=INSIGHTS_CACHE_SIZE)
+
+# Function to record a round-up for the current user
+def record_roundup(amount_cents):
+    st.session_state.roundups += amount_cents / 100
+    if 'user' in st.session_state:
+        RoundupSweeper().accrue(st.session_state.user["id"], amount_cents)
+
+# Function to credit round-ups swept by the scheduled sweep job to the current user's savings
+def collect_swept_roundups():
+    if 'user' not in st.session_state:
+        return
+
+    credited_cents = storage.credit_swept_roundups(st.session_state.user["id"])
+    if credited_cents:
+        st.session_state.savings += credited_cents / 100
+
+# Write the session's account values and goals back to storage
+def save_user_session():
+    if 'user' not in st.session_state:
+        return
+
+    storage.save_user_state(
+        st.session_state.user["id"],
+        st.session_state.subscription,
+        st.session_state.balance,
+        st.session_state.savings,
+        st.session_state.investments,
+        st.session_state.roundups,
+        st.session_state.first_login
+    )
+    # Goals are only written when they changed since they were last loaded or saved
+    if st.session_state.goals != st.session_state.get('saved_goals'):
+        storage.save_goals(st.session_state.user["id"], st.session_state.goals)
+        st.session_state.saved_goals = [dict(goal) for goal in st.session_state.goals]
+
 # Authentication functions
 def login():
     st.markdown("<h1 style='text-align: center;'>neuro</h1>", unsafe_allow_html=True)
@@ -216,27 +287,30 @@ def onboarding():
                 tx_type = "income" if transaction_category == "Income" else "expense"
                 tx_amount = transaction_amount if tx_type == "income" else -transaction_amount
 
-                # Create a new row for the transaction
-                new_tx = pd.DataFrame({
-                    "date": [transaction_date.strftime("%Y-%m-%d")],
-                    "category": [transaction_category],
-                    "amount": [tx_amount],
-                    "description": [transaction_description],
-                    "type": [tx_type]
-                })
-
-                # Append to existing transactions or create a new DataFrame
-                if st.session_state.transactions.empty:
-                    st.session_state.transactions = new_tx
-                else:
-                    st.session_state.transactions = pd.concat([st.session_state.transactions, new_tx], ignore_index=True)
+                # Append the transaction to the ledger
+                st.session_state.transactions.append(
+                    transaction_date,
+                    transaction_category,
+                    tx_amount,
+                    transaction_description,
+                    tx_type
+                )
+                if 'user' in st.session_state:
+                    storage.save_transaction(
+                        st.session_state.user["id"],
+                        transaction_date,
+                        transaction_category,
+                        tx_amount,
+                        transaction_description,
+                        tx_type
+                    )
 
                 st.success("Transaction added!")
 
         # Display added transactions
         if not st.session_state.transactions.empty:
             st.subheader("Your Added Transactions")
-            st.dataframe(st.session_state.transactions[["date", "category", "amount", "description"]])
+            st.dataframe(st.session_state.transactions.to_frame()[["date", "category", "amount", "description"]])
 
     with tab3:
         st.header("Financial Goals")
@@ -261,6 +335,7 @@ def onboarding():
                 }
 
                 st.session_state.goals.append(new_goal)
+                touch_goals()
                 st.success(f"Goal '{goal_name}' added!")
 
         # Display added goals
@@ -302,37 +377,9 @@ def onboarding():
         st.session_state.current_page = 'dashboard'
         st.rerun()
 
-def get_user_risk_preference(user_id):
-    conn = sqlite3.connect('startive.db')
-    c = conn.cursor()
-
-    c.execute("SELECT risk_preference FROM users WHERE id = ?", (user_id,))
-    risk = c.fetchone()[0]
-
-    conn.close()
-    return risk
-
-def determine_allocation(risk_preference):
+def determine_allocation(risk_preference, rng=None):
     """Determine allocation type based on user risk preference"""
-    if risk_preference == 'conservative':
-        options = ['high-yield savings'] * 7 + ['ETF'] * 3
-    elif risk_preference == 'moderate':
-        options = ['high-yield savings'] * 5 + ['ETF'] * 4 + ['crypto'] * 1
-    elif risk_preference == 'aggressive':
-        options = ['high-yield savings'] * 3 + ['ETF'] * 5 + ['crypto'] * 2
-    else:
-        options = ['high-yield savings'] * 5 + ['ETF'] * 5
-
-    return np.random.choice(options)
-    
-def update_risk_preference(user_id, risk_preference):
-    conn = sqlite3.connect('startive.db')
-    c = conn.cursor()
-
-    c.execute("UPDATE users SET risk_preference = ? WHERE id = ?", (risk_preference, user_id))
-
-    conn.commit()
-    conn.close()
+    return str(allocation_names(determine_allocations(risk_preference, 1, rng))[0])
 
 # Only show welcome page if not logged in
 if not st.session_state.logged_in:
@@ -352,51 +399,41 @@ if not st.session_state.logged_in:
 
     # Sample data visualization that doesn't depend on sklearn
     st.subheader("How Startive Works")
-            # Profile tabs
-        tab1, tab2 = st.tabs(["Risk Profile""])
-
-        with tab1:
-            st.subheader("Investment Risk Profile")
-            current_risk = st.session_state.user['risk_preference']
-            risk_options = ["conservative", "moderate", "aggressive"]
-            risk_descriptions = {
-                "conservative": "Lower risk, steady returns. Focus on high-yield savings and stable ETFs.",
-                "moderate": "Balanced risk and returns. Mix of savings, ETFs, and minimal crypto.",
-                "aggressive": "Higher risk, potential for higher returns. More allocation to ETFs and crypto."
-            }
-
-            selected_risk = st.radio("Select your risk preference:", risk_options, index=risk_options.index(current_risk))
-            st.markdown(f"**{risk_descriptions[selected_risk]}**")
-
-            if st.button("Update Risk Profile") and selected_risk != current_risk:
-                update_risk_preference(st.session_state.user['id'], selected_risk)
-                st.session_state.user['risk_preference'] = selected_risk
-                st.success("Risk profile updated successfully!")
-                st.rerun()
-
-
 
 
 # Function to generate insights based on user data
-def generate_insights():
+def compute_insights():
     insights = []
 
     # Only generate insights if we have transactions
     if not st.session_state.transactions.empty:
-        expenses = st.session_state.transactions[st.session_state.transactions['type'] == 'expense']
-        if not expenses.empty:
-            # Most expensive category
-            expense_by_category = expenses.groupby('category')['amount'].sum().abs()
-            if not expense_by_category.empty:
-                top_category = expense_by_category.idxmax()
-                top_amount = expense_by_category.max()
-                insights.append(f"Your highest spending category is {top_category} (€{top_amount:.2f}).")
+        cube = st.session_state.transactions.cube
+        daily = st.session_state.transactions.daily
+        today = datetime.now().date()
+
+        # Most expensive category of the last 30 days
+        expense_by_category = daily.category_totals('expense', today - timedelta(days=29), today)
+        if expense_by_category:
+            top_category = max(expense_by_category, key=expense_by_category.get)
+            top_amount = expense_by_category[top_category]
+            insights.append(f"Your highest spending category in the last 30 days is {top_category} (€{top_amount:.2f}).")
+
+        # Spending so far this month against the same days of last month
+        month_start = today.replace(day=1)
+        previous_end = month_start - timedelta(days=1)
+        previous_start = previous_end.replace(day=1)
+        # Negated in cents, as negating a zero euro total would give -0.0
+        spent_this_month = -daily.total_cents('expense', month_start, today) / 100
+        spent_last_month = -daily.total_cents('expense', previous_start, min(previous_start + (today - month_start), previous_end)) / 100
+        if spent_this_month > 0 and spent_last_month > 0:
+            change = (spent_this_month - spent_last_month) / spent_last_month * 100
+            direction = "more" if change > 0 else "less"
+            insights.append(f"You've spent €{spent_this_month:.2f} so far this month, {abs(change):.0f}% {direction} than by this day last month.")
 
         # If we have income transactions
-        income = st.session_state.transactions[st.session_state.transactions['type'] == 'income']
-        if not income.empty:
-            total_income = income['amount'].sum()
-            total_expenses = expenses['amount'].sum().abs() if not expenses.empty else 0
+        if cube.type_count('income'):
+            total_income = cube.type_total('income')
+            total_expenses = abs(cube.type_total('expense'))
 
             if total_income > 0:
                 savings_rate = ((total_income - total_expenses) / total_income) * 100
@@ -423,30 +460,102 @@ def generate_insights():
 
     return insights[:3]  # Return at most 3 insights
 
-# Function to predict future expenses using a simple linear regression model
-def predict_future_expenses():
-    if not st.session_state.transactions.empty:
-        # Prepare data for prediction
-        transactions_df = st.session_state.transactions.copy()
-        transactions_df['date'] = pd.to_datetime(transactions_df['date'])
-        transactions_df['month'] = transactions_df['date'].dt.to_period('M').astype(str)
-
-        # Group by month and sum expenses
-        monthly_expenses = transactions_df[transactions_df['type'] == 'expense'].groupby('month')['amount'].sum().reset_index()
-        monthly_expenses['amount'] = monthly_expenses['amount'].abs()  # Make sure amounts are positive
+# Number of insight results remembered per session
+INSIGHTS_CACHE_SIZE = 4
 
-        # Create a numerical month index for regression
-        monthly_expenses['month_index'] = np.arange(len(monthly_expenses))
+# Function to mark the goals as changed so derived data is recomputed
+def touch_goals():
+    st.session_state.goals_version = st.session_state.get('goals_version', 0) + 1
 
-        # Train a linear regression model
-        model = LinearRegression()
-        model.fit(monthly_expenses[['month_index']], monthly_expenses['amount'])
-
-        # Predict next 3 months
-        future_months = np.array([[len(monthly_expenses) + i] for i in range(1, 4)])
-        predictions = model.predict(future_months)
+# Function to return insights, recomputing them only when transactions, goals or the date changed
+def generate_insights():
+    if 'insights_cache' not in st.session_state:
+        st.session_state.insights_cache = LRUCache(maxsize=INSIGHTS_CACHE_SIZE)
+
+    # Insights cover recent periods, so they also change with the date
+    key = (st.session_state.transactions.version, st.session_state.get('goals_version', 0), datetime.now().date())
+    return st.session_state.insights_cache.get_or_compute(key, compute_insights)
+
+# Process-wide price history of the asset classes, memory-mapped once
+@st.cache_resource
+def get_price_store():
+    return PriceStore()
+
+# Function to return the month-to-date return of a risk preference's strategy and the YTD return of the equity ETF
+def investment_returns(risk_preference):
+    # Every strategy is backtested in the same pass, so all users share one cached result
+    names = list(INVESTMENT_STRATEGIES)
+    returns = get_price_store().period_returns([INVESTMENT_STRATEGIES[name] for name in names] + [{"stocks": 1.0}])
+    if returns is None:
+        return None, None
+    return returns[names.index(risk_preference)]["month"], returns[-1]["ytd"]
+
+# Number of goal projections remembered per session
+GOAL_PROJECTION_CACHE_SIZE = 4
+
+# Function to simulate the chance of reaching each goal by its target date
+def project_goal_outcomes():
+    if 'goal_projection_cache' not in st.session_state:
+        st.session_state.goal_projection_cache = LRUCache(maxsize=GOAL_PROJECTION_CACHE_SIZE)
+
+    risk_preference = st.session_state.user['risk_preference']
+    key = (
+        st.session_state.transactions.version,
+        st.session_state.get('goals_version', 0),
+        risk_preference,
+        datetime.now().date()
+    )
+    return st.session_state.goal_projection_cache.get_or_compute(key, lambda: project_goals(
+        st.session_state.goals,
+        st.session_state.transactions.cube,
+        INVESTMENT_STRATEGIES[risk_preference],
+        datetime.now()
+    ))
+
+# Function to detect recurring payments, scanning only transactions added since the last call
+def detect_recurring_payments():
+    detector = st.session_state.get('recurring_detector')
+    if detector is None or detector.ledger is not st.session_state.transactions:
+        detector = RecurringDetector(st.session_state.transactions)
+        st.session_state.recurring_detector = detector
+
+    detector.sync()
+    return detector.recurring(as_of=datetime.now())
+
+# Function to search the transaction history by description text, date range and categories
+def search_transactions(query, start_date, end_date, categories=None):
+    index = st.session_state.get('description_index')
+    if index is None or index.ledger is not st.session_state.transactions:
+        index = DescriptionIndex(st.session_state.transactions)
+        st.session_state.description_index = index
+
+    index.sync()
+    rows = index.filter(query, start_date, end_date, categories)
+    return st.session_state.transactions.take(rows)
+
+# Function to total the income and expenses of a date range and categories from the ledger's daily prefix sums
+def period_totals(start_date, end_date, categories=None):
+    daily = st.session_state.transactions.daily
+    if categories is None:
+        return daily.total('income', start_date, end_date), -daily.total_cents('expense', start_date, end_date) / 100
+
+    income = sum(daily.total_cents('income', start_date, end_date, category) for category in categories) / 100
+    expenses = -sum(daily.total_cents('expense', start_date, end_date, category) for category in categories) / 100
+    return income, expenses
+
+# Number of expense forecasts remembered per session
+FORECAST_CACHE_SIZE = 4
+
+# Function to forecast the next 3 months of expenses for every category and the total
+def predict_future_expenses():
+    if not st.session_state.transactions.empty:
+        if 'forecast_cache' not in st.session_state:
+            st.session_state.forecast_cache = LRUCache(maxsize=FORECAST_CACHE_SIZE)
 
-        return predictions
+        # Refit only when a month is added or a monthly category total changes
+        cube = st.session_state.transactions.cube
+        key = cube.monthly_fingerprint('expense')
+        return st.session_state.forecast_cache.get_or_compute(key, lambda: forecast_expenses(cube))
     return None
 
 # Dashboard components
@@ -481,12 +590,14 @@ def display_dashboard():
         </div>
         """, unsafe_allow_html=True)
 
+    month_return, _ = investment_returns(st.session_state.user['risk_preference'])
+
     with col3:
         st.markdown(f"""
         <div class="secondary-card">
             <h4 style="margin-top: 0;">Investments</h4>
             <h2 style="margin: 0;">€{st.session_state.investments:.2f}</h2>
-            <p>+5.2% this month</p>
+            <p>{format_return(month_return, "this month")}</p>
         </div>
         """, unsafe_allow_html=True)
 
@@ -509,7 +620,7 @@ def display_dashboard():
     with col2:
         st.markdown("<div style='height: 100%; display: flex; align-items: center; justify-content: center;'>", unsafe_allow_html=True)
         if st.button("Boost Round-up"):
-            st.session_state.roundups += 5.0
+            record_roundup(500)
             st.rerun()
         st.markdown("</div>", unsafe_allow_html=True)
 
@@ -520,7 +631,7 @@ def display_dashboard():
         st.markdown("<h3>Recent Transactions</h3>", unsafe_allow_html=True)
 
         if not st.session_state.transactions.empty:
-            recent_transactions = st.session_state.transactions.sort_values(by="date", ascending=False).head(5)
+            recent_transactions = st.session_state.transactions.latest(5)
 
             for _, tx in recent_transactions.iterrows():
                 sign = "+" if tx["amount"] > 0 else "-"
@@ -530,7 +641,7 @@ def display_dashboard():
                 <div style="padding: 0.75rem; border-bottom: 1px solid #e0e0e0; display: flex; justify-content: space-between;">
                     <div>
                         <p style="margin: 0; font-weight: 500;">{tx["description"]}</p>
-                        <p style="margin: 0; color: gray; font-size: 0.8rem;">{tx["date"]} • {tx["category"]}</p>
+                        <p style="margin: 0; color: gray; font-size: 0.8rem;">{tx["date"]:%Y-%m-%d} • {tx["category"]}</p>
                     </div>
                     <div>
                         <p style="margin: 0; font-weight: 500; color: {color};">{sign}€{abs(tx["amount"]):.2f}</p>
@@ -549,10 +660,9 @@ def display_dashboard():
 
         # Prepare data for the chart
         if not st.session_state.transactions.empty:
-            expense_data = st.session_state.transactions[st.session_state.transactions["type"] == "expense"]
+            category_spending = st.session_state.transactions.cube.category_frame("expense")
 
-            if not expense_data.empty:
-                category_spending = expense_data.groupby("category")["amount"].sum().abs().reset_index()
+            if not category_spending.empty:
 
                 fig = px.pie(
                     category_spending,
@@ -573,7 +683,7 @@ def display_dashboard():
 
     col1, col2, col3 = st.columns(3)
 
-    for i, (col, insight) in enumerate(zip([col1, col2, col3], st.session_state.insights)):
+    for i, (col, insight) in enumerate(zip([col1, col2, col3], generate_insights())):
         with col:
             st.markdown(f"""
             <div style="padding: 1rem; background-color: #f8f9fa; border-radius: 10px; height: 100%;">
@@ -586,8 +696,12 @@ def display_dashboard():
     predictions = predict_future_expenses()
     if predictions is not None:
         st.write("Predicted expenses for the next 3 months:")
-        for i, prediction in enumerate(predictions, start=1):
-            st.write(f"Month {i}: €{prediction:.2f}")
+        for month, prediction in predictions[TOTAL_COLUMN].items():
+            st.write(f"{month}: €{prediction:.2f}")
+
+        by_category = predictions.drop(columns=TOTAL_COLUMN).T
+        by_category = by_category[by_category.sum(axis=1) > 0]
+        st.dataframe(by_category, use_container_width=True)
     else:
         st.info("Not enough data to make predictions.")
 
@@ -658,11 +772,12 @@ def display_savings():
 
             roundup_multiplier = st.select_slider(
                 "Round-up multiplier",
-                options=[1, 2, 3, 5, 10],
-                value=1
+                options=ROUNDUP_MULTIPLIERS,
+                value=st.session_state.get('roundup_multiplier', 1)
             )
 
             if st.button("Save Settings"):
+                st.session_state.roundup_multiplier = roundup_multiplier
                 st.success("Savings settings updated successfully!")
 
             st.markdown(f"""
@@ -677,12 +792,14 @@ def display_savings():
         if st.session_state.subscription in ['Pro', 'Elite']:
             col1, col2 = st.columns([2, 1])
 
+            month_return, etf_ytd = investment_returns(st.session_state.user['risk_preference'])
+
             with col1:
                 st.markdown(f"""
                 <div class="highlight-card">
                     <h4 style="margin-top: 0;">Total Investments</h4>
                     <h2 style="margin: 0;">€{st.session_state.investments:.2f}</h2>
-                    <p>+5.2% this month</p>
+                    <p>{format_return(month_return, "this month")}</p>
                 </div>
                 """, unsafe_allow_html=True)
 
@@ -700,11 +817,11 @@ def display_savings():
             with col2:
                 st.markdown("<h3>AI Investment Suggestions</h3>", unsafe_allow_html=True)
 
-                st.markdown("""
+                st.markdown(f"""
                 <div style="padding: 1rem; background-color: #f8f9fa; border-radius: 10px; margin-bottom: 1rem;">
                     <h4 style="margin-top: 0;">Suggested ETF</h4>
                     <p style="margin: 0; font-weight: 500;">Vanguard FTSE All-World</p>
-                    <p style="margin: 0; color: green;">+7.2% YTD</p>
+                    <p style="margin: 0; color: {'green' if (etf_ytd or 0) >= 0 else 'red'};">{format_return(etf_ytd, "YTD")}</p>
                     <p style="margin-top: 0.5rem; font-size: 0.9rem;">Global diversification with low fees</p>
                 </div>
                 """, unsafe_allow_html=True)
@@ -733,6 +850,81 @@ def display_savings():
                 navigate_to("subscription")
                 st.rerun()
 
+# Category option that lets the user's rules choose the category
+AUTO_CATEGORY = "Auto (my rules)"
+
+# Process-wide cache of compiled categorization rules
+@st.cache_resource
+def get_rule_cache():
+    return RuleCache()
+
+# Function to categorize transactions with the current user's rules, None where no rule applies
+def categorize_by_rules(transactions):
+    rules = st.session_state.get('category_rules', [])
+    if not rules:
+        return [None] * len(transactions)
+    rule_set = get_rule_cache().get(st.session_state.user['id'] if 'user' in st.session_state else 'anonymous', rules)
+    return rule_set.categorize(transactions)
+
+# Function to persist the current user's rule list after a change
+def save_category_rules():
+    if 'user' in st.session_state:
+        storage.save_category_rules(st.session_state.user["id"], st.session_state.category_rules)
+
+# Function to manage the user's categorization rules
+def display_category_rules():
+    if 'category_rules' not in st.session_state:
+        st.session_state.category_rules = []
+    rules = st.session_state.category_rules
+
+    if rules:
+        for i, rule in enumerate(rules):
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                bounds = ""
+                if rule.get("min_amount") is not None or rule.get("max_amount") is not None:
+                    low = rule.get("min_amount") or 0
+                    high = f"€{rule['max_amount']:.2f}" if rule.get("max_amount") is not None else "any"
+                    bounds = f" (€{low:.2f} to {high})"
+                match = "matches" if rule.get("kind") == "regex" else "contains"
+                st.write(f"{i + 1}. Description {match} '{rule['pattern']}'{bounds} → {rule['category']}")
+            with col2:
+                if st.button("Remove", key=f"remove_rule_{i}"):
+                    rules.pop(i)
+                    save_category_rules()
+                    st.rerun()
+    else:
+        st.info("No rules yet. Rules categorize transactions by their description when you pick 'Auto'.")
+
+    with st.form("add_category_rule"):
+        col1, col2 = st.columns(2)
+
+        with col1:
+            rule_pattern = st.text_input("Description text", placeholder="e.g., coffee, netflix")
+            rule_kind = st.selectbox("Match type", RULE_KINDS, format_func=lambda kind: "Contains text" if kind == "contains" else "Regular expression")
+            rule_category = st.selectbox("Category", CATEGORIES)
+
+        with col2:
+            rule_min = st.number_input("Minimum amount (€)", min_value=0.0, value=0.0, step=5.0)
+            rule_max = st.number_input("Maximum amount (€, 0 for no limit)", min_value=0.0, value=0.0, step=5.0)
+
+        if st.form_submit_button("Add Rule"):
+            rule = {
+                "category": rule_category,
+                "pattern": rule_pattern.strip(),
+                "kind": rule_kind,
+                "min_amount": rule_min or None,
+                "max_amount": rule_max or None
+            }
+            error = validate_rule(rule)
+            if error:
+                st.error(error)
+            else:
+                rules.append(rule)
+                save_category_rules()
+                st.success("Rule added!")
+                st.rerun()
+
 # Transactions and analysis components
 def display_transactions():
     st.markdown("<h2>Transactions & Analysis</h2>", unsafe_allow_html=True)
@@ -748,10 +940,7 @@ def display_transactions():
 
             with col1:
                 transaction_date = st.date_input("Date", value=datetime.now())
-                transaction_category = st.selectbox(
-                    "Category",
-                    ["Income", "Groceries", "Dining", "Entertainment", "Transport", "Shopping", "Utilities", "Other"]
-                )
+                transaction_category = st.selectbox("Category", CATEGORIES + [AUTO_CATEGORY])
 
             with col2:
                 transaction_amount = st.number_input("Amount", value=0.0, step=10.0)
@@ -760,24 +949,32 @@ def display_transactions():
             submit_tx = st.form_submit_button("Add Transaction")
 
             if submit_tx:
+                # Let the user's categorization rules pick the category
+                if transaction_category == AUTO_CATEGORY:
+                    matched = categorize_by_rules([{"description": transaction_description, "amount": -transaction_amount}])[0]
+                    transaction_category = matched or "Other"
+
                 # Determine transaction type
                 tx_type = "income" if transaction_category == "Income" else "expense"
                 tx_amount = transaction_amount if tx_type == "income" else -transaction_amount
 
-                # Create a new row for the transaction
-                new_tx = pd.DataFrame({
-                    "date": [transaction_date.strftime("%Y-%m-%d")],
-                    "category": [transaction_category],
-                    "amount": [tx_amount],
-                    "description": [transaction_description],
-                    "type": [tx_type]
-                })
-
-                # Append to existing transactions or create a new DataFrame
-                if st.session_state.transactions.empty:
-                    st.session_state.transactions = new_tx
-                else:
-                    st.session_state.transactions = pd.concat([st.session_state.transactions, new_tx], ignore_index=True)
+                # Append the transaction to the ledger
+                st.session_state.transactions.append(
+                    transaction_date,
+                    transaction_category,
+                    tx_amount,
+                    transaction_description,
+                    tx_type
+                )
+                if 'user' in st.session_state:
+                    storage.save_transaction(
+                        st.session_state.user["id"],
+                        transaction_date,
+                        transaction_category,
+                        tx_amount,
+                        transaction_description,
+                        tx_type
+                    )
 
                 # Update balance
                 if tx_type == "income":
@@ -787,10 +984,8 @@ def display_transactions():
 
                 # Update roundups for expenses
                 if tx_type == "expense":
-                    cents = transaction_amount % 1
-                    if cents > 0:
-                        roundup = 1 - cents
-                        st.session_state.roundups += roundup
+                    _, roundup_cents = compute_roundups([to_cents(transaction_amount)], st.session_state.get('roundup_multiplier', 1))
+                    record_roundup(roundup_cents)
 
                 st.success("Transaction added successfully!")
                 st.rerun()
@@ -813,21 +1008,29 @@ def display_transactions():
                 default=["All"]
             )
 
+        filter_query = st.text_input("Search descriptions", placeholder="e.g. netflix, amaz prime")
+
         # Apply filters
         if not st.session_state.transactions.empty:
-            filtered_transactions = st.session_state.transactions.copy()
-
-            # Convert date strings to datetime objects for comparison
-            filtered_transactions['date'] = pd.to_datetime(filtered_transactions['date'])
-
-            # Date filter
-            mask = (filtered_transactions['date'] >= pd.Timestamp(filter_start_date)) & \
-                   (filtered_transactions['date'] <= pd.Timestamp(filter_end_date))
-            filtered_transactions = filtered_transactions[mask]
+            # Description search, date range and categories are all answered from the ledger's indexes
+            filtered_transactions = search_transactions(
+                filter_query,
+                filter_start_date,
+                filter_end_date,
+                None if "All" in filter_category else filter_category
+            )
 
-            # Category filter
-            if "All" not in filter_category:
-                filtered_transactions = filtered_transactions[filtered_transactions['category'].isin(filter_category)]
+            # Summary of the filtered period; without a search it needs no rows at all
+            if filter_query.strip():
+                summary_income = filtered_transactions.loc[filtered_transactions['type'] == 'income', 'amount'].sum()
+                summary_expenses = -filtered_transactions.loc[filtered_transactions['type'] == 'expense', 'amount'].sum()
+            else:
+                summary_income, summary_expenses = period_totals(
+                    filter_start_date,
+                    filter_end_date,
+                    None if "All" in filter_category else filter_category
+                )
+            st.caption(f"Income €{summary_income:.2f} · Expenses €{summary_expenses:.2f} · Net €{summary_income - summary_expenses:.2f}")
 
             # Display filtered transactions
             if not filtered_transactions.empty:
@@ -859,29 +1062,10 @@ def display_transactions():
             # Prepare data for cash flow analysis
             st.subheader("Monthly Cash Flow")
 
-            # Convert date to datetime if it's not already
-            transactions_df = st.session_state.transactions.copy()
-            transactions_df['date'] = pd.to_datetime(transactions_df['date'])
-
-            # Extract month for grouping
-            transactions_df['month'] = transactions_df['date'].dt.strftime('%Y-%m')
-
-            # Group by month and transaction type
-            monthly_flow = transactions_df.groupby(['month', 'type'])['amount'].sum().reset_index()
+            cube = st.session_state.transactions.cube
 
-            # Pivot to get income and expenses side by side
-            pivot_df = monthly_flow.pivot_table(
-                index='month',
-                columns='type',
-                values='amount',
-                aggfunc='sum'
-            ).reset_index().fillna(0)
-
-            # Make sure both columns exist
-            if 'income' not in pivot_df.columns:
-                pivot_df['income'] = 0
-            if 'expense' not in pivot_df.columns:
-                pivot_df['expense'] = 0
+            # Income and expenses per month, side by side
+            pivot_df = cube.monthly_flow()
 
             # Calculate net flow
             pivot_df['net'] = pivot_df['income'] + pivot_df['expense']  # expense is already negative
@@ -906,13 +1090,10 @@ def display_transactions():
             # Category breakdown
             st.subheader("Expense Breakdown by Category")
 
-            # Filter for expenses only
-            expenses = transactions_df[transactions_df['type'] == 'expense']
+            # Expense totals by category, largest first
+            category_expenses = cube.category_frame('expense')
 
-            if not expenses.empty:
-                # Group by category
-                category_expenses = expenses.groupby('category')['amount'].sum().abs().reset_index()
-                category_expenses = category_expenses.sort_values('amount', ascending=False)
+            if not category_expenses.empty:
 
                 fig = px.bar(
                     category_expenses,
@@ -929,8 +1110,8 @@ def display_transactions():
                 # Spending trends over time
                 st.subheader("Spending Trends")
 
-                # Group by month and category
-                category_month = expenses.groupby(['month', 'category'])['amount'].sum().abs().reset_index()
+                # Expense totals by month and category
+                category_month = cube.monthly_category_frame('expense')
 
                 fig = px.line(
                     category_month,
@@ -951,7 +1132,7 @@ def display_transactions():
         if st.session_state.subscription in ['Pro', 'Elite']:
             if st.button("Generate AI Spending Analysis"):
                 with st.spinner("Analyzing your spending patterns..."):
-                    time.sleep(2)  # Simulate AI processing
+                    recurring_payments = detect_recurring_payments()
 
                 st.success("Analysis complete!")
 
@@ -961,9 +1142,14 @@ def display_transactions():
                 1. **Unusual Spending**: Your entertainment spending is 40% higher than your average. Consider setting a budget in this category.
 
                 2. **Savings Opportunity**: You spend an average of €45 per week on coffee shops. Reducing this by half could save you €1,170 per year.
-
-                3. **Recurring Payments**: We've detected 3 subscription services totaling €29.97/month that you haven't used in the last 60 days.
                 """)
+
+                if recurring_payments:
+                    monthly_total = sum(payment["monthly_cost"] for payment in recurring_payments)
+                    payment_names = ", ".join(payment["description"] for payment in recurring_payments)
+                    st.markdown(f"3. **Recurring Payments**: We've detected {len(recurring_payments)} recurring payments totaling €{monthly_total:.2f}/month: {payment_names}.")
+                else:
+                    st.markdown("3. **Recurring Payments**: We haven't detected any recurring payments in your transaction history yet.")
         else:
             st.warning("Upgrade to Pro or Elite to access AI-powered spending analysis.")
             if st.button("Upgrade Subscription"):
@@ -1000,6 +1186,7 @@ def display_goals():
             }
 
             st.session_state.goals.append(new_goal)
+            touch_goals()
             st.success(f"Goal '{goal_name}' added!")
             st.rerun()
 
@@ -1007,16 +1194,11 @@ def display_goals():
     if st.session_state.goals:
         st.subheader("Your Financial Goals")
 
+        projections = project_goal_outcomes()
+
         for i, goal in enumerate(st.session_state.goals):
             progress = (goal["current"] / goal["target"]) * 100
-            months_to_target = None
-
-            # Calculate time to target
-            if goal["date"]:
-                target_date = datetime.strptime(goal["date"], "%Y-%m-%d")
-                today = datetime.now()
-                days_to_target = (target_date - today).days
-                months_to_target = max(days_to_target / 30, 0)
+            projection = projections[i]
 
             col1, col2, col3 = st.columns([3, 1, 1])
 
@@ -1034,10 +1216,10 @@ def display_goals():
                     <p style="margin-top: 0.5rem;">Target date: {goal["date"]}</p>
                     """, unsafe_allow_html=True)
 
-                if months_to_target is not None and months_to_target > 0:
-                    monthly_contribution = (goal["target"] - goal["current"]) / months_to_target
+                if projection["months"] > 0:
                     st.markdown(f"""
-                    <p>Suggested monthly contribution: <strong>€{monthly_contribution:.2f}</strong></p>
+                    <p>Chance of reaching it on time at €{projection["planned_contribution"]:.2f}/month: <strong>{projection["probability"]:.0%}</strong></p>
+                    <p>Suggested monthly contribution: <strong>€{projection["required_contribution"]:.2f}</strong> ({TARGET_CONFIDENCE:.0%} chance)</p>
                     </div>
                     """, unsafe_allow_html=True)
                 else:
@@ -1051,6 +1233,7 @@ def display_goals():
             with col3:
                 if st.button(f"Delete", key=f"delete_goal_{i}"):
                     st.session_state.goals.pop(i)
+                    touch_goals()
                     st.success("Goal deleted successfully!")
                     st.rerun()
 
@@ -1085,6 +1268,7 @@ def display_goals():
                         "current": updated_current,
                         "date": updated_date.strftime("%Y-%m-%d")
                     }
+                    touch_goals()
 
                     st.success("Goal updated successfully!")
                     st.session_state.editing_goal = None
@@ -1217,7 +1401,7 @@ def display_subscription():
 def display_profile():
     st.markdown("<h2>Profile & Settings</h2>", unsafe_allow_html=True)
 
-    tab1, tab2 = st.tabs(["Profile", "Settings"])
+    tab1, tab2, tab3 = st.tabs(["Profile", "Settings", "Risk Profile"])
 
     with tab1:
         col1, col2 = st.columns([1, 3])
@@ -1277,8 +1461,8 @@ def display_profile():
 
         st.markdown("<h4>Categories</h4>", unsafe_allow_html=True)
 
-        if st.button("Manage Custom Categories"):
-            st.info("Feature coming soon!")
+        with st.expander("Manage Custom Categories"):
+            display_category_rules()
 
         st.markdown("<h4>Data Management</h4>", unsafe_allow_html=True)
 
@@ -1293,7 +1477,7 @@ def display_profile():
                     "savings": st.session_state.savings,
                     "investments": st.session_state.investments
                 },
-                "transactions": st.session_state.transactions.to_dict(orient="records") if not st.session_state.transactions.empty else [],
+                "transactions": st.session_state.transactions.to_records() if not st.session_state.transactions.empty else [],
                 "goals": st.session_state.goals
             }
 
@@ -1316,6 +1500,10 @@ def display_profile():
             if st.button("Reset App Data", type="primary"):
                 st.warning("This will reset all your data. Are you sure?")
                 if st.button("Yes, Reset Everything", key="confirm_reset"):
+                    user = st.session_state.get('user')
+                    if user:
+                        storage.delete_user_data(user["id"])
+
                     # Reset all session state
                     for key in list(st.session_state.keys()):
                         if key != 'login_status' and key != 'current_page':
@@ -1327,10 +1515,14 @@ def display_profile():
                     st.session_state.savings = 0.0
                     st.session_state.investments = 0.0
                     st.session_state.goals = []
-                    st.session_state.transactions = pd.DataFrame(columns=["date", "category", "amount", "description", "type"])
+                    st.session_state.saved_goals = []
+                    st.session_state.category_rules = []
+                    st.session_state.transactions = TransactionLedger()
                     st.session_state.insights = []
                     st.session_state.roundups = 0.0
                     st.session_state.first_login = True
+                    if user:
+                        st.session_state.user = user
 
                     st.success("All data has been reset!")
                     navigate_to("dashboard")
@@ -1340,6 +1532,9 @@ def display_profile():
             if st.button("Delete Account", type="primary"):
                 st.error("This will permanently delete your account and all data. This action cannot be undone.")
                 if st.button("Yes, Delete My Account", key="confirm_delete"):
+                    if 'user' in st.session_state:
+                        storage.delete_user(st.session_state.user["id"])
+
                     st.session_state.login_status = False
                     st.session_state.current_page = 'login'
 
@@ -1350,6 +1545,25 @@ def display_profile():
 
                     st.rerun()
 
+    with tab3:
+        st.subheader("Investment Risk Profile")
+        current_risk = st.session_state.user['risk_preference']
+        risk_options = ["conservative", "moderate", "aggressive"]
+        risk_descriptions = {
+            "conservative": "Lower risk, steady returns. Focus on high-yield savings and stable ETFs.",
+            "moderate": "Balanced risk and returns. Mix of savings, ETFs, and minimal crypto.",
+            "aggressive": "Higher risk, potential for higher returns. More allocation to ETFs and crypto."
+        }
+
+        selected_risk = st.radio("Select your risk preference:", risk_options, index=risk_options.index(current_risk))
+        st.markdown(f"**{risk_descriptions[selected_risk]}**")
+
+        if st.button("Update Risk Profile") and selected_risk != current_risk:
+            update_risk_preference(st.session_state.user['id'], selected_risk)
+            st.session_state.user['risk_preference'] = selected_risk
+            st.success("Risk profile updated successfully!")
+            st.rerun()
+
 # AI Assistant feature
 def display_ai_assistant():
     st.markdown("<h2>AI Financial Assistant</h2>", unsafe_allow_html=True)
@@ -1410,47 +1624,16 @@ def display_ai_assistant():
                 with st.spinner("Thinking..."):
                     time.sleep(1)  # Simulate AI processing
 
-                    # Sample responses based on query keywords
-                    response = "I'm analyzing your financial data..."
+                    # Compile the question into a structured query over the precomputed totals
+                    query = parse_question(user_query, st.session_state.transactions.categories, datetime.now())
 
-                    if "spend" in user_query.lower() and "dining" in user_query.lower():
-                        # Calculate dining expenses if we have transaction data
+                    if query["intent"] == "aggregate":
                         if not st.session_state.transactions.empty:
-                            # Convert to datetime if needed
-                            transactions_df = st.session_state.transactions.copy()
-                            if not pd.api.types.is_datetime64_any_dtype(transactions_df['date']):
-                                transactions_df['date'] = pd.to_datetime(transactions_df['date'])
-
-                            # Filter for last month and dining category
-                            last_month = datetime.now() - timedelta(days=30)
-                            mask = (transactions_df['date'] >= last_month) & (transactions_df['category'] == 'Dining')
-                            dining_expenses = transactions_df[mask]['amount'].sum()
-
-                            response = f"In the last 30 days, you spent €{abs(dining_expenses):.2f} on dining out. This represents about 15% of your total expenses during this period."
-                        else:
-                            response = "You don't have any dining transactions recorded yet. Add some transactions so I can analyze your dining expenses."
-
-                    elif "savings rate" in user_query.lower():
-                        if not st.session_state.transactions.empty:
-                            # Calculate income and expenses
-                            transactions_df = st.session_state.transactions.copy()
-                            total_income = transactions_df[transactions_df['type'] == 'income']['amount'].sum()
-                            total_expenses = abs(transactions_df[transactions_df['type'] == 'expense']['amount'].sum())
-
-                            if total_income > 0:
-                                savings_rate = ((total_income - total_expenses) / total_income) * 100
-                                response = f"Your overall savings rate is {savings_rate:.1f}%. The recommended savings rate is at least 20%. "
-
-                                if savings_rate < 20:
-                                    response += "You might want to look for ways to increase your savings rate."
-                                else:
-                                    response += "Great job! You're on track with your savings."
-                            else:
-                                response = "I don't have enough income data to calculate your savings rate yet. Please add your income transactions."
+                            response = answer_question(query, st.session_state.transactions.daily)
                         else:
-                            response = "I don't have enough transaction data to calculate your savings rate yet. Please add some income and expense transactions."
+                            response = "I don't have any transaction data yet. Please add some income and expense transactions so I can analyze your finances."
 
-                    elif "improve" in user_query.lower() and "budget" in user_query.lower():
+                    elif query["intent"] == "budget_tips":
                         response = """Here are some ways to improve your budget:
 
 1. Track all expenses for at least 30 days to understand your spending patterns
@@ -1459,26 +1642,18 @@ def display_ai_assistant():
 4. Set specific financial goals to stay motivated
 5. Review and adjust your budget monthly"""
 
-                    elif "track" in user_query.lower() and "goals" in user_query.lower():
+                    elif query["intent"] == "goals":
                         if st.session_state.goals:
                             on_track_goals = []
                             off_track_goals = []
 
-                            for goal in st.session_state.goals:
-                                # Calculate expected progress based on time
-                                target_date = datetime.strptime(goal["date"], "%Y-%m-%d")
-                                start_date = target_date - timedelta(days=365)  # Assume goal was set a year before target
-                                total_days = (target_date - start_date).days
-                                days_passed = (datetime.now() - start_date).days
-
-                                if total_days > 0 and days_passed > 0:
-                                    expected_progress = min(days_passed / total_days, 1) * 100
-                                    actual_progress = (goal["current"] / goal["target"]) * 100
-
-                                    if actual_progress >= expected_progress * 0.9:  # Within 90% of expected
-                                        on_track_goals.append(goal["name"])
-                                    else:
-                                        off_track_goals.append(goal["name"])
+                            # A goal is on track when most simulated futures reach it by its date
+                            for projection in project_goal_outcomes():
+                                label = f"{projection['name']} ({projection['probability']:.0%} chance)"
+                                if projection["on_track"]:
+                                    on_track_goals.append(label)
+                                else:
+                                    off_track_goals.append(label)
 
                             if on_track_goals and off_track_goals:
                                 response = f"You're on track with these goals: {', '.join(on_track_goals)}. However, you're falling behind on: {', '.join(off_track_goals)}. Consider adjusting your monthly contributions to catch up."
@@ -1489,23 +1664,8 @@ def display_ai_assistant():
                         else:
                             response = "You don't have any financial goals set up yet. Let's set some goals to track your progress!"
 
-                    elif "biggest expense" in user_query.lower():
-                        if not st.session_state.transactions.empty:
-                            # Filter for expenses
-                            transactions_df = st.session_state.transactions.copy()
-                            expenses = transactions_df[transactions_df['type'] == 'expense']
-
-                            if not expenses.empty:
-                                # Group by category
-                                category_expenses = expenses.groupby('category')['amount'].sum().abs()
-                                biggest_category = category_expenses.idxmax()
-                                biggest_amount = category_expenses.max()
-
-                                response = f"Your biggest expense category is {biggest_category}, where you've spent €{biggest_amount:.2f}. This represents {(biggest_amount / category_expenses.sum() * 100):.1f}% of your total expenses."
-                            else:
-                                response = "I don't have enough expense data to determine your biggest category. Please add more expense transactions."
-                        else:
-                            response = "I don't have any transaction data yet. Please add some expense transactions so I can analyze your spending patterns."
+                    else:
+                        response = "I can answer questions about your spending, income, savings and savings rate for any category and period, for example \"How much did I spend on groceries in the last 3 months?\" or \"What was my biggest expense category last month?\""
 
                     st.write(response)
 
@@ -1539,21 +1699,27 @@ def main():
         # Display sidebar navigation
         display_sidebar()
 
-        # Display current page content
-        if st.session_state.current_page == 'dashboard':
-            display_dashboard()
-        elif st.session_state.current_page == 'transactions':
-            display_transactions()
-        elif st.session_state.current_page == 'goals':
-            display_goals()
-        elif st.session_state.current_page == 'subscription':
-            display_subscription()
-        elif st.session_state.current_page == 'profile':
-            display_profile()
-        elif st.session_state.current_page == 'ai_assistant':
-            display_ai_assistant()
-        else:
-            display_dashboard()  # Default to dashboard
+        # Display current page content, persisting any changes even when a page triggers a rerun
+        try:
+            collect_swept_roundups()
+
+            if st.session_state.current_page == 'dashboard':
+                display_dashboard()
+            elif st.session_state.current_page == 'transactions':
+                display_transactions()
+            elif st.session_state.current_page == 'goals':
+                display_goals()
+            elif st.session_state.current_page == 'subscription':
+                display_subscription()
+            elif st.session_state.current_page == 'profile':
+                display_profile()
+            elif st.session_state.current_page == 'ai_assistant':
+                display_ai_assistant()
+            else:
+                display_dashboard()  # Default to dashboard
+        finally:
+            if st.session_state.login_status:
+                save_user_session()
 
 # Initialize session state for user data entry
 def initialize_session_state():
@@ -1571,7 +1737,7 @@ def initialize_session_state():
 
     # Transactions
     if 'transactions' not in st.session_state:
-        st.session_state.transactions = pd.DataFrame(columns=["date", "category", "amount", "description", "type"])
+        st.session_state.transactions = TransactionLedger()
 
     # Goals
     if 'goals' not in st.session_state:
@@ -1744,6 +1910,7 @@ def display_login():
                 if username and password:
                     st.session_state.login_status = True
                     st.session_state.current_page = 'dashboard'
+                    load_user_session(username)
                     initialize_session_state()
                     st.rerun()
                 else:
@@ -1761,6 +1928,7 @@ def display_login():
                 if new_username and new_password and new_password == confirm_password:
                     st.session_state.login_status = True
                     st.session_state.current_page = 'dashboard'
+                    load_user_session(new_username)
                     initialize_session_state()
                     st.rerun()
                 elif not new_username or not new_password:
@@ -13,8 +13,23 @@ import plotly.express as px
 from PIL import Image
 from datetime import datetime, timedelta
 import random
-from sklearn.linear_model import LinearRegression
 import time
+from ledger import CATEGORIES, TransactionLedger, to_cents
+from roundups import ROUNDUP_MULTIPLIERS, compute_roundups
+from recurring import RecurringDetector
+from search import DescriptionIndex
+from anomalies import AnomalyDetector
+from forecast import TOTAL_COLUMN, forecast_expenses
+from goalsim import INVESTMENT_STRATEGIES, PRIORITY_WEIGHTS, TARGET_CONFIDENCE, allocation_plan, project_goals
+from prices import PriceStore, format_return
+from scheduler import schedule_deposits as plan_deposit_schedule
+from allocation import allocation_names, determine_allocations
+from rules import RULE_KINDS, RuleCache, validate_rule
+from classifier import ClassifierStore, categorize_batch, record_corrections
+from cache import LRUCache, SyncCache
+from cashflow import LedgerCashFlow
+import storage
+from storage import update_risk_preference
 import json
 import hashlib
 
@@ -122,7 +137,7 @@ if 'investments' not in st.session_state:
 if 'goals' not in st.session_state:
     st.session_state.goals = []
 if 'transactions' not in st.session_state:
-    st.session_state.transactions = pd.DataFrame(columns=["date", "category", "amount", "description", "type"])
+    st.session_state.transactions = TransactionLedger()
 if 'insights' not in st.session_state:
     st.session_state.insights = []
 if 'roundups' not in st.session_state:
@@ -136,6 +151,51 @@ if 'risk_preference' not in st.session_state:
 def navigate_to(page):
     st.session_state.current_page = page
 
+# Load a user's persisted state into the session
+def load_user_session(username):
+    user = storage.get_or_create_user(username)
+    st.session_state.user = {
+        "id": user["id"],
+        "username": user["username"],
+        "risk_preference": user["risk_preference"]
+    }
+    st.session_state.username = user["username"]
+    st.session_state.risk_preference = user["risk_preference"]
+
+    st.session_state.subscription = user["subscription"]
+    st.session_state.balance = user["balance_cents"] / 100
+    st.session_state.savings = user["savings_cents"] / 100
+    st.session_state.investments = user["investments_cents"] / 100
+    st.session_state.roundups = user["roundups_cents"] / 100
+    st.session_state.first_login = bool(user["first_login"])
+
+    st.session_state.transactions = TransactionLedger()
+    st.session_state.transactions.extend(storage.load_transactions(user["id"]))
+    st.session_state.goals = storage.load_goals(user["id"])
+    st.session_state.saved_goals = [dict(goal) for goal in st.session_state.goals]
+    st.session_state.category_rules = storage.load_category_rules(user["id"])
+    touch_goals()
+    st.session_state.insights_cache = LRUCache(maxsize=INSIGHTS_CACHE_SIZE)
+
+# Write the session's account values and goals back to storage
+def save_user_session():
+    if 'user' not in st.session_state:
+        return
+
+    storage.save_user_state(
+        st.session_state.user["id"],
+        st.session_state.subscription,
+        st.session_state.balance,
+        st.session_state.savings,
+        st.session_state.investments,
+        st.session_state.roundups,
+        st.session_state.first_login
+    )
+    # Goals are only written when they changed since they were last loaded or saved
+    if st.session_state.goals != st.session_state.get('saved_goals'):
+        storage.save_goals(st.session_state.user["id"], st.session_state.goals)
+        st.session_state.saved_goals = [dict(goal) for goal in st.session_state.goals]
+
 # Function to hash passwords
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -153,24 +213,15 @@ def display_welcome_message():
     """, unsafe_allow_html=True)
 
 # Function to determine investment allocation based on user risk preference
-def determine_allocation(risk_preference):
-    if risk_preference == 'conservative':
-        options = ['high-yield savings'] * 7 + ['ETF'] * 3
-    elif risk_preference == 'moderate':
-        options = ['high-yield savings'] * 5 + ['ETF'] * 4 + ['crypto'] * 1
-    elif risk_preference == 'aggressive':
-        options = ['high-yield savings'] * 3 + ['ETF'] * 5 + ['crypto'] * 2
-    else:
-        options = ['high-yield savings'] * 5 + ['ETF'] * 5
-
-    return np.random.choice(options)
+def determine_allocation(risk_preference, rng=None):
+    return str(allocation_names(determine_allocations(risk_preference, 1, rng))[0])
 
 # Function to suggest goals
 def suggest_goals():
     suggested_goals = [
-        {"name": "Emergency Fund", "target": 6000, "current": 0, "date": datetime.now() + timedelta(days=365)},
-        {"name": "Vacation Fund", "target": 2000, "current": 0, "date": datetime.now() + timedelta(days=180)},
-        {"name": "New Car", "target": 15000, "current": 0, "date": datetime.now() + timedelta(days=730)}
+        {"name": "Emergency Fund", "target": 6000, "current": 0, "date": datetime.now() + timedelta(days=365), "priority": "high"},
+        {"name": "Vacation Fund", "target": 2000, "current": 0, "date": datetime.now() + timedelta(days=180), "priority": "low"},
+        {"name": "New Car", "target": 15000, "current": 0, "date": datetime.now() + timedelta(days=730), "priority": "medium"}
     ]
 
     for goal in suggested_goals:
@@ -193,6 +244,7 @@ def login():
         if st.button("Login"):
             if username and password:  # Simple validation
                 st.session_state.login_status = True
+                load_user_session(username)
 
                 # If this is the first login, navigate to the onboarding page
                 if st.session_state.first_login:
@@ -262,27 +314,30 @@ def onboarding():
                 tx_type = "income" if transaction_category == "Income" else "expense"
                 tx_amount = transaction_amount if tx_type == "income" else -transaction_amount
 
-                # Create a new row for the transaction
-                new_tx = pd.DataFrame({
-                    "date": [transaction_date.strftime("%Y-%m-%d")],
-                    "category": [transaction_category],
-                    "amount": [tx_amount],
-                    "description": [transaction_description],
-                    "type": [tx_type]
-                })
-
-                # Append to existing transactions or create a new DataFrame
-                if st.session_state.transactions.empty:
-                    st.session_state.transactions = new_tx
-                else:
-                    st.session_state.transactions = pd.concat([st.session_state.transactions, new_tx], ignore_index=True)
+                # Append the transaction to the ledger
+                st.session_state.transactions.append(
+                    transaction_date,
+                    transaction_category,
+                    tx_amount,
+                    transaction_description,
+                    tx_type
+                )
+                if 'user' in st.session_state:
+                    storage.save_transaction(
+                        st.session_state.user["id"],
+                        transaction_date,
+                        transaction_category,
+                        tx_amount,
+                        transaction_description,
+                        tx_type
+                    )
 
                 st.success("Transaction added!")
 
         # Display added transactions
         if not st.session_state.transactions.empty:
             st.subheader("Your Added Transactions")
-            st.dataframe(st.session_state.transactions[["date", "category", "amount", "description"]])
+            st.dataframe(st.session_state.transactions.to_frame()[["date", "category", "amount", "description"]])
 
     with tab3:
         st.header("Financial Goals")
@@ -307,6 +362,7 @@ def onboarding():
                 }
 
                 st.session_state.goals.append(new_goal)
+                touch_goals()
                 st.success(f"Goal '{goal_name}' added!")
 
         # Display added goals
@@ -349,9 +405,10 @@ def onboarding():
         st.rerun()
 
 # Function to connect to bank account and fetch transactions
-def connect_bank_account():
+def connect_bank_account(since=None):
     """
     Establishes a secure connection to the user's bank account and retrieves transaction history.
+    If `since` is given, only transactions dated on or after it are returned.
     Returns a list of transaction dictionaries.
     """
     try:
@@ -360,62 +417,187 @@ def connect_bank_account():
 
         # Mock transaction data for demonstration
         transactions = [
-            {"date": "2025-04-05", "amount": 1250.00, "description": "Payroll Deposit", "category": "income"},
-            {"date": "2025-04-04", "amount": -35.48, "description": "Grocery Store", "category": "groceries"},
-            {"date": "2025-04-03", "amount": -9.99, "description": "Streaming Service", "category": "entertainment"},
-            {"date": "2025-04-02", "amount": -42.15, "description": "Gas Station", "category": "transportation"},
-            {"date": "2025-04-01", "amount": -12.50, "description": "Coffee Shop", "category": "dining"},
+            {"id": "tx-1005", "date": "2025-04-05", "amount": 1250.00, "description": "Payroll Deposit", "category": "income"},
+            {"id": "tx-1004", "date": "2025-04-04", "amount": -35.48, "description": "Grocery Store", "category": "groceries"},
+            {"id": "tx-1003", "date": "2025-04-03", "amount": -9.99, "description": "Streaming Service", "category": "entertainment"},
+            {"id": "tx-1002", "date": "2025-04-02", "amount": -42.15, "description": "Gas Station", "category": "transportation"},
+            {"id": "tx-1001", "date": "2025-04-01", "amount": -12.50, "description": "Coffee Shop", "category": "dining"},
         ]
 
+        if since is not None:
+            transactions = [t for t in transactions if t["date"] >= since]
+
         print(f"Successfully retrieved {len(transactions)} transactions")
         return transactions
     except Exception as e:
         print(f"Error connecting to bank account: {str(e)}")
         return []
 
-# Function to analyze cash flow
-def analyze_cash_flow(transactions):
+# Bank data is served from memory for this many seconds before the next sync
+BANK_CACHE_TTL = 300
+
+# Process-wide cache of bank transactions, keyed by user
+@st.cache_resource
+def get_bank_cache():
+    return SyncCache(ttl=BANK_CACHE_TTL)
+
+# Process-wide description classifier, reloaded when a newly trained model is saved
+@st.cache_resource
+def get_category_classifier():
+    return ClassifierStore()
+
+# Function to get the user's bank transactions with at most one bank sync per TTL window
+def fetch_bank_transactions():
     """
-    Analyzes transactions to identify income and spending patterns.
-    Returns dictionary with income, expenses, and potential savings.
+    Returns the cached bank transactions of the current user.
+    When the cache has expired, only transactions newer than the last sync are fetched.
     """
-    if not transactions:
-        return {"income": 0, "expenses": 0, "potential_savings": 0, "categories": {}}
-
-    income = 0
-    expenses = 0
-    categories = {}
+    user_key = st.session_state.get('username', 'anonymous')
+
+    # Only the rows that arrived since the last sync are categorized, as one batch
+    return get_bank_cache().get(
+        user_key,
+        connect_bank_account,
+        prepare=lambda new_transactions: categorize_batch(new_transactions, get_category_classifier().current())
+    )
+
+# Process-wide cache of compiled categorization rules
+@st.cache_resource
+def get_rule_cache():
+    return RuleCache()
+
+# Function to categorize transactions with the current user's rules, None where no rule applies
+def categorize_by_rules(transactions):
+    rules = st.session_state.get('category_rules', [])
+    if not rules:
+        return [None] * len(transactions)
+    rule_set = get_rule_cache().get(st.session_state.get('username', 'anonymous'), rules)
+    return rule_set.categorize(transactions)
+
+# Function to persist the current user's rule list after a change
+def save_category_rules():
+    if 'user' in st.session_state:
+        storage.save_category_rules(st.session_state.user["id"], st.session_state.category_rules)
+
+# Function to manage the user's categorization rules
+def display_category_rules():
+    if 'category_rules' not in st.session_state:
+        st.session_state.category_rules = []
+    rules = st.session_state.category_rules
+
+    if rules:
+        for i, rule in enumerate(rules):
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                bounds = ""
+                if rule.get("min_amount") is not None or rule.get("max_amount") is not None:
+                    low = rule.get("min_amount") or 0
+                    high = f"€{rule['max_amount']:.2f}" if rule.get("max_amount") is not None else "any"
+                    bounds = f" (€{low:.2f} to {high})"
+                match = "matches" if rule.get("kind") == "regex" else "contains"
+                st.write(f"{i + 1}. Description {match} '{rule['pattern']}'{bounds} → {rule['category']}")
+            with col2:
+                if st.button("Remove", key=f"remove_rule_{i}"):
+                    rules.pop(i)
+                    save_category_rules()
+                    st.rerun()
+    else:
+        st.info("No rules yet. Rules categorize imported bank transactions by their description before the automatic classifier.")
 
-    for transaction in transactions:
-        amount = transaction["amount"]
-        category = transaction["category"]
+    with st.form("add_category_rule"):
+        col1, col2 = st.columns(2)
 
-        if amount > 0:
-            income += amount
-        else:
-            # Convert negative amount to positive for easier calculations
-            expense_amount = abs(amount)
-            expenses += expense_amount
+        with col1:
+            rule_pattern = st.text_input("Description text", placeholder="e.g., coffee, netflix")
+            rule_kind = st.selectbox("Match type", RULE_KINDS, format_func=lambda kind: "Contains text" if kind == "contains" else "Regular expression")
+            rule_category = st.selectbox("Category", CATEGORIES)
 
-            # Track spending by category
-            if category not in categories:
-                categories[category] = 0
-            categories[category] += expense_amount
+        with col2:
+            rule_min = st.number_input("Minimum amount (€)", min_value=0.0, value=0.0, step=5.0)
+            rule_max = st.number_input("Maximum amount (€, 0 for no limit)", min_value=0.0, value=0.0, step=5.0)
+
+        if st.form_submit_button("Add Rule"):
+            rule = {
+                "category": rule_category,
+                "pattern": rule_pattern.strip(),
+                "kind": rule_kind,
+                "min_amount": rule_min or None,
+                "max_amount": rule_max or None
+            }
+            error = validate_rule(rule)
+            if error:
+                st.error(error)
+            else:
+                rules.append(rule)
+                save_category_rules()
+                st.success("Rule added!")
+                st.rerun()
 
-    # Calculate potential savings based on discretionary spending
-    essential_categories = {"housing", "utilities", "groceries", "healthcare", "transportation"}
-    essential_expenses = sum(categories.get(cat, 0) for cat in essential_categories)
-    discretionary_expenses = expenses - essential_expenses
+# Function to add categorized bank transactions to the ledger and storage, marking them as imported
+def add_bank_transactions(transactions, bank_import):
+    records = [
+        {
+            "id": t["id"],
+            "date": t["date"],
+            "category": t["ui_category"],
+            "amount": t["amount"],
+            "description": t.get("description", ""),
+            "type": "income" if t["amount"] > 0 else "expense"
+        }
+        for t in transactions
+    ]
+    st.session_state.transactions.extend(records)
+    if records and 'user' in st.session_state:
+        storage.save_bank_transactions(st.session_state.user["id"], records)
+    bank_import["imported"].update(t["id"] for t in transactions)
 
-    # Suggest saving 20% of discretionary spending
-    potential_savings = round(discretionary_expenses * 0.2, 2)
+# Function to import new bank transactions into the ledger; uncertain categories wait for review
+def import_bank_transactions():
+    """
+    Adds bank transactions that are not in the ledger yet under the category
+    of the user's first matching rule, or else the classifier's prediction.
+    Rows the classifier was unsure about are held back until the user
+    confirms their category. Returns the rows awaiting review.
+    """
+    bank_import = st.session_state.get('bank_import')
+    if bank_import is None or bank_import["ledger"] is not st.session_state.transactions:
+        # Rows imported in earlier sessions are already in the stored ledger
+        imported = storage.load_bank_transaction_ids(st.session_state.user["id"]) if 'user' in st.session_state else set()
+        bank_import = {"ledger": st.session_state.transactions, "imported": imported, "pending": {}}
+        st.session_state.bank_import = bank_import
+
+    new_transactions = [
+        t for t in fetch_bank_transactions()
+        if t["id"] not in bank_import["imported"] and t["id"] not in bank_import["pending"]
+    ]
 
-    return {
-        "income": income,
-        "expenses": expenses,
-        "potential_savings": potential_savings,
-        "categories": categories
-    }
+    # The user's rules take precedence over the classifier, also for rows still waiting for review
+    candidates = new_transactions + list(bank_import["pending"].values())
+    for t, category in zip(candidates, categorize_by_rules(candidates)):
+        if category is not None:
+            t["ui_category"] = category
+            t["needs_review"] = False
+
+    ready = [t for t in candidates if not t["needs_review"]]
+    for t in candidates:
+        if t["needs_review"]:
+            bank_import["pending"][t["id"]] = t
+        else:
+            bank_import["pending"].pop(t["id"], None)
+    add_bank_transactions(ready, bank_import)
+    return list(bank_import["pending"].values())
+
+# Function to import reviewed bank transactions and learn from the confirmed categories
+def confirm_bank_categories(transactions, categories):
+    bank_import = st.session_state.bank_import
+    for transaction, category in zip(transactions, categories):
+        transaction["ui_category"] = category
+        transaction["needs_review"] = False
+        bank_import["pending"].pop(transaction["id"], None)
+    add_bank_transactions(transactions, bank_import)
+
+    # The shared model learns the corrections at its next offline training run
+    record_corrections([t.get("description", "") for t in transactions], categories)
 
 # Function to add transaction with round-up savings
 def add_transaction_with_roundup(transaction):
@@ -428,9 +610,9 @@ def add_transaction_with_roundup(transaction):
 
     amount = abs(transaction["amount"])
 
-    # Round up to the nearest dollar
-    next_dollar = round(amount + 0.5)
-    roundup = round(next_dollar - amount, 2)
+    # Round up to the nearest whole unit in exact cents, scaled by the user's multiplier
+    _, roundup_cents = compute_roundups([to_cents(amount)], st.session_state.get('roundup_multiplier', 1))
+    roundup = roundup_cents / 100
 
     # Add roundup information to the transaction
     transaction["roundup"] = roundup
@@ -438,62 +620,35 @@ def add_transaction_with_roundup(transaction):
     print(f"Transaction of ${amount:.2f} recorded with ${roundup:.2f} roundup savings")
     return {"transaction": transaction, "roundup": roundup}
 
+# Function to get the cash flow of the ledger, folding in only the transactions added since the last call
+def analyze_ledger_cash_flow():
+    cash_flow = st.session_state.get('ledger_cash_flow')
+    if cash_flow is None or cash_flow.ledger is not st.session_state.transactions:
+        cash_flow = LedgerCashFlow(st.session_state.transactions)
+        st.session_state.ledger_cash_flow = cash_flow
+
+    cash_flow.sync()
+    return cash_flow.result()
+
 # Function to schedule deposits based on cash flow analysis
 def schedule_deposits():
     """
     Schedules automatic deposits based on cash flow analysis.
+    Deposits follow the paydays inferred from the income history and never
+    bring the projected balance, after recurring payments, below the safety buffer.
     Returns a schedule of upcoming deposits.
     """
     # First, get cash flow data
-    transactions = connect_bank_account()
-    cash_flow = analyze_cash_flow(transactions)
-
-    # Calculate optimal deposit timing and amounts
-    income = cash_flow["income"]
-    expenses = cash_flow["expenses"]
-    savings_target = cash_flow["potential_savings"]
-
-    # Default: split savings across 4 weekly deposits
-    weekly_deposit = round(savings_target / 4, 2)
-
-    # Determine paydays (assume bi-weekly income)
-    import datetime
-    today = datetime.date.today()
+    transactions = fetch_bank_transactions()
+    cash_flow = analyze_ledger_cash_flow()
 
-    # Find income transactions to determine pay schedule
-    income_dates = [datetime.datetime.strptime(t["date"], "%Y-%m-%d").date()
-                    for t in transactions if t["amount"] > 0]
-
-    if income_dates:
-        # Sort dates to find the most recent payday
-        income_dates.sort(reverse=True)
-        last_payday = income_dates[0]
-
-        # Calculate next payday (assume biweekly)
-        next_payday = last_payday + datetime.timedelta(days=14)
-
-        # Schedule deposits 3 days after each payday
-        deposit_schedule = []
-        current_date = next_payday + datetime.timedelta(days=3)
-
-        for i in range(4):
-            deposit_schedule.append({
-                "date": current_date.strftime("%Y-%m-%d"),
-                "amount": weekly_deposit
-            })
-            current_date += datetime.timedelta(days=7)
-
-        return deposit_schedule
-    else:
-        # Fallback: schedule weekly deposits starting today
-        deposit_schedule = []
-        for i in range(4):
-            deposit_date = today + datetime.timedelta(days=i*7)
-            deposit_schedule.append({
-                "date": deposit_date.strftime("%Y-%m-%d"),
-                "amount": weekly_deposit
-            })
-        return deposit_schedule
+    # Save up to the suggested amount, as much as the projected balance allows
+    return plan_deposit_schedule(
+        transactions,
+        st.session_state.balance,
+        datetime.now(),
+        max_total=cash_flow["potential_savings"]
+    )
 
 # Function to micro-invest accumulated savings
 def micro_invest(savings):
@@ -504,12 +659,12 @@ def micro_invest(savings):
     if savings <= 0:
         return {"status": "error", "message": "No savings to invest"}
 
-    # Define investment allocation based on best practices
-    # These would typically be adjusted based on user risk profile
+    # Split the savings with the same weights the backtest evaluates for the user's risk profile
+    strategy = INVESTMENT_STRATEGIES[st.session_state.risk_preference]
     allocation = {
-        "stocks_etf": round(savings * 0.60, 2),  # 60% to broad market ETFs
-        "bonds_etf": round(savings * 0.30, 2),   # 30% to bond ETFs
-        "cash_reserve": round(savings * 0.10, 2) # 10% kept as cash reserve
+        "stocks_etf": round(savings * strategy["stocks"], 2),   # Broad market ETFs
+        "bonds_etf": round(savings * strategy["bonds"], 2),     # Bond ETFs
+        "cash_reserve": round(savings * strategy["cash"], 2)    # Kept as cash reserve
     }
 
     # In a real app, this would call an investment API
@@ -522,70 +677,75 @@ def micro_invest(savings):
         "allocation": allocation
     }
 
+# Number of allocation plans remembered per session
+ALLOCATION_CACHE_SIZE = 4
+
 # Function to allocate funds based on user preferences
 def allocate_funds():
     """
     Allocates funds based on user goals and risk profile.
+    Savings are water-filled across the user's goals by priority, deadline and remaining gap.
     Returns personalized fund allocation.
     """
-    # In a real app, we would retrieve user preferences from a database
-    user_preferences = {
-        "risk_tolerance": st.session_state.risk_preference,  # Options: conservative, moderate, aggressive
-        "goals": [
-            {"name": "Emergency Fund", "priority": "high", "target": 10000},
-            {"name": "Retirement", "priority": "medium", "target": 50000},
-            {"name": "Vacation", "priority": "low", "target": 2000}
-        ]
-    }
+    if 'allocation_cache' not in st.session_state:
+        st.session_state.allocation_cache = LRUCache(maxsize=ALLOCATION_CACHE_SIZE)
 
     # Get current savings
-    transactions = connect_bank_account()
-    cash_flow = analyze_cash_flow(transactions)
+    cash_flow = analyze_ledger_cash_flow()
+    key = (
+        st.session_state.transactions.version,
+        st.session_state.get('goals_version', 0),
+        st.session_state.risk_preference,
+        datetime.now().date()
+    )
+    return st.session_state.allocation_cache.get_or_compute(key, lambda: compute_fund_allocation(cash_flow))
+
+def compute_fund_allocation(cash_flow):
     monthly_savings = cash_flow["potential_savings"]
 
-    # Allocate based on priority
+    # Allocate across the user's own goals
+    plan = allocation_plan(st.session_state.goals, monthly_savings, datetime.now())
     allocation = {}
-    priority_weights = {"high": 0.6, "medium": 0.3, "low": 0.1}
-
-    for goal in user_preferences["goals"]:
-        allocation[goal["name"]] = round(monthly_savings * priority_weights[goal["priority"]], 2)
+    for item in plan:
+        allocation[item["name"]] = round(allocation.get(item["name"], 0) + item["amount"], 2)
 
     # Adjust investment strategy based on risk tolerance
-    investment_strategies = {
-        "conservative": {
-            "stocks": 0.40,
-            "bonds": 0.50,
-            "cash": 0.10
-        },
-        "moderate": {
-            "stocks": 0.60,
-            "bonds": 0.35,
-            "cash": 0.05
-        },
-        "aggressive": {
-            "stocks": 0.80,
-            "bonds": 0.15,
-            "cash": 0.05
-        }
-    }
-
-    risk_profile = investment_strategies[user_preferences["risk_tolerance"]]
+    risk_profile = INVESTMENT_STRATEGIES[st.session_state.risk_preference]
 
     return {
         "monthly_allocation": allocation,
+        "goal_plan": plan,
         "investment_strategy": risk_profile,
-        "total_monthly_savings": monthly_savings
+        "total_monthly_savings": monthly_savings,
+        "unallocated": round(monthly_savings - sum(item["amount"] for item in plan), 2)
     }
 
+# Function to flag ledger transactions that are unusually large for their category
+def detect_large_transactions():
+    """
+    Scores only the transactions added to the ledger since the last call
+    against a rolling per-category median, and returns the flagged
+    transactions newest first.
+    """
+    detectors = st.session_state.setdefault('anomaly_detectors', {})
+    user_key = st.session_state.get('username', 'anonymous')
+
+    # A cleared ledger resets the detector itself; a replaced one needs a new detector
+    detector = detectors.get(user_key)
+    if detector is None or detector.ledger is not st.session_state.transactions:
+        detector = detectors[user_key] = AnomalyDetector(st.session_state.transactions)
+
+    detector.sync()
+    return detector.latest()
+
 # Function to generate personalized financial insights
 def generate_personalized_insights():
     """
     Provides tailored financial guidance based on transaction history and trends.
     Returns a list of personalized insights and recommendations.
     """
-    # Get transaction data and cash flow analysis
-    transactions = connect_bank_account()
-    cash_flow = analyze_cash_flow(transactions)
+    # Cash flow of the ledger, which bank transactions are imported into
+    cash_flow = analyze_ledger_cash_flow()
 
     insights = []
 
@@ -617,15 +777,16 @@ def generate_personalized_insights():
             "description": f"Your highest expense category is {highest_category[0]} at ${highest_category[1]:.2f}."
         })
 
-        # Look for unusual spending patterns
-        avg_transaction = sum(abs(t["amount"]) for t in transactions if t["amount"] < 0) / len([t for t in transactions if t["amount"] < 0])
-        large_transactions = [t for t in transactions if t["amount"] < 0 and abs(t["amount"]) > avg_transaction * 2]
+        # Look for transactions that are unusually large for their category
+        large_transactions = detect_large_transactions()
 
         if large_transactions:
+            largest = max(large_transactions, key=lambda t: t["score"])
             insights.append({
                 "type": "alert",
                 "title": "Large Recent Transactions",
-                "description": f"You had {len(large_transactions)} transactions significantly larger than your average spending."
+                "description": f"You had {len(large_transactions)} transactions significantly larger than your usual spending in their category, "
+                               f"such as {largest['description']} (${abs(largest['amount']):.2f})."
             })
 
     # Add investment recommendations
@@ -640,25 +801,38 @@ def generate_personalized_insights():
     return insights
 
 # Function to generate insights based on user data
-def generate_insights():
+def compute_insights():
     insights = []
 
     # Only generate insights if we have transactions
     if not st.session_state.transactions.empty:
-        expenses = st.session_state.transactions[st.session_state.transactions['type'] == 'expense']
-        if not expenses.empty:
-            # Most expensive category
-            expense_by_category = expenses.groupby('category')['amount'].sum().abs()
-            if not expense_by_category.empty:
-                top_category = expense_by_category.idxmax()
-                top_amount = expense_by_category.max()
-                insights.append(f"Your highest spending category is {top_category} (€{top_amount:.2f}).")
+        cube = st.session_state.transactions.cube
+        daily = st.session_state.transactions.daily
+        today = datetime.now().date()
+
+        # Most expensive category of the last 30 days
+        expense_by_category = daily.category_totals('expense', today - timedelta(days=29), today)
+        if expense_by_category:
+            top_category = max(expense_by_category, key=expense_by_category.get)
+            top_amount = expense_by_category[top_category]
+            insights.append(f"Your highest spending category in the last 30 days is {top_category} (€{top_amount:.2f}).")
+
+        # Spending so far this month against the same days of last month
+        month_start = today.replace(day=1)
+        previous_end = month_start - timedelta(days=1)
+        previous_start = previous_end.replace(day=1)
+        # Negated in cents, as negating a zero euro total would give -0.0
+        spent_this_month = -daily.total_cents('expense', month_start, today) / 100
+        spent_last_month = -daily.total_cents('expense', previous_start, min(previous_start + (today - month_start), previous_end)) / 100
+        if spent_this_month > 0 and spent_last_month > 0:
+            change = (spent_this_month - spent_last_month) / spent_last_month * 100
+            direction = "more" if change > 0 else "less"
+            insights.append(f"You've spent €{spent_this_month:.2f} so far this month, {abs(change):.0f}% {direction} than by this day last month.")
 
         # If we have income transactions
-        income = st.session_state.transactions[st.session_state.transactions['type'] == 'income']
-        if not income.empty:
-            total_income = income['amount'].sum()
-            total_expenses = expenses['amount'].sum().abs() if not expenses.empty else 0
+        if cube.type_count('income'):
+            total_income = cube.type_total('income')
+            total_expenses = abs(cube.type_total('expense'))
 
             if total_income > 0:
                 savings_rate = ((total_income - total_expenses) / total_income) * 100
@@ -684,30 +858,105 @@ def generate_insights():
 
     return insights[:3]  # Return at most 3 insights
 
-# Function to predict future expenses using a simple linear regression model
-def predict_future_expenses():
-    if not st.session_state.transactions.empty:
-        # Prepare data for prediction
-        transactions_df = st.session_state.transactions.copy()
-        transactions_df['date'] = pd.to_datetime(transactions_df['date'])
-        transactions_df['month'] = transactions_df['date'].dt.to_period('M').astype(str)
+# Number of insight results remembered per session
+INSIGHTS_CACHE_SIZE = 4
 
-        # Group by month and sum expenses
-        monthly_expenses = transactions_df[transactions_df['type'] == 'expense'].groupby('month')['amount'].sum().reset_index()
-        monthly_expenses['amount'] = monthly_expenses['amount'].abs()  # Make sure amounts are positive
+# Function to mark the goals as changed so derived data is recomputed
+def touch_goals():
+    st.session_state.goals_version = st.session_state.get('goals_version', 0) + 1
 
-        # Create a numerical month index for regression
-        monthly_expenses['month_index'] = np.arange(len(monthly_expenses))
-
-        # Train a linear regression model
-        model = LinearRegression()
-        model.fit(monthly_expenses[['month_index']], monthly_expenses['amount'])
-
-        # Predict next 3 months
-        future_months = np.array([[len(monthly_expenses) + i] for i in range(1, 4)])
-        predictions = model.predict(future_months)
+# Function to return insights, recomputing them only when transactions, goals or the date changed
+def generate_insights():
+    if 'insights_cache' not in st.session_state:
+        st.session_state.insights_cache = LRUCache(maxsize=INSIGHTS_CACHE_SIZE)
+
+    # Insights cover recent periods, so they also change with the date
+    key = (st.session_state.transactions.version, st.session_state.get('goals_version', 0), datetime.now().date())
+    return st.session_state.insights_cache.get_or_compute(key, compute_insights)
+
+# Process-wide price history of the asset classes, memory-mapped once
+@st.cache_resource
+def get_price_store():
+    return PriceStore()
+
+# Function to return the month-to-date return of a risk preference's strategy and the YTD return of the equity ETF
+def investment_returns(risk_preference):
+    # Every strategy is backtested in the same pass, so all users share one cached result
+    names = list(INVESTMENT_STRATEGIES)
+    returns = get_price_store().period_returns([INVESTMENT_STRATEGIES[name] for name in names] + [{"stocks": 1.0}])
+    if returns is None:
+        return None, None
+    return returns[names.index(risk_preference)]["month"], returns[-1]["ytd"]
+
+# Number of goal projections remembered per session
+GOAL_PROJECTION_CACHE_SIZE = 4
+
+# Function to simulate the chance of reaching each goal by its target date
+def project_goal_outcomes():
+    if 'goal_projection_cache' not in st.session_state:
+        st.session_state.goal_projection_cache = LRUCache(maxsize=GOAL_PROJECTION_CACHE_SIZE)
+
+    risk_preference = st.session_state.risk_preference
+    key = (
+        st.session_state.transactions.version,
+        st.session_state.get('goals_version', 0),
+        risk_preference,
+        datetime.now().date(),
+        len(fetch_bank_transactions())
+    )
+    allocation = allocate_funds()
+    return st.session_state.goal_projection_cache.get_or_compute(key, lambda: project_goals(
+        st.session_state.goals,
+        st.session_state.transactions.cube,
+        allocation['investment_strategy'],
+        datetime.now(),
+        contributions=[item["amount"] for item in allocation['goal_plan']]
+    ))
+
+# Function to detect recurring payments, scanning only transactions added since the last call
+def detect_recurring_payments():
+    detector = st.session_state.get('recurring_detector')
+    if detector is None or detector.ledger is not st.session_state.transactions:
+        detector = RecurringDetector(st.session_state.transactions)
+        st.session_state.recurring_detector = detector
+
+    detector.sync()
+    return detector.recurring(as_of=datetime.now())
+
+# Function to search the transaction history by description text, date range and categories
+def search_transactions(query, start_date, end_date, categories=None):
+    index = st.session_state.get('description_index')
+    if index is None or index.ledger is not st.session_state.transactions:
+        index = DescriptionIndex(st.session_state.transactions)
+        st.session_state.description_index = index
+
+    index.sync()
+    rows = index.filter(query, start_date, end_date, categories)
+    return st.session_state.transactions.take(rows)
+
+# Function to total the income and expenses of a date range and categories from the ledger's daily prefix sums
+def period_totals(start_date, end_date, categories=None):
+    daily = st.session_state.transactions.daily
+    if categories is None:
+        return daily.total('income', start_date, end_date), -daily.total_cents('expense', start_date, end_date) / 100
+
+    income = sum(daily.total_cents('income', start_date, end_date, category) for category in categories) / 100
+    expenses = -sum(daily.total_cents('expense', start_date, end_date, category) for category in categories) / 100
+    return income, expenses
+
+# Number of expense forecasts remembered per session
+FORECAST_CACHE_SIZE = 4
+
+# Function to forecast the next 3 months of expenses for every category and the total
+def predict_future_expenses():
+    if not st.session_state.transactions.empty:
+        if 'forecast_cache' not in st.session_state:
+            st.session_state.forecast_cache = LRUCache(maxsize=FORECAST_CACHE_SIZE)
 
-        return predictions
+        # Refit only when a month is added or a monthly category total changes
+        cube = st.session_state.transactions.cube
+        key = cube.monthly_fingerprint('expense')
+        return st.session_state.forecast_cache.get_or_compute(key, lambda: forecast_expenses(cube))
     return None
 
 # Dashboard components
@@ -742,12 +991,14 @@ def display_dashboard():
         </div>
         """, unsafe_allow_html=True)
 
+    month_return, _ = investment_returns(st.session_state.risk_preference)
+
     with col3:
         st.markdown(f"""
         <div class="secondary-card">
             <h4 style="margin-top: 0;">Investments</h4>
             <h2 style="margin: 0;">€{st.session_state.investments:.2f}</h2>
-            <p>+5.2% this month</p>
+            <p>{format_return(month_return, "this month")}</p>
         </div>
         """, unsafe_allow_html=True)
 
@@ -781,7 +1032,7 @@ def display_dashboard():
         st.markdown("<h3>Recent Transactions</h3>", unsafe_allow_html=True)
 
         if not st.session_state.transactions.empty:
-            recent_transactions = st.session_state.transactions.sort_values(by="date", ascending=False).head(5)
+            recent_transactions = st.session_state.transactions.latest(5)
 
             for _, tx in recent_transactions.iterrows():
                 sign = "+" if tx["amount"] > 0 else "-"
@@ -791,7 +1042,7 @@ def display_dashboard():
                 <div style="padding: 0.75rem; border-bottom: 1px solid #e0e0e0; display: flex; justify-content: space-between;">
                     <div>
                         <p style="margin: 0; font-weight: 500;">{tx["description"]}</p>
-                        <p style="margin: 0; color: gray; font-size: 0.8rem;">{tx["date"]} • {tx["category"]}</p>
+                        <p style="margin: 0; color: gray; font-size: 0.8rem;">{tx["date"]:%Y-%m-%d} • {tx["category"]}</p>
                     </div>
                     <div>
                         <p style="margin: 0; font-weight: 500; color: {color};">{sign}€{abs(tx["amount"]):.2f}</p>
@@ -810,10 +1061,9 @@ def display_dashboard():
 
         # Prepare data for the chart
         if not st.session_state.transactions.empty:
-            expense_data = st.session_state.transactions[st.session_state.transactions["type"] == "expense"]
+            category_spending = st.session_state.transactions.cube.category_frame("expense")
 
-            if not expense_data.empty:
-                category_spending = expense_data.groupby("category")["amount"].sum().abs().reset_index()
+            if not category_spending.empty:
 
                 fig = px.pie(
                     category_spending,
@@ -834,7 +1084,7 @@ def display_dashboard():
 
     col1, col2, col3 = st.columns(3)
 
-    for i, (col, insight) in enumerate(zip([col1, col2, col3], st.session_state.insights)):
+    for i, (col, insight) in enumerate(zip([col1, col2, col3], generate_insights())):
         with col:
             st.markdown(f"""
                         <div style="padding: 1rem; background-color: #f8f9fa; border-radius: 10px; height: 100%;">
@@ -847,8 +1097,12 @@ def display_dashboard():
     predictions = predict_future_expenses()
     if predictions is not None:
         st.write("Predicted expenses for the next 3 months:")
-        for i, prediction in enumerate(predictions, start=1):
-            st.write(f"Month {i}: €{prediction:.2f}")
+        for month, prediction in predictions[TOTAL_COLUMN].items():
+            st.write(f"{month}: €{prediction:.2f}")
+
+        by_category = predictions.drop(columns=TOTAL_COLUMN).T
+        by_category = by_category[by_category.sum(axis=1) > 0]
+        st.dataframe(by_category, use_container_width=True)
     else:
         st.info("Not enough data to make predictions.")
 
@@ -857,6 +1111,7 @@ def display_dashboard():
 
     if st.session_state.goals:
         col1, col2 = st.columns(2)
+        goal_plan = allocate_funds()["goal_plan"]
 
         for i, goal in enumerate(st.session_state.goals):
             progress = (goal["current"] / goal["target"]) * 100
@@ -872,6 +1127,7 @@ def display_dashboard():
                         <span>€{goal["target"]:.0f}</span>
                     </div>
                     <p style="margin-top: 0.5rem; font-size: 0.9rem;">Target date: {goal["date"]}</p>
+                    <p style="margin: 0; font-size: 0.9rem;">Planned: €{goal_plan[i]["amount"]:.2f} / month</p>
                 </div>
                 """, unsafe_allow_html=True)
     else:
@@ -919,11 +1175,12 @@ def display_savings():
 
             roundup_multiplier = st.select_slider(
                 "Round-up multiplier",
-                options=[1, 2, 3, 5, 10],
-                value=1
+                options=ROUNDUP_MULTIPLIERS,
+                value=st.session_state.get('roundup_multiplier', 1)
             )
 
             if st.button("Save Settings"):
+                st.session_state.roundup_multiplier = roundup_multiplier
                 st.success("Savings settings updated successfully!")
 
             st.markdown(f"""
@@ -934,16 +1191,30 @@ def display_savings():
             </div>
             """, unsafe_allow_html=True)
 
+            if st.session_state.goals:
+                allocation = allocate_funds()
+                st.markdown("<h4>Monthly Goal Allocation</h4>", unsafe_allow_html=True)
+                st.dataframe(pd.DataFrame(allocation["goal_plan"]).rename(columns={
+                    "name": "Goal",
+                    "priority": "Priority",
+                    "required": "Needed (€)",
+                    "amount": "Planned (€)"
+                }), hide_index=True, use_container_width=True)
+                if allocation["unallocated"] > 0:
+                    st.caption(f"€{allocation['unallocated']:.2f} / month is left after all goals are funded.")
+
     with tab2:
         if st.session_state.subscription in ['Pro', 'Elite']:
             col1, col2 = st.columns([2, 1])
 
+            month_return, etf_ytd = investment_returns(st.session_state.risk_preference)
+
             with col1:
                 st.markdown(f"""
                 <div class="highlight-card">
                     <h4 style="margin-top: 0;">Total Investments</h4>
                     <h2 style="margin: 0;">€{st.session_state.investments:.2f}</h2>
-                    <p>+5.2% this month</p>
+                    <p>{format_return(month_return, "this month")}</p>
                 </div>
                 """, unsafe_allow_html=True)
 
@@ -961,11 +1232,11 @@ def display_savings():
             with col2:
                 st.markdown("<h3>AI Investment Suggestions</h3>", unsafe_allow_html=True)
 
-                st.markdown("""
+                st.markdown(f"""
                 <div style="padding: 1rem; background-color: #f8f9fa; border-radius: 10px; margin-bottom: 1rem;">
                     <h4 style="margin-top: 0;">Suggested ETF</h4>
                     <p style="margin: 0; font-weight: 500;">Vanguard FTSE All-World</p>
-                    <p style="margin: 0; color: green;">+7.2% YTD</p>
+                    <p style="margin: 0; color: {'green' if (etf_ytd or 0) >= 0 else 'red'};">{format_return(etf_ytd, "YTD")}</p>
                     <p style="margin-top: 0.5rem; font-size: 0.9rem;">Global diversification with low fees</p>
                 </div>
                 """, unsafe_allow_html=True)
@@ -1025,20 +1296,23 @@ def display_transactions():
                 tx_type = "income" if transaction_category == "Income" else "expense"
                 tx_amount = transaction_amount if tx_type == "income" else -transaction_amount
 
-                # Create a new row for the transaction
-                new_tx = pd.DataFrame({
-                    "date": [transaction_date.strftime("%Y-%m-%d")],
-                    "category": [transaction_category],
-                    "amount": [tx_amount],
-                    "description": [transaction_description],
-                    "type": [tx_type]
-                })
-
-                # Append to existing transactions or create a new DataFrame
-                if st.session_state.transactions.empty:
-                    st.session_state.transactions = new_tx
-                else:
-                    st.session_state.transactions = pd.concat([st.session_state.transactions, new_tx], ignore_index=True)
+                # Append the transaction to the ledger
+                st.session_state.transactions.append(
+                    transaction_date,
+                    transaction_category,
+                    tx_amount,
+                    transaction_description,
+                    tx_type
+                )
+                if 'user' in st.session_state:
+                    storage.save_transaction(
+                        st.session_state.user["id"],
+                        transaction_date,
+                        transaction_category,
+                        tx_amount,
+                        transaction_description,
+                        tx_type
+                    )
 
                 # Update balance
                 if tx_type == "income":
@@ -1048,14 +1322,32 @@ def display_transactions():
 
                 # Update roundups for expenses
                 if tx_type == "expense":
-                    cents = transaction_amount % 1
-                    if cents > 0:
-                        roundup = 1 - cents
-                        st.session_state.roundups += roundup
+                    _, roundup_cents = compute_roundups([to_cents(transaction_amount)], st.session_state.get('roundup_multiplier', 1))
+                    st.session_state.roundups += roundup_cents / 100
 
                 st.success("Transaction added successfully!")
                 st.rerun()
 
+        # Bank transactions whose category the classifier was not sure about
+        to_review = import_bank_transactions()
+        if to_review:
+            st.subheader("Review Bank Transactions")
+
+            with st.form("review_bank_transactions"):
+                reviewed_categories = []
+                for i, transaction in enumerate(to_review):
+                    reviewed_categories.append(st.selectbox(
+                        f"{transaction['date']} · {transaction['description']} · €{abs(transaction['amount']):.2f}",
+                        CATEGORIES,
+                        index=CATEGORIES.index(transaction["ui_category"]),
+                        key=f"review_category_{i}"
+                    ))
+
+                if st.form_submit_button("Confirm Categories"):
+                    confirm_bank_categories(to_review, reviewed_categories)
+                    st.success("Categories confirmed!")
+                    st.rerun()
+
         # Transaction filters
         st.subheader("Transaction History")
 
@@ -1074,21 +1366,29 @@ def display_transactions():
                 default=["All"]
             )
 
+        filter_query = st.text_input("Search descriptions", placeholder="e.g. netflix, amaz prime")
+
         # Apply filters
         if not st.session_state.transactions.empty:
-            filtered_transactions = st.session_state.transactions.copy()
-
-            # Convert date strings to datetime objects for comparison
-            filtered_transactions['date'] = pd.to_datetime(filtered_transactions['date'])
-
-            # Date filter
-            mask = (filtered_transactions['date'] >= pd.Timestamp(filter_start_date)) & \
-                   (filtered_transactions['date'] <= pd.Timestamp(filter_end_date))
-            filtered_transactions = filtered_transactions[mask]
+            # Description search, date range and categories are all answered from the ledger's indexes
+            filtered_transactions = search_transactions(
+                filter_query,
+                filter_start_date,
+                filter_end_date,
+                None if "All" in filter_category else filter_category
+            )
 
-            # Category filter
-            if "All" not in filter_category:
-                filtered_transactions = filtered_transactions[filtered_transactions['category'].isin(filter_category)]
+            # Summary of the filtered period; without a search it needs no rows at all
+            if filter_query.strip():
+                summary_income = filtered_transactions.loc[filtered_transactions['type'] == 'income', 'amount'].sum()
+                summary_expenses = -filtered_transactions.loc[filtered_transactions['type'] == 'expense', 'amount'].sum()
+            else:
+                summary_income, summary_expenses = period_totals(
+                    filter_start_date,
+                    filter_end_date,
+                    None if "All" in filter_category else filter_category
+                )
+            st.caption(f"Income €{summary_income:.2f} · Expenses €{summary_expenses:.2f} · Net €{summary_income - summary_expenses:.2f}")
 
             # Display filtered transactions
             if not filtered_transactions.empty:
@@ -1120,29 +1420,10 @@ def display_transactions():
             # Prepare data for cash flow analysis
             st.subheader("Monthly Cash Flow")
 
-            # Convert date to datetime if it's not already
-            transactions_df = st.session_state.transactions.copy()
-            transactions_df['date'] = pd.to_datetime(transactions_df['date'])
-
-            # Extract month for grouping
-            transactions_df['month'] = transactions_df['date'].dt.strftime('%Y-%m')
+            cube = st.session_state.transactions.cube
 
-            # Group by month and transaction type
-            monthly_flow = transactions_df.groupby(['month', 'type'])['amount'].sum().reset_index()
-
-            # Pivot to get income and expenses side by side
-            pivot_df = monthly_flow.pivot_table(
-                index='month',
-                columns='type',
-                values='amount',
-                aggfunc='sum'
-            ).reset_index().fillna(0)
-
-            # Make sure both columns exist
-            if 'income' not in pivot_df.columns:
-                pivot_df['income'] = 0
-            if 'expense' not in pivot_df.columns:
-                pivot_df['expense'] = 0
+            # Income and expenses per month, side by side
+            pivot_df = cube.monthly_flow()
 
             # Calculate net flow
             pivot_df['net'] = pivot_df['income'] + pivot_df['expense']  # expense is already negative
@@ -1167,13 +1448,10 @@ def display_transactions():
             # Category breakdown
             st.subheader("Expense Breakdown by Category")
 
-            # Filter for expenses only
-            expenses = transactions_df[transactions_df['type'] == 'expense']
+            # Expense totals by category, largest first
+            category_expenses = cube.category_frame('expense')
 
-            if not expenses.empty:
-                # Group by category
-                category_expenses = expenses.groupby('category')['amount'].sum().abs().reset_index()
-                category_expenses = category_expenses.sort_values('amount', ascending=False)
+            if not category_expenses.empty:
 
                 fig = px.bar(
                     category_expenses,
@@ -1190,8 +1468,8 @@ def display_transactions():
                 # Spending trends over time
                 st.subheader("Spending Trends")
 
-                # Group by month and category
-                category_month = expenses.groupby(['month', 'category'])['amount'].sum().abs().reset_index()
+                # Expense totals by month and category
+                category_month = cube.monthly_category_frame('expense')
 
                 fig = px.line(
                     category_month,
@@ -1212,7 +1490,7 @@ def display_transactions():
         if st.session_state.subscription in ['Pro', 'Elite']:
             if st.button("Generate AI Spending Analysis"):
                 with st.spinner("Analyzing your spending patterns..."):
-                    time.sleep(2)  # Simulate AI processing
+                    recurring_payments = detect_recurring_payments()
 
                 st.success("Analysis complete!")
 
@@ -1222,9 +1500,14 @@ def display_transactions():
                 1. **Unusual Spending**: Your entertainment spending is 40% higher than your average. Consider setting a budget in this category.
 
                 2. **Savings Opportunity**: You spend an average of €45 per week on coffee shops. Reducing this by half could save you €1,170 per year.
-
-                3. **Recurring Payments**: We've detected 3 subscription services totaling €29.97/month that you haven't used in the last 60 days.
                 """)
+
+                if recurring_payments:
+                    monthly_total = sum(payment["monthly_cost"] for payment in recurring_payments)
+                    payment_names = ", ".join(payment["description"] for payment in recurring_payments)
+                    st.markdown(f"3. **Recurring Payments**: We've detected {len(recurring_payments)} recurring payments totaling €{monthly_total:.2f}/month: {payment_names}.")
+                else:
+                    st.markdown("3. **Recurring Payments**: We haven't detected any recurring payments in your transaction history yet.")
         else:
             st.warning("Upgrade to Pro or Elite to access AI-powered spending analysis.")
             if st.button("Upgrade Subscription"):
@@ -1248,6 +1531,7 @@ def display_goals():
         with col2:
             goal_current = st.number_input("Current Amount (€)", min_value=0.0, value=0.0)
             goal_date = st.date_input("Target Date", value=datetime.now() + timedelta(days=365))
+            goal_priority = st.selectbox("Priority", list(PRIORITY_WEIGHTS), index=list(PRIORITY_WEIGHTS).index("medium"))
 
         submit_new_goal = st.form_submit_button("Add Goal")
 
@@ -1257,10 +1541,12 @@ def display_goals():
                 "name": goal_name,
                 "target": goal_target,
                 "current": goal_current,
-                "date": goal_date.strftime("%Y-%m-%d")
+                "date": goal_date.strftime("%Y-%m-%d"),
+                "priority": goal_priority
             }
 
             st.session_state.goals.append(new_goal)
+            touch_goals()
             st.success(f"Goal '{goal_name}' added!")
             st.rerun()
 
@@ -1268,16 +1554,11 @@ def display_goals():
     if st.session_state.goals:
         st.subheader("Your Financial Goals")
 
+        projections = project_goal_outcomes()
+
         for i, goal in enumerate(st.session_state.goals):
             progress = (goal["current"] / goal["target"]) * 100
-            months_to_target = None
-
-            # Calculate time to target
-            if goal["date"]:
-                target_date = datetime.strptime(goal["date"], "%Y-%m-%d")
-                today = datetime.now()
-                days_to_target = (target_date - today).days
-                months_to_target = max(days_to_target / 30, 0)
+            projection = projections[i]
 
             col1, col2, col3 = st.columns([3, 1, 1])
 
@@ -1295,10 +1576,10 @@ def display_goals():
                     <p style="margin-top: 0.5rem;">Target date: {goal["date"]}</p>
                     """, unsafe_allow_html=True)
 
-                if months_to_target is not None and months_to_target > 0:
-                    monthly_contribution = (goal["target"] - goal["current"]) / months_to_target
+                if projection["months"] > 0:
                     st.markdown(f"""
-                    <p>Suggested monthly contribution: <strong>€{monthly_contribution:.2f}</strong></p>
+                    <p>Chance of reaching it on time at €{projection["planned_contribution"]:.2f}/month: <strong>{projection["probability"]:.0%}</strong></p>
+                    <p>Suggested monthly contribution: <strong>€{projection["required_contribution"]:.2f}</strong> ({TARGET_CONFIDENCE:.0%} chance)</p>
                     </div>
                     """, unsafe_allow_html=True)
                 else:
@@ -1312,6 +1593,7 @@ def display_goals():
             with col3:
                 if st.button(f"Delete", key=f"delete_goal_{i}"):
                     st.session_state.goals.pop(i)
+                    touch_goals()
                     st.success("Goal deleted successfully!")
                     st.rerun()
 
@@ -1346,6 +1628,7 @@ def display_goals():
                         "current": updated_current,
                         "date": updated_date.strftime("%Y-%m-%d")
                     }
+                    touch_goals()
 
                     st.success("Goal updated successfully!")
                     st.session_state.editing_goal = None
@@ -1473,7 +1756,7 @@ def display_subscription():
 def display_profile():
     st.markdown("<h2>Profile & Settings</h2>", unsafe_allow_html=True)
 
-    tab1, tab2 = st.tabs(["Risk Profile", "Subscription"])
+    tab1, tab2, tab3 = st.tabs(["Risk Profile", "Subscription", "Categorization Rules"])
 
     with tab1:
         st.subheader("Investment Risk Profile")
@@ -1490,6 +1773,9 @@ def display_profile():
 
         if st.button("Update Risk Profile") and selected_risk != current_risk:
             st.session_state.risk_preference = selected_risk
+            if 'user' in st.session_state:
+                update_risk_preference(st.session_state.user['id'], selected_risk)
+                st.session_state.user['risk_preference'] = selected_risk
             st.success("Risk profile updated successfully!")
             st.rerun()
 
@@ -1497,6 +1783,9 @@ def display_profile():
         # Existing subscription management code...
         display_subscription()
 
+    with tab3:
+        display_category_rules()
+
 # Onboarding function for new users
 def onboarding():
     st.markdown("<h1 style='text-align: center;'>Welcome to neuro</h1>", unsafe_allow_html=True)
@@ -1583,6 +1872,7 @@ def onboarding():
                 }
 
                 st.session_state.goals.append(new_goal)
+                touch_goals()
                 st.success(f"Goal '{goal_name}' added!")
 
         # Display added goals
@@ -1622,23 +1912,30 @@ def main():
         # Display sidebar navigation
         display_sidebar()
 
-        # Display current page content
-        if st.session_state.current_page == 'dashboard':
-            display_dashboard()
-        elif st.session_state.current_page == 'transactions':
-            display_transactions()
-        elif st.session_state.current_page == 'goals':
-            display_goals()
-        elif st.session_state.current_page == 'subscription':
-            display_subscription()
-        elif st.session_state.current_page == 'profile':
-            display_profile()
-        elif st.session_state.current_page == 'ai_assistant':
-            display_ai_assistant()
-        elif st.session_state.current_page == 'financial_data':
-            onboarding()  # Call onboarding for financial data entry
-        else:
-            display_dashboard()  # Default to dashboard
+        # Display current page content, persisting any changes even when a page triggers a rerun
+        try:
+            # Bring new bank transactions into the ledger before any page reads it
+            import_bank_transactions()
+
+            if st.session_state.current_page == 'dashboard':
+                display_dashboard()
+            elif st.session_state.current_page == 'transactions':
+                display_transactions()
+            elif st.session_state.current_page == 'goals':
+                display_goals()
+            elif st.session_state.current_page == 'subscription':
+                display_subscription()
+            elif st.session_state.current_page == 'profile':
+                display_profile()
+            elif st.session_state.current_page == 'ai_assistant':
+                display_ai_assistant()
+            elif st.session_state.current_page == 'financial_data':
+                onboarding()  # Call onboarding for financial data entry
+            else:
+                display_dashboard()  # Default to dashboard
+        finally:
+            if st.session_state.login_status:
+                save_user_session()
 
 # Initialize session state for user data entry
 def initialize_session_state():
@@ -1656,7 +1953,7 @@ def initialize_session_state():
 
     # Transactions
     if 'transactions' not in st.session_state:
-        st.session_state.transactions = pd.DataFrame(columns=["date", "category", "amount", "description", "type"])
+        st.session_state.transactions = TransactionLedger()
 
     # Goals
     if 'goals' not in st.session_state:
@@ -1829,6 +2126,7 @@ def display_login():
                 if username and password:
                     st.session_state.login_status = True
                     st.session_state.current_page = 'dashboard'
+                    load_user_session(username)
                     initialize_session_state()
                     st.rerun()
                 else:
@@ -1846,6 +2144,7 @@ def display_login():
                 if new_username and new_password and new_password == confirm_password:
                     st.session_state.login_status = True
                     st.session_state.current_page = 'dashboard'
+                    load_user_session(new_username)
                     initialize_session_state()
                     st.rerun()
                 elif not new_username or not new_password:
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Local price history and a vectorized backtester for the investment strategies.
+
+Daily closing prices live in PRICE_DIR, one file per asset class named after
+it (stocks.csv, bonds.parquet, ...) with `date` and `close` columns. The
+first load aligns all files on one calendar and writes the dates and the
+days x assets close matrix to .npy files, which later loads memory-map
+instead of parsing; the cache is rebuilt whenever a source file is newer.
+
+The backtest rebalances every portfolio to its target weights at each month
+end. Within a month a portfolio is worth the weighted sum of each asset's
+growth since the last rebalance, so the value of every strategy on every
+day comes out of one (days x assets) @ (assets x strategies) product.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from cache import LRUCache
+
+# Directory holding one price file per asset class
+PRICE_DIR = 'prices'
+
+# Asset classes backtested, in column order of the close matrix
+ASSETS = ["stocks", "bonds", "cash"]
+
+# Backtest summaries remembered per store
+SUMMARY_CACHE_SIZE = 16
+
+_CACHE_DIR = '.cache'
+_SOURCE_EXTENSIONS = ('.csv', '.parquet')
+
+
+def _read_prices(path):
+    """Return a Series of closes indexed by day from a CSV or Parquet file."""
+    if path.endswith('.parquet'):
+        frame = pd.read_parquet(path, columns=["date", "close"])
+    else:
+        frame = pd.read_csv(path, usecols=["date", "close"])
+    dates = pd.to_datetime(frame["date"]).to_numpy().astype("datetime64[D]")
+    return pd.Series(frame["close"].to_numpy(dtype=np.float64), index=dates).sort_index()
+
+
+class PriceStore:
+    """Aligned daily closes of the asset classes, memory-mapped from a local cache."""
+
+    def __init__(self, path=PRICE_DIR, assets=ASSETS):
+        self.path = path
+        self.assets = list(assets)
+        self.dates = np.empty(0, dtype="datetime64[D]")
+        self.closes = np.empty((0, len(self.assets)))
+        self._summaries = LRUCache(maxsize=SUMMARY_CACHE_SIZE)
+        self.load()
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _sources(self):
+        sources = {}
+        for asset in self.assets:
+            for extension in _SOURCE_EXTENSIONS:
+                path = os.path.join(self.path, asset + extension)
+                if os.path.exists(path):
+                    sources[asset] = path
+                    break
+        return sources
+
+    def load(self):
+        """Load the close matrix, rebuilding the memory-mapped cache if a source changed."""
+        self._summaries.clear()
+        sources = self._sources()
+        if len(sources) < len(self.assets):
+            # Without a full history the backtest would silently drop asset classes
+            self.dates = np.empty(0, dtype="datetime64[D]")
+            self.closes = np.empty((0, len(self.assets)))
+            return
+
+        cache_dir = os.path.join(self.path, _CACHE_DIR)
+        dates_path = os.path.join(cache_dir, 'dates.npy')
+        closes_path = os.path.join(cache_dir, 'closes.npy')
+        newest_source = max(os.path.getmtime(p) for p in sources.values())
+        if not os.path.exists(closes_path) or os.path.getmtime(closes_path) < newest_source:
+            self._build_cache(sources, cache_dir, dates_path, closes_path)
+
+        self.dates = np.load(dates_path, mmap_mode='r')
+        self.closes = np.load(closes_path, mmap_mode='r')
+
+    def _build_cache(self, sources, cache_dir, dates_path, closes_path):
+        frame = pd.concat({asset: _read_prices(sources[asset]) for asset in self.assets}, axis=1)
+        # Carry prices over holidays of one market, and start where every asset has a price
+        frame = frame.sort_index().ffill().dropna()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(dates_path, frame.index.to_numpy().astype("datetime64[D]"))
+        np.save(closes_path, frame[self.assets].to_numpy(dtype=np.float64))
+
+    def weight_matrix(self, strategies):
+        """Stack strategy weight dictionaries into an assets x strategies matrix."""
+        return np.array([[strategy.get(asset, 0) for strategy in strategies] for asset in self.assets])
+
+    def backtest(self, strategies, start=None, end=None):
+        """
+        Return (dates, values): the value on each day of one unit invested at
+        the first close in [start, end] in every strategy, rebalanced monthly.
+        `values` has one column per strategy dictionary.
+        """
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(start, "D"), side="left")
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, np.datetime64(end, "D"), side="right")
+        dates = np.asarray(self.dates[lo:hi])
+        closes = np.asarray(self.closes[lo:hi])
+        if len(dates) == 0:
+            return dates, np.empty((0, len(strategies)))
+
+        # Each day's growth is measured from the close of the previous month's last day
+        months = dates.astype("datetime64[M]")
+        month_start = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+        month_id = np.cumsum(np.r_[False, months[1:] != months[:-1]])
+        base = np.maximum(month_start - 1, 0)[month_id]
+        within_month = (closes / closes[base]) @ self.weight_matrix(strategies)
+
+        # Chain the month-end values so each month starts from where the last one ended
+        month_end = np.r_[month_start[1:] - 1, len(dates) - 1]
+        chained = np.cumprod(within_month[month_end], axis=0)
+        carried = np.vstack([np.ones((1, len(strategies))), chained[:-1]])
+        return dates, carried[month_id] * within_month
+
+    def period_returns(self, strategies, as_of=None):
+        """
+        Return month-to-date and year-to-date returns of every strategy, measured
+        from the last close before the month or year of `as_of` (default: latest close).
+        Returns a list of {"month": ..., "ytd": ...} dictionaries, or None without data.
+        """
+        if len(self) == 0:
+            return None
+
+        as_of = np.datetime64(as_of, "D") if as_of is not None else self.dates[-1]
+        key = (as_of, tuple(tuple(sorted(strategy.items())) for strategy in strategies))
+        return self._summaries.get_or_compute(key, lambda: self._period_returns(strategies, as_of))
+
+    def _period_returns(self, strategies, as_of):
+        year_start = as_of.astype("datetime64[Y]").astype("datetime64[D]")
+        dates, values = self.backtest(strategies, end=as_of)
+        if len(dates) == 0:
+            return None
+
+        def since(start):
+            # Measure from the last close before `start`, or the first close if history starts later
+            index = max(np.searchsorted(dates, start, side="left") - 1, 0)
+            return values[-1] / values[index] - 1
+
+        month = since(as_of.astype("datetime64[M]").astype("datetime64[D]"))
+        ytd = since(year_start)
+        return [{"month": float(month[i]), "ytd": float(ytd[i])} for i in range(len(strategies))]
+
+
+def format_return(value, label):
+    """Render a return as '+5.2% this month', or a notice when there is no price data."""
+    if value is None:
+        return "No price history available"
+    return f"{value:+.1%} {label}"
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Detection of recurring payments and subscriptions.
+
+Expenses are hashed into buckets keyed by their normalized description and
+a logarithmic amount band, so "NETFLIX.COM 1234" and "Netflix.com 5678" for
+similar amounts land together. Each bucket keeps its dates sorted, and a
+bucket is tested for a weekly, monthly or annual rhythm by looking at the
+gaps between consecutive dates. Only buckets that received new transactions
+are re-tested, so keeping the result current costs time proportional to the
+new rows, not to the whole history.
+"""
+
+import math
+import re
+from bisect import insort
+
+import numpy as np
+
+from ledger import TYPES
+
+# Relative width of an amount band; amounts within ~10% share a band
+AMOUNT_BAND_WIDTH = 0.10
+
+# Share of gaps that must match the period for a bucket to count as recurring
+MIN_MATCHING_GAPS = 0.75
+
+# name: (expected gap in days, tolerance in days, minimum occurrences, payments per month)
+PERIODS = {
+    "weekly": (7, 1, 3, 52 / 12),
+    "monthly": (30.44, 3.5, 3, 1),
+    "annual": (365.25, 7, 2, 1 / 12),
+}
+
+_NOISE = re.compile(r"[^a-z ]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_description(description):
+    """Lowercase a description and drop digits, punctuation and extra spaces."""
+    text = _NOISE.sub(" ", str(description).lower())
+    return _SPACES.sub(" ", text).strip()
+
+
+def amount_band(amount_cents):
+    """Return the logarithmic band of an amount, ignoring its sign."""
+    cents = abs(int(amount_cents))
+    if cents == 0:
+        return 0
+    return int(round(math.log(cents) / math.log1p(AMOUNT_BAND_WIDTH)))
+
+
+def detect_period(days):
+    """Return the name of the period matched by sorted day numbers, or None."""
+    gaps = np.diff(np.asarray(days, dtype=np.int64))
+    for name, (expected, tolerance, min_occurrences, _) in PERIODS.items():
+        if len(days) < min_occurrences:
+            continue
+        matching = np.abs(gaps - expected) <= tolerance
+        if matching.mean() >= MIN_MATCHING_GAPS:
+            return name
+    return None
+
+
+class RecurringDetector:
+    """Incrementally maintained set of recurring expenses.
+
+    Expenses can be added one at a time with `add`, or pulled from the
+    TransactionLedger given at construction with `sync`.
+    """
+
+    def __init__(self, ledger=None):
+        self.ledger = ledger
+        self.rows_seen = 0
+        self.generation = 0
+        self._buckets = {}
+        self._dirty = set()
+        self._results = {}
+
+    def add(self, date, description, amount_cents):
+        """Register one expense; `date` is a datetime64 or anything NumPy can parse."""
+        name = normalize_description(description)
+        if not name:
+            return
+
+        # Join a neighbouring band of the same payee so amounts near a band edge stay together
+        band = amount_band(amount_cents)
+        key = next(
+            ((name, b) for b in (band, band - 1, band + 1) if (name, b) in self._buckets),
+            (name, band)
+        )
+
+        bucket = self._buckets.setdefault(key, {"days": [], "amounts": [], "description": description})
+        day = int(np.datetime64(date, "D").astype(np.int64))
+        insort(bucket["days"], day)
+        bucket["amounts"].append(abs(int(amount_cents)))
+        bucket["description"] = description
+        self._dirty.add(key)
+
+    def reset(self):
+        self.rows_seen = 0
+        self._buckets.clear()
+        self._dirty.clear()
+        self._results.clear()
+
+    def sync(self):
+        """Feed the expenses appended to the ledger since the last call."""
+        ledger = self.ledger
+        if self.generation != ledger.generation:
+            # The ledger was cleared; start over
+            self.reset()
+            self.generation = ledger.generation
+        if self.rows_seen == len(ledger):
+            return
+
+        start = self.rows_seen
+        expense = ledger.column("type", start) == TYPES.index("expense")
+        dates = ledger.column("date", start)[expense]
+        descriptions = ledger.column("description", start)[expense]
+        amounts = ledger.column("amount", start)[expense]
+        for date, description, amount in zip(dates, descriptions, amounts):
+            self.add(date, description, amount)
+        self.rows_seen = len(ledger)
+
+    def _evaluate(self, key):
+        bucket = self._buckets[key]
+        period = detect_period(bucket["days"])
+        if period is None:
+            self._results.pop(key, None)
+            return
+
+        expected, tolerance, _, per_month = PERIODS[period]
+        amount = float(np.median(bucket["amounts"])) / 100
+        last_day = bucket["days"][-1]
+        self._results[key] = {
+            "description": bucket["description"],
+            "period": period,
+            "amount": amount,
+            "monthly_cost": round(amount * per_month, 2),
+            "occurrences": len(bucket["days"]),
+            "last_date": np.datetime64(last_day, "D"),
+            "next_date": np.datetime64(last_day + int(round(expected)), "D"),
+            "_stale_after": last_day + int(round(expected + tolerance)),
+        }
+
+    def recurring(self, as_of=None):
+        """
+        Return the detected recurring expenses, most expensive per month first.
+        With `as_of`, only payments that are still expected by that date are returned.
+        """
+        for key in self._dirty:
+            self._evaluate(key)
+        self._dirty.clear()
+
+        results = list(self._results.values())
+        if as_of is not None:
+            today = int(np.datetime64(as_of, "D").astype(np.int64))
+            results = [r for r in results if r["_stale_after"] >= today]
+
+        results.sort(key=lambda r: r["monthly_cost"], reverse=True)
+        return [{k: v for k, v in r.items() if not k.startswith("_")} for r in results]
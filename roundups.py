@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Round-up savings computed in integer cents.
+
+Every expense is rounded up to the next whole euro and the difference,
+scaled by the user's round-up multiplier, is set aside. Amounts that are
+already whole euros produce no round-up. Working in cents over NumPy arrays
+keeps the arithmetic exact and lets a whole import be processed in one pass.
+"""
+
+import numpy as np
+
+from ledger import TYPES
+
+# Multipliers offered in the savings settings
+ROUNDUP_MULTIPLIERS = [1, 2, 3, 5, 10]
+
+
+def roundup_cents(amount_cents, multiplier=1):
+    """Return the round-up in cents for each amount (sign is ignored)."""
+    if multiplier not in ROUNDUP_MULTIPLIERS:
+        raise ValueError(f"Unsupported round-up multiplier: {multiplier}")
+
+    remainder = np.abs(np.asarray(amount_cents, dtype=np.int64)) % 100
+    return np.where(remainder > 0, 100 - remainder, 0) * multiplier
+
+
+def compute_roundups(expense_cents, multiplier=1):
+    """Return (per-transaction round-ups, total round-up), both in cents."""
+    per_transaction = roundup_cents(expense_cents, multiplier)
+    return per_transaction, int(per_transaction.sum())
+
+
+def ledger_roundups(ledger, multiplier=1):
+    """Return the round-ups of every expense in a TransactionLedger, in cents."""
+    expense = ledger.column("type") == TYPES.index("expense")
+    return compute_roundups(ledger.column("amount")[expense], multiplier)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""User-defined categorization rules.
+
+A rule assigns a category to transactions whose description contains a
+text (or matches a regular expression) and, optionally, whose amount lies in
+a range. All "contains" rules of a user are compiled into one Aho-Corasick
+automaton, so a description is scanned once no matter how many rules there
+are; regular expressions are tested only for their own rules. When several
+rules match, the first one in the user's list wins.
+
+Compiled rule sets are cached keyed on the rules themselves, so editing the
+rules of a user simply misses the cache and compiles the new list.
+"""
+
+import re
+from collections import deque
+
+from cache import LRUCache
+
+RULE_KINDS = ["contains", "regex"]
+
+# Compiled rule sets kept in memory, across users
+RULE_CACHE_SIZE = 64
+
+
+class AhoCorasick:
+    """Finds which of many lowercase patterns occur in a text, in one pass."""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].add(index)
+
+        # Breadth-first failure links; each state also reports the patterns of its fallback
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] |= self._output[self._fail[child]]
+
+    def matches(self, text):
+        """Return the indices of the patterns found in `text`."""
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found |= self._output[state]
+        return found
+
+
+def rule_key(rules):
+    """Return a hashable snapshot of a rule list."""
+    return tuple(
+        (rule["category"], rule["pattern"], rule.get("kind", "contains"), rule.get("min_amount"), rule.get("max_amount"))
+        for rule in rules
+    )
+
+
+class RuleSet:
+    """A compiled list of categorization rule dictionaries.
+
+    Each rule has a `category`, a `pattern`, a `kind` ("contains" or "regex")
+    and optional `min_amount` / `max_amount` bounds on the absolute amount.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        contains = [i for i, rule in enumerate(self.rules) if rule.get("kind", "contains") == "contains"]
+        self._contains_rules = contains
+        self._automaton = AhoCorasick([self.rules[i]["pattern"].lower() for i in contains])
+        self._regexes = [
+            (i, re.compile(rule["pattern"], re.IGNORECASE))
+            for i, rule in enumerate(self.rules)
+            if rule.get("kind") == "regex"
+        ]
+
+    def _candidates(self, description):
+        """Return the indices of the rules whose pattern matches a description, in rule order."""
+        text = description.lower()
+        candidates = {self._contains_rules[i] for i in self._automaton.matches(text)}
+        candidates.update(i for i, regex in self._regexes if regex.search(description))
+        return sorted(candidates)
+
+    def _in_range(self, rule, amount):
+        amount = abs(amount)
+        low, high = rule.get("min_amount"), rule.get("max_amount")
+        return (low is None or amount >= low) and (high is None or amount <= high)
+
+    def categorize(self, transactions):
+        """
+        Return the rule category of every transaction dictionary (with
+        `description` and `amount`), or None where no rule applies.
+        """
+        # Imports repeat the same payees, so each description is scanned once
+        candidates_by_description = {}
+        categories = []
+        for transaction in transactions:
+            description = transaction.get("description", "") or ""
+            if description not in candidates_by_description:
+                candidates_by_description[description] = self._candidates(description)
+
+            category = None
+            for index in candidates_by_description[description]:
+                if self._in_range(self.rules[index], transaction["amount"]):
+                    category = self.rules[index]["category"]
+                    break
+            categories.append(category)
+        return categories
+
+
+class RuleCache:
+    """Compiled rule sets of many users, recompiled only when a user's rules change."""
+
+    def __init__(self, maxsize=RULE_CACHE_SIZE):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def get(self, user_key, rules):
+        key = (user_key, rule_key(rules))
+        return self._cache.get_or_compute(key, lambda: RuleSet(rules))
+
+
+def validate_rule(rule):
+    """Return an error message for an invalid rule, or None."""
+    if not rule.get("pattern"):
+        return "A rule needs a text to match."
+    if rule.get("kind", "contains") not in RULE_KINDS:
+        return f"Unknown rule type: {rule.get('kind')}"
+    if rule.get("kind") == "regex":
+        try:
+            re.compile(rule["pattern"])
+        except re.error as e:
+            return f"Invalid regular expression: {e}"
+    low, high = rule.get("min_amount"), rule.get("max_amount")
+    if low is not None and high is not None and low > high:
+        return "The minimum amount is larger than the maximum amount."
+    return None
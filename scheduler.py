@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Cash-flow-aware scheduling of automatic savings deposits.
+
+The pay cadence is inferred from the gaps between all past income dates.
+The daily balance over the coming weeks is projected from the expected
+paydays, the recurring outflows found by RecurringDetector and the average
+daily spending on everything else. The most that can be moved to savings by
+day t without the projected balance ever dropping below a safety buffer
+afterwards is the minimum of (balance - buffer) over days t and later, so
+the whole deposit plan is one reversed running minimum. `plan_deposits`
+works on a users x days matrix, so a nightly run schedules every user at
+once.
+"""
+
+import numpy as np
+
+from recurring import MIN_MATCHING_GAPS, PERIODS, RecurringDetector
+from ledger import to_cents
+
+# name: (expected gap between paydays in days, tolerance in days)
+PAY_CADENCES = {
+    "weekly": (7, 1),
+    "biweekly": (14, 2),
+    "semimonthly": (15.22, 2.5),
+    "monthly": (30.44, 3.5),
+}
+
+# Days projected ahead when scheduling
+SCHEDULE_HORIZON_DAYS = 35
+
+# Balance that projected deposits never dip below, in cents
+OVERDRAFT_BUFFER_CENTS = 10_000
+
+# Days after a payday before its deposit is made, so the pay has cleared
+DEPOSIT_DELAY_DAYS = 1
+
+# Interval between deposits when no pay cadence can be inferred
+FALLBACK_INTERVAL_DAYS = 7
+
+
+def _day_numbers(dates):
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+def infer_pay_cadence(income_dates):
+    """
+    Return (cadence name, period in days) for the income dates, or None when
+    they do not follow a regular rhythm. Several deposits on one day count once.
+    """
+    days = np.unique(_day_numbers(income_dates))
+    if len(days) < 3:
+        return None
+
+    gaps = np.diff(days)
+    expected = np.array([expected for expected, _ in PAY_CADENCES.values()])
+    tolerance = np.array([tolerance for _, tolerance in PAY_CADENCES.values()])
+
+    # Share of gaps matching each cadence, in one broadcast comparison
+    matching = (np.abs(gaps[:, None] - expected) <= tolerance).mean(axis=0)
+    best = int(np.argmax(matching))
+    if matching[best] < MIN_MATCHING_GAPS:
+        return None
+    return list(PAY_CADENCES)[best], float(expected[best])
+
+
+def project_daily_flows(transactions, today, horizon=SCHEDULE_HORIZON_DAYS):
+    """
+    Project the net cash flow, in cents, of each of the `horizon` days from
+    `today` from a list of transaction dictionaries. Returns (flows, paydays),
+    where paydays are the projected day offsets of income.
+    """
+    start = int(_day_numbers(today))
+    flows = np.zeros(horizon, dtype=np.int64)
+    if not transactions:
+        return flows, np.empty(0, dtype=np.int64)
+
+    days = _day_numbers([t["date"] for t in transactions])
+    cents = np.array([to_cents(t["amount"]) for t in transactions], dtype=np.int64)
+    income = cents > 0
+
+    # Expected paydays continue the inferred cadence from the last pay
+    paydays = np.empty(0, dtype=np.int64)
+    cadence = infer_pay_cadence(days[income]) if income.any() else None
+    if cadence is not None:
+        _, period = cadence
+        last = days[income].max()
+        pay_days = np.unique(days[income])
+        pay = np.median([cents[income & (days == d)].sum() for d in pay_days[-6:]])
+        # Skip pay periods that already passed if the history stops before today
+        first_step = max(int(np.ceil((start - last) / period)), 1)
+        steps = first_step + np.arange(int(horizon / period) + 2)
+        paydays = np.rint(last + steps * period).astype(np.int64) - start
+        paydays = paydays[(paydays >= 0) & (paydays < horizon)]
+        np.add.at(flows, paydays, int(pay))
+
+    # Known recurring outflows on their next due dates
+    detector = RecurringDetector()
+    for day, t, amount in zip(days, transactions, cents):
+        if amount < 0:
+            detector.add(np.datetime64(int(day), "D"), t.get("description", ""), amount)
+    recurring = detector.recurring(as_of=np.datetime64(start, "D"))
+    recurring_cents = 0
+    for payment in recurring:
+        period = PERIODS[payment["period"]][0]
+        first = int(payment["next_date"].astype(np.int64)) - start
+        due = np.rint(first + np.arange(0, horizon / period + 1) * period).astype(np.int64)
+        due = due[(due >= 0) & (due < horizon)]
+        np.add.at(flows, due, -to_cents(payment["amount"]))
+        recurring_cents += to_cents(payment["amount"]) * payment["occurrences"]
+
+    # Everything else is spread evenly over the days
+    span = max(int(days.max() - days.min()) + 1, 1)
+    other_spending = max(-int(cents[~income].sum()) - recurring_cents, 0)
+    flows -= other_spending // span
+
+    return flows, paydays
+
+
+def plan_deposits(balances, allowed, buffer_cents=OVERDRAFT_BUFFER_CENTS, max_total_cents=None):
+    """
+    Return the deposit in cents on every day that saves the most without the
+    projected balance falling below `buffer_cents` on any later day.
+
+    `balances` holds projected end-of-day balances before any deposit and
+    `allowed` marks the days deposits may be made; both are days-long rows,
+    or users x days matrices to plan many users at once. `max_total_cents`
+    caps the total per user.
+    """
+    single = np.ndim(balances) == 1
+    balances = np.atleast_2d(np.asarray(balances, dtype=np.int64))
+    allowed = np.broadcast_to(np.atleast_2d(allowed), balances.shape)
+
+    # The most that can have left the account by day t keeps every later balance above the buffer
+    headroom = np.minimum.accumulate((balances - buffer_cents)[:, ::-1], axis=1)[:, ::-1]
+    cumulative = np.maximum(headroom, 0)
+    if max_total_cents is not None:
+        cumulative = np.minimum(cumulative, np.reshape(max_total_cents, (-1, 1)))
+
+    # Deposits only happen on allowed days, moving the running total up to what is safe then
+    on_allowed = np.where(allowed, cumulative, 0)
+    cumulative = np.maximum.accumulate(on_allowed, axis=1)
+    deposits = np.diff(cumulative, axis=1, prepend=0)
+    return deposits[0] if single else deposits
+
+
+def schedule_deposits(transactions, balance, today, max_total=None, horizon=SCHEDULE_HORIZON_DAYS):
+    """
+    Schedule savings deposits for one user from their transaction history
+    and current balance. Returns a list of {"date", "amount"} dictionaries
+    with amounts in euros.
+    """
+    start = np.datetime64(today, "D")
+    flows, paydays = project_daily_flows(transactions, start, horizon)
+
+    allowed = np.zeros(horizon, dtype=bool)
+    if len(paydays):
+        allowed[np.clip(paydays + DEPOSIT_DELAY_DAYS, 0, horizon - 1)] = True
+    else:
+        allowed[::FALLBACK_INTERVAL_DAYS] = True
+
+    balances = to_cents(balance) + np.cumsum(flows)
+    max_total_cents = None if max_total is None else to_cents(max_total)
+    deposits = plan_deposits(balances, allowed, max_total_cents=max_total_cents)
+
+    return [
+        {"date": str(start + int(day)), "amount": int(deposits[day]) / 100}
+        for day in np.flatnonzero(deposits)
+    ]
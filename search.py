@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Full-text search over transaction descriptions.
+
+Descriptions are normalized the same way as for recurring payment detection
+and split into words. An inverted index maps every word to the sorted list
+of ledger rows containing it, and the words themselves are kept in a sorted
+list so all words starting with a prefix are found by binary search. Rows
+are only ever appended to the ledger, so indexing new rows appends to the
+end of their posting lists and the lists stay sorted for free.
+
+A query matches the rows that contain, for every query word, some word
+starting with it: "amaz prime" finds "AMAZON PRIME*2K4". Posting lists are
+intersected smallest first, then combined with the date range filter from
+whichever side is smaller: a few matches are checked against their own
+dates, many are intersected with the rows of the ledger's date index.
+"""
+
+from bisect import bisect_left, insort
+
+import numpy as np
+
+from ledger import to_datetime64
+from recurring import normalize_description
+
+# A prefix union is built with a row mask once its posting lists hold more
+# than 1/UNION_MASK_RATIO of all rows, and by sorting below that
+UNION_MASK_RATIO = 16
+
+
+def tokenize(text):
+    """Return the distinct words of a description or query, in order."""
+    return list(dict.fromkeys(normalize_description(text).split()))
+
+
+def contains_sorted(haystack, needles):
+    """Return a mask of which `needles` occur in the sorted array `haystack`."""
+    if len(haystack) == 0:
+        return np.zeros(len(needles), dtype=bool)
+    positions = np.minimum(np.searchsorted(haystack, needles), len(haystack) - 1)
+    return haystack[positions] == needles
+
+
+class DescriptionIndex:
+    """Incrementally maintained inverted index of the descriptions in a TransactionLedger."""
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.rows_seen = 0
+        self.generation = 0
+        self._postings = {}
+        self._words = []
+        # Posting lists converted to arrays, dropped when the word gets new rows
+        self._arrays = {}
+
+    def reset(self):
+        self.rows_seen = 0
+        self._postings.clear()
+        self._words.clear()
+        self._arrays.clear()
+
+    def sync(self):
+        """Index the rows appended to the ledger since the last call."""
+        ledger = self.ledger
+        if self.generation != ledger.generation:
+            # The ledger was cleared; start over
+            self.reset()
+            self.generation = ledger.generation
+        if self.rows_seen == len(ledger):
+            return
+
+        start = self.rows_seen
+        # Imports repeat the same payees, so each description is tokenized once
+        tokens = {}
+        for row, description in enumerate(ledger.column("description", start), start):
+            if description not in tokens:
+                tokens[description] = tokenize(description)
+            for word in tokens[description]:
+                postings = self._postings.get(word)
+                if postings is None:
+                    postings = self._postings[word] = []
+                    insort(self._words, word)
+                postings.append(row)
+                self._arrays.pop(word, None)
+        self.rows_seen = len(ledger)
+
+    def _rows(self, word):
+        rows = self._arrays.get(word)
+        if rows is None:
+            rows = self._arrays[word] = np.array(self._postings[word], dtype=np.int64)
+        return rows
+
+    def prefix_rows(self, prefix):
+        """Return the sorted rows containing a word that starts with `prefix`."""
+        lo = bisect_left(self._words, prefix)
+        hi = bisect_left(self._words, prefix + "\uffff", lo)
+        if hi - lo == 1:
+            return self._rows(self._words[lo])
+        if hi == lo:
+            return np.empty(0, dtype=np.int64)
+
+        postings = [self._rows(word) for word in self._words[lo:hi]]
+        if sum(len(rows) for rows in postings) * UNION_MASK_RATIO < self.rows_seen:
+            return np.unique(np.concatenate(postings))
+        # Short prefixes can match most rows; marking them is cheaper than sorting
+        matched = np.zeros(self.rows_seen, dtype=bool)
+        for rows in postings:
+            matched[rows] = True
+        return np.flatnonzero(matched)
+
+    def search(self, query):
+        """
+        Return the sorted rows matching every word of `query` as a prefix, or
+        None when the query is blank (no text filter). A query of nothing but
+        digits and punctuation, which normalize away, matches no rows.
+        """
+        if not query or not query.strip():
+            return None
+        words = tokenize(query)
+        if not words:
+            return np.empty(0, dtype=np.int64)
+
+        matches = sorted((self.prefix_rows(word) for word in words), key=len)
+        rows = matches[0]
+        for other in matches[1:]:
+            if len(rows) == 0:
+                break
+            rows = rows[contains_sorted(other, rows)]
+        return rows
+
+    def filter(self, query, start, end, categories=None):
+        """
+        Return the rows dated from start to end (inclusive) that match
+        `query` and, when given, belong to one of `categories`, in date order.
+        """
+        ledger = self.ledger
+        rows = ledger.rows_between(start, end)
+
+        matches = self.search(query)
+        if matches is not None and len(matches) < len(rows):
+            # Few matches: check their dates rather than scanning the whole range
+            dates = ledger.values_at("date", matches)
+            in_range = (dates >= to_datetime64(start)) & (dates <= to_datetime64(end))
+            matches, dates = matches[in_range], dates[in_range]
+            rows = matches[np.argsort(dates, kind="stable")]
+        elif matches is not None:
+            rows = rows[contains_sorted(matches, rows)]
+
+        if categories is not None:
+            codes = [ledger.categories.index(c) for c in categories if c in ledger.categories]
+            rows = rows[np.isin(ledger.values_at("category", rows), codes)]
+        return rows
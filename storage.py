@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""Persistent SQLite storage for users, transactions, goals, categorization rules
+and round-up sweeps.
+
+Connections are opened once per process and handed out from a small pool,
+so a Streamlit rerun never pays connection setup. The database runs in WAL
+mode so readers do not block the writer. All SQL lives in module constants,
+which lets sqlite3's per-connection statement cache reuse the prepared
+statements across calls.
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from ledger import to_cents
+
+DB_PATH = 'startive.db'
+
+# Maximum number of idle connections kept by the pool
+POOL_SIZE = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    risk_preference TEXT NOT NULL DEFAULT 'moderate',
+    subscription TEXT NOT NULL DEFAULT 'Basic',
+    balance_cents INTEGER NOT NULL DEFAULT 0,
+    savings_cents INTEGER NOT NULL DEFAULT 0,
+    investments_cents INTEGER NOT NULL DEFAULT 0,
+    roundups_cents INTEGER NOT NULL DEFAULT 0,
+    first_login INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    type TEXT NOT NULL,
+    external_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date);
+
+CREATE TABLE IF NOT EXISTS goals (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    target_cents INTEGER NOT NULL,
+    current_cents INTEGER NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_goals_user ON goals (user_id, position);
+
+CREATE TABLE IF NOT EXISTS category_rules (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    pattern TEXT NOT NULL,
+    kind TEXT NOT NULL DEFAULT 'contains',
+    min_cents INTEGER,
+    max_cents INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_category_rules_user ON category_rules (user_id, position);
+
+CREATE TABLE IF NOT EXISTS pending_roundups (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    amount_cents INTEGER NOT NULL,
+    oldest_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sweeps (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    amount_cents INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    transfer_key TEXT,
+    created_at TEXT NOT NULL,
+    completed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sweeps_status ON sweeps (status, user_id);
+"""
+
+# Columns added after a table was first created; applied once to older databases
+MIGRATIONS = [
+    "ALTER TABLE sweeps ADD COLUMN transfer_key TEXT",
+    "ALTER TABLE transactions ADD COLUMN external_id TEXT",
+    # Bank transactions are stored once per user, however many sessions import them
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_external ON transactions (user_id, external_id)",
+]
+
+SELECT_USER = "SELECT * FROM users WHERE username = ?"
+INSERT_USER = "INSERT INTO users (username) VALUES (?)"
+SELECT_RISK = "SELECT risk_preference FROM users WHERE id = ?"
+UPDATE_RISK = "UPDATE users SET risk_preference = ? WHERE id = ?"
+UPDATE_USER_STATE = """
+UPDATE users
+SET subscription = ?, balance_cents = ?, savings_cents = ?, investments_cents = ?,
+    roundups_cents = ?, first_login = ?
+WHERE id = ?
+"""
+DELETE_USER = "DELETE FROM users WHERE id = ?"
+
+INSERT_TRANSACTION = """
+INSERT INTO transactions (user_id, date, category, amount_cents, description, type)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+SELECT_TRANSACTIONS = """
+SELECT date, category, amount_cents, description, type
+FROM transactions WHERE user_id = ? ORDER BY date, id
+"""
+INSERT_BANK_TRANSACTION = """
+INSERT OR IGNORE INTO transactions (user_id, date, category, amount_cents, description, type, external_id)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+SELECT_EXTERNAL_IDS = "SELECT external_id FROM transactions WHERE user_id = ? AND external_id IS NOT NULL"
+DELETE_TRANSACTIONS = "DELETE FROM transactions WHERE user_id = ?"
+SELECT_LABELED_DESCRIPTIONS = "SELECT description, category FROM transactions WHERE description <> ''"
+
+INSERT_GOAL = """
+INSERT INTO goals (user_id, position, name, target_cents, current_cents, date)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+SELECT_GOALS = "SELECT name, target_cents, current_cents, date FROM goals WHERE user_id = ? ORDER BY position"
+DELETE_GOALS = "DELETE FROM goals WHERE user_id = ?"
+
+INSERT_CATEGORY_RULE = """
+INSERT INTO category_rules (user_id, position, category, pattern, kind, min_cents, max_cents)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+SELECT_CATEGORY_RULES = """
+SELECT category, pattern, kind, min_cents, max_cents
+FROM category_rules WHERE user_id = ? ORDER BY position
+"""
+DELETE_CATEGORY_RULES = "DELETE FROM category_rules WHERE user_id = ?"
+
+UPSERT_PENDING_ROUNDUP = """
+INSERT INTO pending_roundups (user_id, amount_cents, oldest_at) VALUES (?, ?, ?)
+ON CONFLICT (user_id) DO UPDATE SET amount_cents = amount_cents + excluded.amount_cents
+"""
+SELECT_PENDING_ROUNDUP = "SELECT amount_cents FROM pending_roundups WHERE user_id = ?"
+SELECT_DUE_ROUNDUPS = """
+SELECT user_id, amount_cents FROM pending_roundups
+WHERE amount_cents > 0 AND (amount_cents >= ? OR oldest_at <= ?)
+"""
+DELETE_PENDING_ROUNDUP = "DELETE FROM pending_roundups WHERE user_id = ?"
+INSERT_SWEEP = "INSERT INTO sweeps (user_id, amount_cents, created_at) VALUES (?, ?, ?)"
+CLAIM_QUEUED_SWEEPS = "UPDATE sweeps SET status = 'in_flight', transfer_key = ? WHERE status = 'queued'"
+SELECT_IN_FLIGHT_SWEEPS = """
+SELECT id, user_id, amount_cents, transfer_key FROM sweeps WHERE status = 'in_flight' ORDER BY id
+"""
+COMPLETE_SWEEPS = "UPDATE sweeps SET status = 'done', completed_at = ? WHERE transfer_key = ? AND status = 'in_flight'"
+SELECT_DONE_SWEEPS_TOTAL = "SELECT COALESCE(SUM(amount_cents), 0) FROM sweeps WHERE user_id = ? AND status = 'done'"
+CREDIT_DONE_SWEEPS = "UPDATE sweeps SET status = 'credited' WHERE user_id = ? AND status = 'done'"
+ADD_SAVINGS = "UPDATE users SET savings_cents = savings_cents + ? WHERE id = ?"
+# Sweeps in flight may already have reached the bank, so the sweeper still completes them
+DELETE_SETTLED_SWEEPS = "DELETE FROM sweeps WHERE user_id = ? AND status <> 'in_flight'"
+
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections shared by all sessions of a process."""
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        with self._lock:
+            if not self._schema_ready:
+                conn.executescript(SCHEMA)
+                for migration in MIGRATIONS:
+                    try:
+                        conn.execute(migration)
+                    except sqlite3.OperationalError:
+                        # Already applied
+                        pass
+                conn.commit()
+                self._schema_ready = True
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commits on success and rolls back on error."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def _iso_date(date):
+    return date if isinstance(date, str) else date.strftime("%Y-%m-%d")
+
+
+def get_or_create_user(username):
+    """Return the stored user row as a dictionary, creating it on first login."""
+    with get_pool().connection() as conn:
+        row = conn.execute(SELECT_USER, (username,)).fetchone()
+        if row is None:
+            conn.execute(INSERT_USER, (username,))
+            row = conn.execute(SELECT_USER, (username,)).fetchone()
+    return dict(row)
+
+
+def get_user_risk_preference(user_id):
+    with get_pool().connection() as conn:
+        row = conn.execute(SELECT_RISK, (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def update_risk_preference(user_id, risk_preference):
+    with get_pool().connection() as conn:
+        conn.execute(UPDATE_RISK, (risk_preference, user_id))
+
+
+def save_user_state(user_id, subscription, balance, savings, investments, roundups, first_login):
+    """Persist the scalar account values of a user."""
+    with get_pool().connection() as conn:
+        conn.execute(UPDATE_USER_STATE, (
+            subscription,
+            to_cents(balance),
+            to_cents(savings),
+            to_cents(investments),
+            to_cents(roundups),
+            int(first_login),
+            user_id
+        ))
+
+
+def save_transaction(user_id, date, category, amount, description, tx_type):
+    """Insert a single transaction; `amount` is in euros."""
+    with get_pool().connection() as conn:
+        conn.execute(INSERT_TRANSACTION, (user_id, _iso_date(date), category, to_cents(amount), description, tx_type))
+
+
+def save_transactions(user_id, transactions):
+    """Insert many transaction dictionaries in one database transaction."""
+    rows = [
+        (user_id, _iso_date(t["date"]), t["category"], to_cents(t["amount"]), t.get("description", ""), t["type"])
+        for t in transactions
+    ]
+    with get_pool().connection() as conn:
+        conn.executemany(INSERT_TRANSACTION, rows)
+
+
+def save_bank_transactions(user_id, transactions):
+    """
+    Insert imported bank transaction dictionaries, identified by their `id`.
+    Transactions already stored for the user are skipped.
+    """
+    rows = [
+        (user_id, _iso_date(t["date"]), t["category"], to_cents(t["amount"]), t.get("description", ""), t["type"], t["id"])
+        for t in transactions
+    ]
+    with get_pool().connection() as conn:
+        conn.executemany(INSERT_BANK_TRANSACTION, rows)
+
+
+def load_bank_transaction_ids(user_id):
+    """Return the set of bank transaction ids already imported for a user."""
+    with get_pool().connection() as conn:
+        rows = conn.execute(SELECT_EXTERNAL_IDS, (user_id,)).fetchall()
+    return {row[0] for row in rows}
+
+
+def load_transactions(user_id):
+    """Return all transactions of a user in date order, amounts in euros."""
+    with get_pool().connection() as conn:
+        rows = conn.execute(SELECT_TRANSACTIONS, (user_id,)).fetchall()
+    return [
+        {
+            "date": row["date"],
+            "category": row["category"],
+            "amount": row["amount_cents"] / 100,
+            "description": row["description"],
+            "type": row["type"]
+        }
+        for row in rows
+    ]
+
+
+def load_labeled_descriptions():
+    """Return (description, category) pairs of every user's described transactions, for training."""
+    with get_pool().connection() as conn:
+        rows = conn.execute(SELECT_LABELED_DESCRIPTIONS).fetchall()
+    return [(row["description"], row["category"]) for row in rows]
+
+
+def save_goals(user_id, goals):
+    """Replace the stored goals of a user with `goals`."""
+    rows = [
+        (user_id, position, goal["name"], to_cents(goal["target"]), to_cents(goal["current"]), goal["date"])
+        for position, goal in enumerate(goals)
+    ]
+    with get_pool().connection() as conn:
+        conn.execute(DELETE_GOALS, (user_id,))
+        conn.executemany(INSERT_GOAL, rows)
+
+
+def load_goals(user_id):
+    with get_pool().connection() as conn:
+        rows = conn.execute(SELECT_GOALS, (user_id,)).fetchall()
+    return [
+        {
+            "name": row["name"],
+            "target": row["target_cents"] / 100,
+            "current": row["current_cents"] / 100,
+            "date": row["date"]
+        }
+        for row in rows
+    ]
+
+
+def _optional_cents(amount):
+    return None if amount is None else to_cents(amount)
+
+
+def save_category_rules(user_id, rules):
+    """Replace the stored categorization rules of a user with `rules`, keeping their order."""
+    rows = [
+        (
+            user_id,
+            position,
+            rule["category"],
+            rule["pattern"],
+            rule.get("kind", "contains"),
+            _optional_cents(rule.get("min_amount")),
+            _optional_cents(rule.get("max_amount"))
+        )
+        for position, rule in enumerate(rules)
+    ]
+    with get_pool().connection() as conn:
+        conn.execute(DELETE_CATEGORY_RULES, (user_id,))
+        conn.executemany(INSERT_CATEGORY_RULE, rows)
+
+
+def load_category_rules(user_id):
+    with get_pool().connection() as conn:
+        rows = conn.execute(SELECT_CATEGORY_RULES, (user_id,)).fetchall()
+    return [
+        {
+            "category": row["category"],
+            "pattern": row["pattern"],
+            "kind": row["kind"],
+            "min_amount": None if row["min_cents"] is None else row["min_cents"] / 100,
+            "max_amount": None if row["max_cents"] is None else row["max_cents"] / 100
+        }
+        for row in rows
+    ]
+
+
+def delete_user_data(user_id):
+    """
+    Remove the transactions, goals, categorization rules and round-ups of a
+    user but keep the account.
+    """
+    with get_pool().connection() as conn:
+        conn.execute(DELETE_TRANSACTIONS, (user_id,))
+        conn.execute(DELETE_GOALS, (user_id,))
+        conn.execute(DELETE_CATEGORY_RULES, (user_id,))
+        conn.execute(DELETE_PENDING_ROUNDUP, (user_id,))
+        conn.execute(DELETE_SETTLED_SWEEPS, (user_id,))
+
+
+def delete_user(user_id):
+    """Remove a user and, through cascading deletes, all of their data."""
+    with get_pool().connection() as conn:
+        conn.execute(DELETE_USER, (user_id,))
+
+
+def add_pending_roundup(user_id, amount_cents, now):
+    """Add round-up cents to a user's pending balance."""
+    with get_pool().connection() as conn:
+        conn.execute(UPSERT_PENDING_ROUNDUP, (user_id, amount_cents, now))
+
+
+def get_pending_roundup(user_id):
+    """Return the round-up cents of a user that have not been swept yet."""
+    with get_pool().connection() as conn:
+        row = conn.execute(SELECT_PENDING_ROUNDUP, (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def queue_due_sweeps(threshold_cents, cutoff, now):
+    """
+    Move every pending balance that reached `threshold_cents`, or whose oldest
+    round-up is from `cutoff` or earlier, into the sweep queue.
+    Returns the number of sweeps queued.
+    """
+    with get_pool().connection() as conn:
+        # Take the write lock before reading, so a round-up accrued meanwhile
+        # cannot be deleted without being queued
+        conn.execute("BEGIN IMMEDIATE")
+        due = conn.execute(SELECT_DUE_ROUNDUPS, (threshold_cents, cutoff)).fetchall()
+        conn.executemany(INSERT_SWEEP, [(row["user_id"], row["amount_cents"], now) for row in due])
+        conn.executemany(DELETE_PENDING_ROUNDUP, [(row["user_id"],) for row in due])
+    return len(due)
+
+
+def claim_queued_sweeps(transfer_key):
+    """Mark every queued sweep as in flight under `transfer_key`; returns how many were claimed."""
+    with get_pool().connection() as conn:
+        return conn.execute(CLAIM_QUEUED_SWEEPS, (transfer_key,)).rowcount
+
+
+def load_in_flight_sweeps():
+    """Return the sweeps claimed for a transfer that has not completed, oldest first."""
+    with get_pool().connection() as conn:
+        rows = conn.execute(SELECT_IN_FLIGHT_SWEEPS).fetchall()
+    return [dict(row) for row in rows]
+
+
+def complete_sweeps(transfer_key, now):
+    """Mark the sweeps of a transfer as done."""
+    with get_pool().connection() as conn:
+        conn.execute(COMPLETE_SWEEPS, (now, transfer_key))
+
+
+def credit_swept_roundups(user_id):
+    """
+    Add a user's transferred but not yet credited sweeps to their stored
+    savings, in one database transaction. Returns the cents credited.
+    """
+    with get_pool().connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cents = conn.execute(SELECT_DONE_SWEEPS_TOTAL, (user_id,)).fetchone()[0]
+        if cents:
+            conn.execute(CREDIT_DONE_SWEEPS, (user_id,))
+            conn.execute(ADD_SAVINGS, (cents, user_id))
+    return cents
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Batched sweeps of accumulated round-ups into savings.
+
+Round-ups are added to a per-user pending balance in storage as they occur.
+A sweep moves a pending balance into savings once it reaches a threshold
+or has been waiting for a full interval. A scheduled job, not the app,
+runs the sweeps of all users at once:
+
+    python sweeps.py
+
+Due balances are first written to a persistent queue. The queue is then
+claimed under a fresh idempotency key and sent upstream in a single batched
+transfer carrying that key. If the process dies after the transfer but
+before the sweeps are marked done, the next run finds them still in flight
+and retries the transfer with the same key, which the bank applies only
+once. Completed sweeps are credited to the users' stored savings the next
+time each user's session loads them.
+"""
+
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+import storage
+
+# Pending round-ups are swept once they reach this amount...
+SWEEP_THRESHOLD_CENTS = 500
+
+# ...or once the oldest of them has waited this long
+SWEEP_INTERVAL = timedelta(days=7)
+
+
+def _timestamp(moment):
+    return moment.isoformat(timespec="seconds")
+
+
+def transfer_to_savings(transfers, transfer_key):
+    """
+    Moves round-up sweeps into the users' savings accounts in a single batched request.
+    `transfers` is a list of {"user_id", "amount_cents"} dictionaries; the bank
+    ignores a repeated request with the same `transfer_key`.
+    """
+    # In a real implementation, this would call the bank's transfer API once for the whole batch
+    total_cents = sum(transfer["amount_cents"] for transfer in transfers)
+    print(f"Transferring €{total_cents / 100:.2f} of round-ups for {len(transfers)} users ({transfer_key})")
+
+
+class RoundupSweeper:
+    """Accrues round-ups and sweeps them into savings in batched transfers.
+
+    `transfer` is called with a list of {"user_id", "amount_cents"}
+    dictionaries and an idempotency key, and must move all of them in one
+    upstream call.
+    """
+
+    def __init__(self, transfer=transfer_to_savings, threshold_cents=SWEEP_THRESHOLD_CENTS, interval=SWEEP_INTERVAL):
+        self.transfer = transfer
+        self.threshold_cents = threshold_cents
+        self.interval = interval
+
+    def accrue(self, user_id, amount_cents, now=None):
+        """Add round-up cents to the user's pending balance."""
+        if amount_cents <= 0:
+            return
+        now = now or datetime.now()
+        storage.add_pending_roundup(user_id, int(amount_cents), _timestamp(now))
+
+    def pending(self, user_id):
+        """Return the user's round-up cents waiting for the next sweep."""
+        return storage.get_pending_roundup(user_id)
+
+    def run(self, now=None):
+        """
+        Queue every user's due balance and transfer the queue in one call.
+        Transfers left in flight by an interrupted run are retried first,
+        with their original key. Returns the completed sweeps; sweeps whose
+        transfer fails stay in flight for the next run.
+        """
+        now = now or datetime.now()
+        storage.queue_due_sweeps(self.threshold_cents, _timestamp(now - self.interval), _timestamp(now))
+        storage.claim_queued_sweeps(uuid.uuid4().hex)
+
+        batches = {}
+        for sweep in storage.load_in_flight_sweeps():
+            batches.setdefault(sweep["transfer_key"], []).append(sweep)
+
+        completed = []
+        for transfer_key, sweeps in batches.items():
+            # One transfer per user, even if earlier runs left several sweeps
+            totals = {}
+            for sweep in sweeps:
+                totals[sweep["user_id"]] = totals.get(sweep["user_id"], 0) + sweep["amount_cents"]
+
+            self.transfer([{"user_id": user_id, "amount_cents": cents} for user_id, cents in totals.items()], transfer_key)
+            storage.complete_sweeps(transfer_key, _timestamp(now))
+            completed.extend(sweeps)
+        return completed
+
+
+def main():
+    swept = RoundupSweeper().run()
+    print(f"Completed {len(swept)} sweeps")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())